@@ -1,17 +1,25 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy import func, extract
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 from typing import Optional, List
-from database import engine, Base, get_db
+from database import engine, Base, SessionLocal, get_db
 import models, schemas, auth
 from datetime import datetime, timezone, timedelta
 import services
 import audit, automation
-from fastapi.responses import Response
+import simulation
+import hierarchy
+from fastapi.responses import Response, StreamingResponse, FileResponse
 import reports
+import report_jobs
+import report_cache
+import scheduler
+import os
 import secrets
 import uuid
+from contextlib import asynccontextmanager
 
 # Create all tables - this will handle new columns/enums automatically
 # Note: For enum changes, existing databases may need manual update
@@ -22,7 +30,26 @@ except Exception as e:
     # Log but don't fail - tables might already exist
     print(f"Note: Database initialization: {e}")
 
-app = FastAPI(title="KPIs Tracker")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Ancestry checks read the closure table and scores read the rollups only;
+    # build either one if this database predates it
+    db = SessionLocal()
+    try:
+        hierarchy.ensure_closure(db)
+        services.ensure_score_rollups(db)
+    finally:
+        db.close()
+    # Every worker runs the scheduler loop; DB leases decide which one runs each job
+    scheduler.start()
+    yield
+    # Shutdown: stop background executors and drain queued audit events
+    scheduler.shutdown()
+    auth.password_pool.shutdown()
+    report_jobs.shutdown()
+    audit.writer.shutdown()
+
+app = FastAPI(title="KPIs Tracker", lifespan=lifespan)
 from fastapi.middleware.cors import CORSMiddleware
 
 app.add_middleware(
@@ -50,16 +77,14 @@ def bootstrap_system(db: Session = Depends(get_db)):
     for perm in models.PermissionType:
         new_p = models.RolePermission(role_id=admin_role.id, permission_name=perm.value)
         db.add(new_p)
+    auth.permission_cache.bump(db)
     db.commit()
     return {"message": "Admin role and permissions created successfully!"}
 
 # Permission Helper
 def check_permission(required_perm: models.PermissionType):
     def permission_checker(current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-        has_perm = db.query(models.RolePermission).filter(
-            models.RolePermission.role_id == current_user.role_id,
-            models.RolePermission.permission_name == required_perm.value
-        ).first()
+        has_perm = required_perm.value in auth.permission_cache.permissions_for(db, current_user.role_id)
         if not has_perm:
             raise HTTPException(status_code=403, detail="Forbidden")
         return current_user
@@ -67,17 +92,38 @@ def check_permission(required_perm: models.PermissionType):
 
 
 @app.post("/token", response_model=schemas.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.password_hash):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    # Async so bcrypt is awaited instead of parking a threadpool thread;
+    # the (sync) database work still runs in the threadpool
+    def load_user():
+        user = db.query(models.User).filter(models.User.email == form_data.username).first()
+        password_hash = user.password_hash if user else None
+        # End the read transaction so no pooled DB connection is held during bcrypt
+        db.rollback()
+        return user, password_hash
+
+    user, password_hash = await run_in_threadpool(load_user)
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    access_token = auth.create_access_token(data={"sub": user.email})
-    audit.log_action(
-        db, user_id=user.id, action=models.ActionType.LOGIN, 
-        entity=models.EntityType.USER, entity_id=user.id, 
-        description="User logged in successfully"
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    valid, new_hash = await auth.verify_and_update_password_async(form_data.password, password_hash)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    def issue_token():
+        if new_hash:
+            # Stored hash predates the current cost policy: upgrade it now
+            user.password_hash = new_hash
+            db.commit()
+        access_token = auth.create_user_token(db, user)
+        auth.user_cache.put(user)
+        audit.log_action(
+            db, user_id=user.id, action=models.ActionType.LOGIN,
+            entity=models.EntityType.USER, entity_id=user.id,
+            description="User logged in successfully"
+        )
+        return access_token
+
+    return {"access_token": await run_in_threadpool(issue_token), "token_type": "bearer"}
 
 @app.post("/users/", response_model=schemas.UserResponse)
 def create_user(
@@ -98,6 +144,9 @@ def create_user(
         role_id=user.role_id
     )
     db.add(new_user)
+    db.flush()
+    hierarchy.add_user_node(db, new_user.id)
+    report_cache.bump_data_version(db)
     db.commit()
     db.refresh(new_user)
     return new_user
@@ -123,18 +172,14 @@ def check_circular_reference(db: Session, user_id: int, proposed_manager_id: int
     if user_id == proposed_manager_id:
         raise HTTPException(status_code=400, detail="User cannot manage themselves.")
     
-    current_m_id = proposed_manager_id
-    while current_m_id is not None:
-        if current_m_id == user_id:
-            raise HTTPException(status_code=400, detail="Circular reporting detected.")
-        
-        # Move up the chain
-        manager = db.query(models.User).filter(models.User.id == current_m_id).first()
-        current_m_id = manager.manager_id if manager else None
+    # Single closure-table lookup instead of walking up the chain
+    if hierarchy.would_create_cycle(db, user_id, proposed_manager_id):
+        raise HTTPException(status_code=400, detail="Circular reporting detected.")
 
 @app.get("/users/{user_id}/team", response_model=schemas.TeamMemberOut)
 def get_user_team(
     user_id: int, 
+    depth: Optional[int] = Query(None, ge=1, le=hierarchy.MAX_TREE_DEPTH),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
@@ -142,7 +187,9 @@ def get_user_team(
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    # One recursive query for the whole tree instead of a lazy load per node
+    rows = hierarchy.load_subtree(db, user_id, max_depth=depth)
+    return hierarchy.build_team_tree(user, rows)
 
 @app.put("/users/{user_id}/manager")
 def update_manager(
@@ -159,10 +206,58 @@ def update_manager(
         check_circular_reference(db, user_id, manager_id)
         
     db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
     db_user.manager_id = manager_id
+    hierarchy.move_subtree(db, user_id, manager_id)
+    report_cache.bump_data_version(db)
     db.commit()
+    auth.user_cache.invalidate([user_id])
     return {"message": "Hierarchy updated successfully"}
 
+@app.post("/users/reorg")
+def bulk_reorg(
+    request: schemas.BulkReorgRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Move many users to new managers in one transaction, rejecting any move set that forms a cycle."""
+    if current_user.role_id != 1: # Admin only
+        raise HTTPException(status_code=403, detail="Only admins can change hierarchy")
+
+    try:
+        changed = hierarchy.apply_reorg(db, [(m.user_id, m.manager_id) for m in request.moves])
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    report_cache.bump_data_version(db)
+    db.commit()
+    auth.user_cache.invalidate([u for u, _old, _new in changed])
+
+    if changed:
+        by_manager = {}
+        for _user_id, _old, manager_id in changed:
+            by_manager[str(manager_id)] = by_manager.get(str(manager_id), 0) + 1
+        audit.log_action(
+            db, user_id=current_user.id, action=models.ActionType.UPDATE,
+            entity=models.EntityType.USER,
+            description=f"Bulk reorg: {len(changed)} users moved",
+            meta={
+                "moved": len(changed),
+                "requested": len(request.moves),
+                "moves_per_new_manager": by_manager,
+                "sample": [
+                    {"user_id": u, "from": old, "to": new} for u, old, new in changed[:100]
+                ]
+            }
+        )
+
+    return {
+        "message": "Hierarchy updated successfully",
+        "requested": len(request.moves),
+        "moved": len(changed)
+    }
+
 @app.post("/kpis/", response_model=schemas.KPIOut)
 def create_kpi(
     kpi: schemas.KPICreate, 
@@ -193,8 +288,14 @@ def create_kpi(
         kpi_data = kpi.dict()
     db_kpi = models.KPI(**kpi_data)
     db.add(db_kpi)
+    # A new KPI changes the weighting for everyone in its role
+    automation.mark_dirty(
+        db, select(models.User.id).where(models.User.role_id == db_kpi.role_id), automation.evaluated_periods(db)
+    )
+    report_cache.bump_data_version(db)
     db.commit()
     db.refresh(db_kpi)
+    services.invalidate_role_scores(db, db_kpi.role_id)
     
     # Audit Log (Passive)
     # log_action(db, current_user.id, "KPI_CREATED", f"Created KPI {db_kpi.id}")
@@ -225,8 +326,11 @@ def create_kpi_override(
 
     if existing:
         existing.custom_target_value = override.custom_target_value
+        automation.mark_dirty(db, [override.user_id], automation.evaluated_periods(db))
+        report_cache.bump_data_version(db)
         db.commit()
         db.refresh(existing)
+        services.invalidate_user_scores([override.user_id])
         return existing
 
     # 3. Create new override
@@ -237,8 +341,11 @@ def create_kpi_override(
         override_data = override.dict()
     db_override = models.KPIOverride(**override_data)
     db.add(db_override)
+    automation.mark_dirty(db, [db_override.user_id], automation.evaluated_periods(db))
+    report_cache.bump_data_version(db)
     db.commit()
     db.refresh(db_override)
+    services.invalidate_user_scores([db_override.user_id])
     return db_override
 
 @app.post("/achievements/", response_model=schemas.AchievementOut)
@@ -276,6 +383,7 @@ def log_achievement(
     )
     
     db.add(db_achievement)
+    report_cache.bump_data_version(db)
     db.commit()
     db.refresh(db_achievement)
     audit.log_action(
@@ -311,16 +419,36 @@ def verify_achievement(
     if not (is_admin or is_manager):
         raise HTTPException(status_code=403, detail="Only managers or admins can verify achievements")
 
-    # 4. Apply Changes
-    achievement.status = data.status
-    achievement.verifier_id = current_user.id
-    achievement.verified_at = datetime.now(timezone.utc)    
+    # 4. Apply Changes: conditional on the row still being PENDING, so two
+    # concurrent verifications cannot both pass step 2 and both count it
+    changes = {
+        models.Achievement.status: data.status,
+        models.Achievement.verifier_id: current_user.id,
+        models.Achievement.verified_at: datetime.now(timezone.utc),
+    }
     if data.status == models.AchievementStatus.REJECTED:
         if not data.rejection_reason:
             raise HTTPException(status_code=400, detail="Rejection reason required")
-        achievement.rejection_reason = data.rejection_reason
-
+        changes[models.Achievement.rejection_reason] = data.rejection_reason
+    transitioned = db.query(models.Achievement).filter(
+        models.Achievement.id == achievement_id,
+        models.Achievement.status == models.AchievementStatus.PENDING
+    ).update(changes, synchronize_session="evaluate")
+    if transitioned != 1:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Achievement was already verified or rejected")
+    if data.status == models.AchievementStatus.VERIFIED:
+        # Keep the monthly score rollup in the same transaction
+        services.apply_verified_achievement(db, achievement)
+        if achievement.achievement_date is not None:
+            automation.mark_dirty(db, [achievement.user_id], [achievement.achievement_date.strftime("%Y-%m")])
+
+    report_cache.bump_data_version(db)
     db.commit()
+    if data.status == models.AchievementStatus.VERIFIED and achievement.achievement_date:
+        services.invalidate_user_scores(
+            [achievement.user_id], achievement.achievement_date.month, achievement.achievement_date.year
+        )
     audit.log_action(
         db, 
         user_id=current_user.id, 
@@ -344,7 +472,8 @@ def get_user_monthly_score(
     is_owner = current_user.id == user_id
     
     user_to_check = db.query(models.User).filter(models.User.id == user_id).first()
-    is_manager = user_to_check.manager_id == current_user.id if user_to_check else False
+    # Any manager up the chain, not just the direct one
+    is_manager = hierarchy.is_descendant(db, current_user.id, user_id) if user_to_check else False
 
     if not (is_admin or is_owner or is_manager):
         raise HTTPException(status_code=403, detail="Not authorized to view this score")
@@ -356,6 +485,135 @@ def get_user_monthly_score(
         "total_weighted_score": score
     }
 
+PERIOD_PATTERN = r"^\d{4}-(0[1-9]|1[0-2])$"
+MAX_HISTORY_MONTHS = 60
+
+def resolve_period_range(from_period: Optional[str], to_period: Optional[str]):
+    """Defaults to the trailing 12 months ending with the current month."""
+    now = datetime.now(timezone.utc)
+    last = to_period or f"{now.year}-{now.month:02d}"
+    if from_period:
+        first = from_period
+    else:
+        year, month = (int(x) for x in last.split("-"))
+        first = f"{year - 1}-{month:02d}" if month == 12 else f"{year - 1}-{month + 1:02d}"
+    if first > last:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    if len(services.month_range(first, last)) > MAX_HISTORY_MONTHS:
+        raise HTTPException(status_code=400, detail=f"History is limited to {MAX_HISTORY_MONTHS} months")
+    return first, last
+
+@app.get("/users/{user_id}/score/history")
+def get_user_score_history(
+    user_id: int,
+    from_period: Optional[str] = Query(None, alias="from", pattern=PERIOD_PATTERN),
+    to_period: Optional[str] = Query(None, alias="to", pattern=PERIOD_PATTERN),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Monthly scores for a period range in one pass. Same visibility rules as /score."""
+    is_admin = current_user.role_id == 1
+    is_owner = current_user.id == user_id
+
+    user_to_check = db.query(models.User).filter(models.User.id == user_id).first()
+    if not user_to_check:
+        raise HTTPException(status_code=404, detail="User not found")
+    is_manager = hierarchy.is_descendant(db, current_user.id, user_id)
+
+    if not (is_admin or is_owner or is_manager):
+        raise HTTPException(status_code=403, detail="Not authorized to view this score")
+
+    first, last = resolve_period_range(from_period, to_period)
+    history = services.calculate_score_history(db, [user_id], first, last)
+    return {
+        "user_id": user_id,
+        "from": first,
+        "to": last,
+        "history": [
+            {"period": h["period"], "total_weighted_score": h["score"]}
+            for h in history.get(user_id, [])
+        ]
+    }
+
+@app.get("/dashboard/score/history")
+def get_group_score_history(
+    scope: str = "team", # "team" (direct reports) or "org" (admin only)
+    from_period: Optional[str] = Query(None, alias="from", pattern=PERIOD_PATTERN),
+    to_period: Optional[str] = Query(None, alias="to", pattern=PERIOD_PATTERN),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Per-month aggregate scores for the caller's team or the whole org."""
+    if scope == "org":
+        if current_user.role_id != 1:
+            raise HTTPException(status_code=403, detail="Admin access required")
+        members = db.query(models.User).all()
+    elif scope == "team":
+        members = db.query(models.User).filter(models.User.manager_id == current_user.id).all()
+    else:
+        raise HTTPException(status_code=400, detail="scope must be 'team' or 'org'")
+
+    first, last = resolve_period_range(from_period, to_period)
+    history = services.calculate_score_history(db, [m.id for m in members], first, last)
+
+    periods = []
+    for i, period in enumerate(services.month_range(first, last)):
+        scores = [series[i]["score"] for series in history.values()]
+        periods.append({"period": period, **services.score_summary(scores)})
+
+    response = {"scope": scope, "from": first, "to": last, "periods": periods}
+    if scope == "team":
+        response["members"] = [{
+            "user_id": m.id,
+            "full_name": m.full_name,
+            "history": [
+                {"period": h["period"], "total_weighted_score": h["score"]}
+                for h in history.get(m.id, [])
+            ]
+        } for m in members]
+    return response
+
+@app.post("/admin/evaluate")
+def run_batch_evaluation(
+    request: schemas.EvaluationRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.check_permission(models.PermissionType.SYSTEM_CONFIG))
+):
+    """Senior Logic: Month-end close - evaluate a whole period (optionally one role) in one pass."""
+    if current_user.role_id != 1:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    now = datetime.now(timezone.utc)
+    result = automation.evaluate_period(
+        db, request.month or now.month, request.year or now.year,
+        role_id=request.role_id, workers=request.workers
+    )
+
+    audit.log_action(
+        db, user_id=current_user.id, action=models.ActionType.CREATE,
+        entity=models.EntityType.USER,
+        description=f"Evaluated {result['evaluated']} users for {result['period']}: "
+                    f"{result['created']} created, {result['updated']} updated, {result['removed']} removed"
+    )
+    return result
+
+@app.post("/admin/reevaluate")
+def run_dirty_reevaluation(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.check_permission(models.PermissionType.SYSTEM_CONFIG))
+):
+    """Senior Logic: Refresh only recommendations made stale by late verifications, overrides or KPI changes."""
+    if current_user.role_id != 1:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    result = automation.reevaluate_dirty(db)
+    audit.log_action(
+        db, user_id=current_user.id, action=models.ActionType.UPDATE,
+        entity=models.EntityType.USER,
+        description=f"Re-evaluated {result['users']} flagged users: {result['changed']} changed recommendation"
+    )
+    return result
+
 @app.post("/admin/evaluate/{user_id}")
 def run_evaluation(
     user_id: int,
@@ -382,17 +640,226 @@ def run_evaluation(
     
     return recommendation
 
+@app.post("/admin/simulate")
+def simulate_scoring_changes(
+    request: schemas.SimulationRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.check_permission(models.PermissionType.SYSTEM_CONFIG))
+):
+    """Senior Logic: What-if preview of target/weightage/override changes. Read-only."""
+    if current_user.role_id != 1:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    now = datetime.now(timezone.utc)
+    month = request.month or now.month
+    year = request.year or now.year
+
+    arrays = simulation.load_period_arrays(db, month, year, role_id=request.role_id)
+    try:
+        result = simulation.run_simulation(
+            arrays,
+            automation.rule_cache.get(db),
+            kpi_changes=[(c.kpi_id, c.target_value, c.weightage) for c in request.kpi_changes],
+            overrides=[(o.user_id, o.kpi_id, o.custom_target_value) for o in request.overrides],
+            max_changed_users=request.max_changed_users
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    result["period"] = f"{year}-{month:02d}"
+    return result
+
+@app.get("/admin/score-cache")
+def get_score_cache_stats(
+    current_user: models.User = Depends(auth.check_permission(models.PermissionType.SYSTEM_CONFIG))
+):
+    """Hit/miss counters and size of this worker's score cache."""
+    if current_user.role_id != 1:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return services.score_cache.stats()
+
+@app.get("/admin/score-rules")
+def get_score_rules(
+    role_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.check_permission(models.PermissionType.SYSTEM_CONFIG))
+):
+    """Stored recommendation rules, optionally for one role (role_id NULL rows are the fallback set)."""
+    if current_user.role_id != 1:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    query = db.query(models.ScoreBandRule)
+    if role_id is not None:
+        query = query.filter(models.ScoreBandRule.role_id == role_id)
+    rules = query.order_by(
+        models.ScoreBandRule.role_id, models.ScoreBandRule.consecutive_periods > 1,
+        models.ScoreBandRule.position, models.ScoreBandRule.min_score
+    ).all()
+    has_fallback = db.query(models.ScoreBandRule.id).filter(models.ScoreBandRule.role_id.is_(None)).first()
+    return {
+        "rules": rules,
+        "builtin_fallback": None if has_fallback else [
+            {"min_score": r.min_score, "recommendation": r.recommendation} for r in automation.DEFAULT_RULES
+        ],
+    }
+
+@app.put("/admin/score-rules")
+def replace_score_rules(
+    request: schemas.ScoreRuleSet,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.check_permission(models.PermissionType.SYSTEM_CONFIG))
+):
+    """Senior Logic: Replaces one role's rule set (an empty list falls back to the shared set)."""
+    if current_user.role_id != 1:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if request.role_id is not None and not db.query(models.Role).filter(models.Role.id == request.role_id).first():
+        raise HTTPException(status_code=404, detail="Role not found")
+
+    band_floors = set()
+    for rule in request.rules:
+        if rule.min_score is not None and rule.max_score is not None and rule.min_score >= rule.max_score:
+            raise HTTPException(status_code=400, detail="min_score must be below max_score")
+        if rule.consecutive_periods == 1:
+            if rule.max_score is not None:
+                raise HTTPException(status_code=400, detail="Score bands only take min_score; use consecutive_periods > 1 for ranges")
+            if rule.min_score in band_floors:
+                raise HTTPException(status_code=400, detail=f"Two score bands start at {rule.min_score}")
+            band_floors.add(rule.min_score)
+
+    db.query(models.ScoreBandRule).filter(
+        models.ScoreBandRule.role_id.is_(None) if request.role_id is None
+        else models.ScoreBandRule.role_id == request.role_id
+    ).delete(synchronize_session=False)
+    for position, rule in enumerate(request.rules):
+        db.add(models.ScoreBandRule(
+            role_id=request.role_id, min_score=rule.min_score, max_score=rule.max_score,
+            consecutive_periods=rule.consecutive_periods, recommendation=rule.recommendation,
+            position=position
+        ))
+    # Same transaction: every worker recompiles on its next evaluation, and
+    # cached exports (whose PDF summary counts recommendations) are replaced
+    automation.rule_cache.bump(db)
+    report_cache.bump_data_version(db)
+    db.commit()
+
+    scope = "the fallback set" if request.role_id is None else f"role {request.role_id}"
+    audit.log_action(
+        db, user_id=current_user.id, action=models.ActionType.UPDATE,
+        entity=models.EntityType.USER,
+        description=f"Replaced score rules for {scope}: {len(request.rules)} rule(s)"
+    )
+    return {"status": "updated", "role_id": request.role_id, "rules": len(request.rules)}
+
+@app.get("/admin/scheduler")
+def get_scheduler_status(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.check_permission(models.PermissionType.SYSTEM_CONFIG))
+):
+    """Scheduled jobs with their next fire time, current lease holder and recent runs."""
+    if current_user.role_id != 1:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return {"enabled": scheduler.SCHEDULER_ENABLED, "jobs": scheduler.job_status(db)}
+
+@app.post("/admin/scheduler/{job_name}/run", status_code=202)
+def trigger_scheduled_job(
+    job_name: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.check_permission(models.PermissionType.SYSTEM_CONFIG))
+):
+    """Makes a job due now; whichever worker ticks next runs it."""
+    if current_user.role_id != 1:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if job_name not in scheduler.JOBS:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    scheduler.scheduler.sync_jobs(db)
+    scheduler.trigger(db, job_name)
+    audit.log_action(
+        db, user_id=current_user.id, action=models.ActionType.UPDATE,
+        entity=models.EntityType.USER, description=f"Triggered scheduled job {job_name}"
+    )
+    return {"status": "queued", "job": job_name}
+
 @app.get("/admin/recommendations")
 def get_all_recommendations(
+    period: Optional[str] = Query(None, pattern=PERIOD_PATTERN),
+    recommendation: Optional[models.RecommendationType] = None,
+    user_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=automation.RECOMMENDATION_PAGE_MAX),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.check_permission(models.PermissionType.SYSTEM_CONFIG))
 
 ):
-    """View all automated performance flags."""
+    """View automated performance flags, newest period first. Pass `next_cursor` back as `cursor` for the next page."""
+    if current_user.role_id != 1:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    try:
+        rows, next_cursor = automation.query_recommendations(
+            db, period=period, recommendation=recommendation, user_id=user_id, cursor=cursor, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "items": [{
+            "id": rec.id,
+            "user_id": rec.user_id,
+            "user_name": full_name,
+            "score_achieved": rec.score_achieved,
+            "recommendation": rec.recommendation,
+            "period": rec.period,
+            "created_at": rec.created_at,
+        } for rec, full_name in rows],
+        "next_cursor": next_cursor,
+        "limit": limit
+    }
+
+@app.get("/audit")
+def list_audit_logs(
+    user_id: Optional[int] = None,
+    action_type: Optional[models.ActionType] = None,
+    entity_type: Optional[models.EntityType] = None,
+    entity_id: Optional[int] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=audit.AUDIT_PAGE_MAX),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.check_permission(models.PermissionType.SYSTEM_CONFIG))
+):
+    """Senior Logic: Filtered audit trail, newest first. Pass `next_cursor` back as `cursor` for the next page."""
     if current_user.role_id != 1:
         raise HTTPException(status_code=403, detail="Admin access required")
-    
-    return db.query(models.AutomationRule).all()
+
+    try:
+        rows, next_cursor = audit.query_logs(
+            db, user_id=user_id, action=action_type, entity=entity_type, entity_id=entity_id,
+            start=start, end=end, cursor=cursor, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    actor_ids = {r.user_id for r in rows if r.user_id is not None}
+    names = dict(
+        db.query(models.User.id, models.User.full_name).filter(models.User.id.in_(actor_ids)).all()
+    ) if actor_ids else {}
+
+    return {
+        "items": [{
+            "id": r.id,
+            "created_at": r.created_at,
+            "user_id": r.user_id,
+            "user_name": names.get(r.user_id),
+            "action_type": r.action_type,
+            "entity_type": r.entity_type,
+            "entity_id": r.entity_id,
+            "description": r.description,
+            "metadata": r.metadata_json,
+        } for r in rows],
+        "next_cursor": next_cursor,
+        "limit": limit
+    }
 
 @app.get("/users/me", response_model=schemas.User)
 def get_current_user_profile(current_user: models.User = Depends(auth.get_current_user)):
@@ -401,7 +868,12 @@ def get_current_user_profile(current_user: models.User = Depends(auth.get_curren
 
 @app.get("/reports/export")
 def export_report(
-    format: str = "excel", # or "pdf"
+    request: Request,
+    format: str = "excel", # excel, pdf, csv, ndjson or parquet
+    dataset: str = "scores", # scores, breakdown or achievements (csv/ndjson/parquet only)
+    fields: Optional[str] = None, # comma-separated column projection (csv/ndjson/parquet only)
+    from_period: Optional[str] = Query(None, alias="from", pattern=PERIOD_PATTERN),
+    to_period: Optional[str] = Query(None, alias="to", pattern=PERIOD_PATTERN),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
@@ -409,42 +881,132 @@ def export_report(
     if current_user.role_id != 1:
         raise HTTPException(status_code=403, detail="Admin access required")
 
-    # 1. Gather Data (Similar to Dashboard logic)
-    all_users = db.query(models.User).all()
-    report_data = []
     now = datetime.now(timezone.utc)
-
-    for user in all_users:
-        score = services.calculate_user_kpi_score(db, user.id, now.month, now.year)
-        report_data.append({
-            "user_id": user.id,
-            "full_name": user.full_name,
-            "score": score,
-            "period": f"{now.year}-{now.month}"
-        })
-
-    # 2. Generate File
-    if format == "excel":
-        file_content = reports.generate_excel_report(report_data)
-        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        filename = "kpi_report.xlsx"
+    last = to_period or from_period or f"{now.year}-{now.month:02d}"
+    first = from_period or last
+    if first > last:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    periods = services.month_range(first, last)
+    if len(periods) > MAX_HISTORY_MONTHS:
+        raise HTTPException(status_code=400, detail=f"Exports are limited to {MAX_HISTORY_MONTHS} months")
+
+    if format in ("excel", "pdf"):
+        if len(periods) > 1:
+            raise HTTPException(status_code=400, detail="Excel and PDF reports cover a single period")
+        year, month = (int(x) for x in last.split("-"))
+    elif format in reports.EXPORT_MEDIA_TYPES:
+        try:
+            columns = reports.resolve_fields(dataset, fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if format == "parquet" and not reports.parquet_available():
+            raise HTTPException(status_code=400, detail="Parquet export requires the pyarrow package")
     else:
-        file_content = reports.generate_pdf_report(report_data)
-        media_type = "application/pdf"
-        filename = "kpi_report.pdf"
+        raise HTTPException(status_code=400, detail="format must be one of: excel, pdf, csv, ndjson, parquet")
 
-    # 3. Audit the Export
+    if format in ("excel", "pdf"):
+        media_type, extension = report_jobs.FORMATS[format][1], report_jobs.FORMATS[format][0]
+        filename, key = f"kpi_report{extension}", {"format": format, "period": last}
+    else:
+        media_type, extension = reports.EXPORT_MEDIA_TYPES[format]
+        suffix = first if first == last else f"{first}_{last}"
+        filename = f"kpi_{dataset}_{suffix}{extension}"
+        key = {"format": format, "dataset": dataset, "from": first, "to": last, "fields": columns}
+
+    # 1. Conditional request: an unchanged data version means the client's copy is current
+    version, last_modified = report_cache.data_version(db)
+    cached = report_cache.CachedReport(version, last_modified, extension, **key)
+    if cached.not_modified(request.headers.get("if-none-match"), request.headers.get("if-modified-since")):
+        return Response(status_code=304, headers=cached.headers)
+    headers = {**cached.headers, "Content-Disposition": f"attachment; filename={filename}"}
+
+    # 2. Audit the Export
     audit.log_action(
         db, user_id=current_user.id, action=models.ActionType.CREATE,
         entity=models.EntityType.USER, description=f"Exported {format} report"
     )
 
-    return Response(
-        content=file_content,
-        media_type=media_type,
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    # 3. Same request at the same data version: serve the stored file
+    if cached.exists():
+        return FileResponse(cached.path, media_type=media_type, headers=headers)
+
+    # 4. Excel streams straight from a server-side cursor, so memory stays flat with org size
+    if format == "excel":
+        body = reports.stream_excel_report(reports.score_rows(month, year))
+    # 5. PDF with per-KPI breakdowns for every user
+    elif format == "pdf":
+        rules, roles = reports.recommendation_rules()
+        file_content = reports.generate_pdf_report(reports.breakdown_rows(month, year), last, rules, roles)
+        return Response(content=cached.store(file_content), media_type=media_type, headers=headers)
+    # 6. Machine-readable dumps, streamed chunk by chunk
+    else:
+        rows = reports.dataset_rows(dataset, periods, columns)
+        if format == "csv":
+            body = reports.stream_csv(columns, rows)
+        elif format == "ndjson":
+            body = reports.stream_ndjson(columns, rows)
+        else:
+            body = reports.stream_parquet(dataset, columns, rows)
+    return StreamingResponse(cached.tee(body), media_type=media_type, headers=headers)
+
+@app.post("/reports/jobs", status_code=202)
+def create_report_job(
+    request: schemas.ReportJobRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Senior Logic: Queues an export to render in the background. Poll GET /reports/jobs/{id}."""
+    if current_user.role_id != 1:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    now = datetime.now(timezone.utc)
+    report_jobs.purge_expired(db)
+    job, created = report_jobs.submit_job(
+        db, request.format, request.month or now.month, request.year or now.year, current_user.id
     )
 
+    if created:
+        audit.log_action(
+            db, user_id=current_user.id, action=models.ActionType.CREATE,
+            entity=models.EntityType.USER, description=f"Queued {request.format} report for {job.period}",
+            meta={"job_id": job.id}
+        )
+    return {**report_jobs.job_status(job), "coalesced": not created}
+
+@app.get("/reports/jobs/{job_id}")
+def get_report_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    if current_user.role_id != 1:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    job = db.get(models.ReportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return report_jobs.job_status(job)
+
+@app.get("/reports/jobs/{job_id}/file")
+def download_report_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    if current_user.role_id != 1:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    job = db.get(models.ReportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    if job.status != models.ReportJobStatus.DONE:
+        raise HTTPException(status_code=409, detail=f"Report is {job.status.value}")
+    if report_jobs.is_expired(job) or not os.path.exists(job.artifact_path):
+        raise HTTPException(status_code=410, detail="Report has expired; queue a new job")
+
+    extension, media_type = report_jobs.FORMATS[job.format]
+    return FileResponse(job.artifact_path, media_type=media_type, filename=f"kpi_report_{job.period}{extension}")
+
 @app.get("/roles")
 def get_roles(db: Session = Depends(get_db)):
     return db.query(models.Role).all()
@@ -490,7 +1052,8 @@ def update_role_permissions(
             permission_name=perm
         ))
         
-
+    # Same transaction: every worker's permission cache sees the new version
+    auth.permission_cache.bump(db)
     db.commit()
     return {"status": "updated"}
 
@@ -544,6 +1107,7 @@ def reset_password(request: schemas.ResetPasswordRequest, db: Session = Depends(
     user.password_hash = auth.get_password_hash(request.new_password)
     token_record.used = True
     db.commit()
+    auth.user_cache.invalidate([user.id])
     
     audit.log_action(
         db, user_id=user.id, action=models.ActionType.UPDATE,
@@ -554,24 +1118,33 @@ def reset_password(request: schemas.ResetPasswordRequest, db: Session = Depends(
     return {"message": "Password reset successfully"}
 
 @app.post("/auth/change-password")
-def change_password(
+async def change_password(
     request: schemas.ChangePasswordRequest,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     """Change password for logged-in user"""
-    if not auth.verify_password(request.current_password, current_user.password_hash):
+    # Always the stored hash, never one a cached user object carried in
+    def stored_hash():
+        db.refresh(current_user, ["password_hash"])
+        return current_user.password_hash
+
+    password_hash = await run_in_threadpool(stored_hash)
+    if not await auth.verify_password_async(request.current_password, password_hash):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
-    
-    current_user.password_hash = auth.get_password_hash(request.new_password)
-    db.commit()
-    
-    audit.log_action(
-        db, user_id=current_user.id, action=models.ActionType.UPDATE,
-        entity=models.EntityType.USER, entity_id=current_user.id,
-        description="Password changed"
-    )
-    
+    new_hash = await auth.get_password_hash_async(request.new_password)
+
+    def save():
+        current_user.password_hash = new_hash
+        db.commit()
+        auth.user_cache.invalidate([current_user.id])
+        audit.log_action(
+            db, user_id=current_user.id, action=models.ActionType.UPDATE,
+            entity=models.EntityType.USER, entity_id=current_user.id,
+            description="Password changed"
+        )
+
+    await run_in_threadpool(save)
     return {"message": "Password changed successfully"}
 
 # ==================== DASHBOARD ENDPOINTS ====================
@@ -598,17 +1171,23 @@ def admin_dashboard(
     else:
         users = db.query(models.User).all()
     
+    user_ids = [u.id for u in users]
+    scores = services.calculate_scores_bulk(db, user_ids, filter_month, filter_year)
+
+    # Get achievements for all displayed users/period at once
+    period_start, period_end = services.period_bounds(filter_month, filter_year)
+    achievements_by_user = {uid: [] for uid in user_ids}
+    for chunk in services._chunks(user_ids):
+        period_achievements = db.query(models.Achievement).filter(
+            models.Achievement.user_id.in_(chunk),
+            models.Achievement.achievement_date >= period_start,
+            models.Achievement.achievement_date < period_end
+        ).order_by(models.Achievement.id).all()
+        for a in period_achievements:
+            achievements_by_user[a.user_id].append(a)
+
     dashboard_data = []
     for user in users:
-        score = services.calculate_user_kpi_score(db, user.id, filter_month, filter_year)
-        
-        # Get achievements for this user/period
-        achievements = db.query(models.Achievement).filter(
-            models.Achievement.user_id == user.id,
-            extract('month', models.Achievement.achievement_date) == filter_month,
-            extract('year', models.Achievement.achievement_date) == filter_year
-        ).all()
-        
         achievement_list = [{
             "id": a.id,
             "kpi_id": a.kpi_id,
@@ -616,13 +1195,13 @@ def admin_dashboard(
             "status": a.status.value,
             "description": a.description,
             "achievement_date": a.achievement_date.isoformat() if a.achievement_date else None
-        } for a in achievements]
+        } for a in achievements_by_user[user.id]]
         
         dashboard_data.append({
             "user_id": user.id,
             "full_name": user.full_name,
             "email": user.email,
-            "total_weighted_score": score,
+            "total_weighted_score": scores[user.id],
             "period": f"{filter_year}-{filter_month:02d}",
             "achievements": achievement_list
         })
@@ -637,30 +1216,47 @@ def admin_dashboard(
 def manager_dashboard(
     month: Optional[int] = None,
     year: Optional[int] = None,
+    depth: Optional[int] = Query(None, ge=1, le=hierarchy.MAX_TREE_DEPTH),
+    threshold: Optional[float] = None,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=500),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    """Manager dashboard - own + team performance"""
+    """Manager dashboard - own + team performance, plus whole-subtree rollup"""
     now = datetime.now(timezone.utc)
     filter_month = month or now.month
     filter_year = year or now.year
     
-    # Get manager's own score
-    own_score = services.calculate_user_kpi_score(db, current_user.id, filter_month, filter_year)
+    # Whole reporting tree (optionally depth-limited) in one recursive query
+    subtree = hierarchy.load_subtree(db, current_user.id, max_depth=depth)
     
     # Get team members (direct subordinates)
-    team_members = db.query(models.User).filter(
-        models.User.manager_id == current_user.id
-    ).all()
+    team_members = [member for member, member_depth in subtree if member_depth == 1]
+    
+    # Score manager + everyone below in one bulk pass
+    scores = services.calculate_scores_bulk(
+        db, [current_user.id] + [m.id for m, _ in subtree], filter_month, filter_year
+    )
+    own_score = scores[current_user.id]
+    
+    # Without an explicit threshold, "below" means in the bottom band of the member's own role rules
+    if threshold is None:
+        rules = automation.rule_cache.get(db)
+        subtree_summary = services.score_summary(
+            [scores[m.id] for m, _ in subtree], thresholds=[rules.for_role(m.role_id).floor for m, _ in subtree]
+        )
+    else:
+        subtree_summary = services.score_summary([scores[m.id] for m, _ in subtree], threshold)
+    page_rows = subtree[(page - 1) * page_size:page * page_size]
     
     team_data = []
     for member in team_members:
-        score = services.calculate_user_kpi_score(db, member.id, filter_month, filter_year)
         team_data.append({
             "user_id": member.id,
             "full_name": member.full_name,
             "email": member.email,
-            "total_weighted_score": score,
+            "total_weighted_score": scores[member.id],
             "period": f"{filter_year}-{filter_month:02d}"
         })
     
@@ -673,6 +1269,20 @@ def manager_dashboard(
             "period": f"{filter_year}-{filter_month:02d}"
         },
         "team": team_data,
+        "subtree": {
+            **subtree_summary,
+            "depth_limit": depth,
+            "page": page,
+            "page_size": page_size,
+            "members": [{
+                "user_id": member.id,
+                "full_name": member.full_name,
+                "email": member.email,
+                "manager_id": member.manager_id,
+                "depth": member_depth,
+                "total_weighted_score": scores[member.id]
+            } for member, member_depth in page_rows]
+        },
         "period": f"{filter_year}-{filter_month:02d}"
     }
 
@@ -694,10 +1304,11 @@ def sdr_dashboard(
     role_kpis = db.query(models.KPI).filter(models.KPI.role_id == current_user.role_id).all()
     
     # Get achievements
+    period_start, period_end = services.period_bounds(filter_month, filter_year)
     achievements = db.query(models.Achievement).filter(
         models.Achievement.user_id == current_user.id,
-        extract('month', models.Achievement.achievement_date) == filter_month,
-        extract('year', models.Achievement.achievement_date) == filter_year
+        models.Achievement.achievement_date >= period_start,
+        models.Achievement.achievement_date < period_end
     ).all()
     
     kpi_details = []
@@ -1,29 +1,336 @@
+from sqlalchemy import insert, tuple_
 from sqlalchemy.orm import Session
 import models
+import audit_archive
+from database import engine
 from datetime import datetime, timezone
+import atexit
+import base64
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+# "async": events are queued and written in batches by a background thread.
+# "sync": strict mode for tests/scripts, written and committed inline, errors raise.
+AUDIT_MODE = os.environ.get("AUDIT_MODE", "async").lower()
+AUDIT_QUEUE_SIZE = int(os.environ.get("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.environ.get("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get("AUDIT_FLUSH_INTERVAL", "1.0"))
+AUDIT_SPILL_PATH = os.environ.get("AUDIT_SPILL_PATH", "audit_spill.ndjson")
+
+logger = logging.getLogger(__name__)
 
 def log_action(
-    db: Session, 
-    user_id: int, 
-    action: models.ActionType, 
-    entity: models.EntityType, 
-    entity_id: int = None, 
+    db: Session,
+    user_id: int,
+    action: models.ActionType,
+    entity: models.EntityType,
+    entity_id: int = None,
     description: str = "",
     meta: dict = None
 ):
     """Senior Utility: Passive, write-only logging."""
+    event = {
+        "user_id": user_id,
+        "action_type": action,
+        "entity_type": entity,
+        "entity_id": entity_id,
+        "description": description,
+        "metadata_json": meta,
+        "created_at": datetime.now(timezone.utc),
+    }
+    if AUDIT_MODE == "sync":
+        try:
+            db.add(models.AuditLog(**event))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return
+    writer.enqueue(event)
+
+# ==================== BATCHED WRITER ====================
+
+def _to_json(event: dict) -> str:
+    return json.dumps({
+        **event,
+        "action_type": event["action_type"].value,
+        "entity_type": event["entity_type"].value,
+        "created_at": event["created_at"].isoformat(),
+    }, default=str)
+
+def _from_json(line: str) -> dict:
+    event = json.loads(line)
+    event["action_type"] = models.ActionType(event["action_type"])
+    event["entity_type"] = models.EntityType(event["entity_type"])
+    event["created_at"] = datetime.fromisoformat(event["created_at"])
+    return event
+
+class AuditWriter:
+    """
+    Bounded queue drained by one background thread that writes multi-row
+    INSERTs every `batch_size` events or `flush_interval` seconds, whichever
+    comes first. Events that do not fit in the queue, or whose batch fails
+    to insert, are appended to an NDJSON spill file and replayed on the next
+    start. Requests never wait on the audit table.
+
+    Each process spills to its own file (spill_path.<pid>) so workers never
+    interleave writes; a replay takes its own file plus those left by
+    processes that are no longer running.
+    """
+
+    def __init__(self, queue_size: int, batch_size: int, flush_interval: float, spill_path: str):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.written = 0
+        self.spilled = 0
+        self.failures = 0 # Batches or replays that hit a database error
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def enqueue(self, event: dict):
+        self.start()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._spill([event])
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Blocks until everything queued before the call is written (or spilled)."""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def shutdown(self, timeout: float = 10.0):
+        """Drains the queue and stops the writer thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "mode": AUDIT_MODE,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "spilled": self.spilled,
+            "failures": self.failures,
+        }
+
+    def _run(self):
+        self.replay_spill()
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = False # Timer expired
+
+            if isinstance(item, dict):
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            # Size reached, timer expired, flush marker or shutdown
+            self._write(batch)
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                # Shutdown: write whatever is still queued
+                rest = []
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, dict):
+                        rest.append(item)
+                    elif isinstance(item, threading.Event):
+                        item.set()
+                for i in range(0, len(rest), self.batch_size):
+                    self._write(rest[i:i + self.batch_size])
+                return
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(models.AuditLog.__table__).values(batch))
+            self.written += len(batch)
+        except Exception:
+            # Never let audit failures reach the request; the events are kept on disk
+            self.failures += 1
+            logger.exception("Audit batch of %d event(s) failed, spilling to %s", len(batch), self._own_spill_path())
+            self._spill(batch)
+
+    def _own_spill_path(self):
+        return f"{self.spill_path}.{os.getpid()}"
+
+    def _spill(self, events):
+        with self._spill_lock:
+            with open(self._own_spill_path(), "a", encoding="utf-8") as f:
+                for event in events:
+                    f.write(_to_json(event) + "\n")
+            self.spilled += len(events)
+
+    def _claimable(self, path: str) -> bool:
+        """Our own spill file, one from a process that has exited, or the shared file of older versions."""
+        suffix = path[len(self.spill_path):]
+        if suffix == "":
+            return True
+        owner = suffix.lstrip(".").split(".")[0]
+        if not owner.isdigit():
+            return False
+        return int(owner) == os.getpid() or not _process_alive(int(owner))
+
+    def replay_spill(self):
+        """Re-inserts spilled events; a file whose insert fails is kept (moved to our own spill file)."""
+        replayed = 0
+        for path in sorted(glob.glob(f"{glob.escape(self.spill_path)}*")):
+            if path.endswith(".tmp") or not self._claimable(path):
+                continue
+            # Renaming claims the file: of two workers replaying the same orphan only one succeeds
+            replaying = f"{self._own_spill_path()}.replaying.{os.path.basename(path)}"
+            try:
+                with self._spill_lock:
+                    os.replace(path, replaying)
+            except FileNotFoundError:
+                continue
+            with open(replaying, encoding="utf-8") as f:
+                events = [_from_json(line) for line in f if line.strip()]
+            try:
+                with engine.begin() as conn:
+                    for i in range(0, len(events), self.batch_size):
+                        conn.execute(insert(models.AuditLog.__table__).values(events[i:i + self.batch_size]))
+            except Exception:
+                self.failures += 1
+                logger.exception("Audit spill replay of %s failed, keeping %d event(s)", path, len(events))
+                with self._spill_lock:
+                    with open(self._own_spill_path(), "a", encoding="utf-8") as out, open(replaying, encoding="utf-8") as f:
+                        out.write(f.read())
+                os.remove(replaying)
+                continue
+            os.remove(replaying)
+            self.written += len(events)
+            replayed += len(events)
+        return replayed
+
+def _process_alive(pid: int) -> bool:
     try:
-        new_log = models.AuditLog(
-            user_id=user_id,
-            action_type=action,
-            entity_type=entity,
-            entity_id=entity_id,
-            description=description,
-            metadata_json=meta
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True # Exists, owned by someone else
+    return True
+
+writer = AuditWriter(
+    queue_size=AUDIT_QUEUE_SIZE,
+    batch_size=AUDIT_BATCH_SIZE,
+    flush_interval=AUDIT_FLUSH_INTERVAL,
+    spill_path=AUDIT_SPILL_PATH,
+)
+
+# ==================== QUERY ====================
+
+AUDIT_PAGE_MAX = 500
+
+def encode_cursor(created_at: datetime, log_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), log_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    """Returns (created_at, id); raises ValueError for anything that is not one of our cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, log_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(log_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def query_logs(
+    db: Session,
+    user_id: int = None,
+    action: models.ActionType = None,
+    entity: models.EntityType = None,
+    entity_id: int = None,
+    start: datetime = None,
+    end: datetime = None,
+    cursor: str = None,
+    limit: int = 50
+):
+    """
+    One page of audit entries, newest first, ordered by (created_at, id).
+    Pages continue from the last row seen instead of using OFFSET, so every
+    page costs the same regardless of how deep the caller has scrolled.
+    Time range is [start, end). Rows already moved to the archive by the
+    retention job are merged in transparently. Returns (rows, next_cursor or None).
+    """
+    Log = models.AuditLog
+    query = db.query(Log)
+    if user_id is not None:
+        query = query.filter(Log.user_id == user_id)
+    if action is not None:
+        query = query.filter(Log.action_type == action)
+    if entity is not None:
+        query = query.filter(Log.entity_type == entity)
+    if entity_id is not None:
+        query = query.filter(Log.entity_id == entity_id)
+    if start is not None:
+        query = query.filter(Log.created_at >= start)
+    if end is not None:
+        query = query.filter(Log.created_at < end)
+    before = None
+    if cursor:
+        before = decode_cursor(cursor)
+        query = query.filter(tuple_(Log.created_at, Log.id) < tuple_(*before))
+
+    limit = max(1, min(limit, AUDIT_PAGE_MAX))
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(Log.created_at.desc(), Log.id.desc()).limit(limit + 1).all()
+
+    # A full hot page only needs the archive when archived rows can sort
+    # between its rows, i.e. retention has not yet run past them
+    archived = None
+    if len(rows) <= limit or audit_archive.has_rows_after((rows[-1].created_at, rows[-1].id)):
+        archived = audit_archive.read_archived(
+            user_id=user_id, action=action, entity=entity, entity_id=entity_id,
+            start=start, end=end, before=before, limit=limit + 1
         )
-        db.add(new_log)
-        db.commit() # We commit immediately to ensure the log is saved
-    except Exception as e:
-        # In production, we log this to a file so the main app doesn't crash
-        print(f"Audit Log Failed: {e}")
-        db.rollback()
\ No newline at end of file
+    if archived:
+        # A crash mid-retention can leave a row in both places; the hot copy wins
+        hot_ids = {r.id for r in rows}
+        rows = sorted(
+            rows + [r for r in archived if r.id not in hot_ids],
+            key=lambda r: (r.created_at, r.id), reverse=True
+        )[:limit + 1]
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
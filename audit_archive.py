@@ -0,0 +1,263 @@
+from sqlalchemy import select, delete
+from database import engine
+from datetime import datetime, timezone, timedelta
+import models
+from collections import OrderedDict
+import gzip
+import json
+import os
+import threading
+import time
+
+# Audit rows older than the retention window are moved out of the hot table
+# into gzip NDJSON files under AUDIT_ARCHIVE_DIR/<YYYY-MM>/. Each archive
+# batch becomes one file, and manifest.json records every file's period,
+# row count and (created_at, id) key range so readers only open files that
+# can contain rows for the requested page.
+AUDIT_ARCHIVE_DIR = os.environ.get("AUDIT_ARCHIVE_DIR", "audit_archive")
+AUDIT_RETENTION_DAYS = int(os.environ.get("AUDIT_RETENTION_DAYS", "180"))
+AUDIT_ARCHIVE_BATCH_SIZE = int(os.environ.get("AUDIT_ARCHIVE_BATCH_SIZE", "5000"))
+# Decoded archive files kept in memory; files never change once written, so
+# "load more" over archived months does not re-inflate the same file per page.
+AUDIT_ARCHIVE_CACHE_FILES = int(os.environ.get("AUDIT_ARCHIVE_CACHE_FILES", "8"))
+
+MANIFEST_NAME = "manifest.json"
+
+Log = models.AuditLog.__table__
+
+def _manifest_path(archive_dir: str):
+    return os.path.join(archive_dir, MANIFEST_NAME)
+
+def _naive_utc(value: datetime):
+    """Stored timestamps are naive UTC; make query bounds comparable with them."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+# ==================== MANIFEST ====================
+
+_manifest_cache = {}
+_manifest_lock = threading.Lock()
+
+def load_manifest(archive_dir: str = None):
+    """Manifest dict ({"files": [...]}) re-read only when the file changes on disk."""
+    path = _manifest_path(archive_dir or AUDIT_ARCHIVE_DIR)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {"files": []}
+    with _manifest_lock:
+        cached = _manifest_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        _manifest_cache[path] = (mtime, manifest)
+        return manifest
+
+def _save_manifest(archive_dir: str, manifest: dict):
+    path = _manifest_path(archive_dir)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+# ==================== ARCHIVING ====================
+
+def _row_to_record(row):
+    return {
+        "id": row.id,
+        "user_id": row.user_id,
+        "action_type": row.action_type.value,
+        "entity_type": row.entity_type.value,
+        "entity_id": row.entity_id,
+        "description": row.description,
+        "metadata_json": row.metadata_json,
+        "created_at": row.created_at.isoformat(),
+    }
+
+def _write_partition_file(archive_dir: str, period: str, records):
+    """Writes one gzip NDJSON file atomically and returns its manifest entry."""
+    folder = os.path.join(archive_dir, period)
+    os.makedirs(folder, exist_ok=True)
+    name = f"audit-{period}-{records[0]['id']}-{time.time_ns()}.ndjson.gz"
+    path = os.path.join(folder, name)
+    tmp = f"{path}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, default=str) + "\n")
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return {
+        "path": f"{period}/{name}",
+        "period": period,
+        "rows": len(records),
+        "first": [records[0]["created_at"], records[0]["id"]],
+        "last": [records[-1]["created_at"], records[-1]["id"]],
+        "archived_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+def archive_old_logs(days: int = None, batch_size: int = None, archive_dir: str = None):
+    """
+    Moves audit rows created before now - days into month-partitioned archive
+    files, oldest first. Each batch is written to disk and recorded in the
+    manifest before the same ids are deleted in a short transaction, so a
+    crash can leave a row in both places (readers de-duplicate by id) but
+    never in neither. Returns {"rows": n, "files": n, "cutoff": iso}.
+    """
+    days = AUDIT_RETENTION_DAYS if days is None else days
+    batch_size = batch_size or AUDIT_ARCHIVE_BATCH_SIZE
+    archive_dir = archive_dir or AUDIT_ARCHIVE_DIR
+    cutoff = _naive_utc(datetime.now(timezone.utc) - timedelta(days=days))
+    os.makedirs(archive_dir, exist_ok=True)
+
+    manifest = load_manifest(archive_dir)
+    manifest = {**manifest, "files": list(manifest.get("files", []))}
+    moved = files = 0
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(
+                select(Log).where(Log.c.created_at < cutoff)
+                .order_by(Log.c.created_at, Log.c.id)
+                .limit(batch_size)
+            ).all()
+        if not rows:
+            break
+
+        by_period = {}
+        for row in rows:
+            by_period.setdefault(row.created_at.strftime("%Y-%m"), []).append(_row_to_record(row))
+        for period, records in by_period.items():
+            manifest["files"].append(_write_partition_file(archive_dir, period, records))
+            files += 1
+        _save_manifest(archive_dir, manifest)
+
+        with engine.begin() as conn:
+            conn.execute(delete(Log).where(Log.c.id.in_([row.id for row in rows])))
+        moved += len(rows)
+
+    return {"rows": moved, "files": files, "cutoff": cutoff.isoformat()}
+
+# ==================== READING ====================
+
+def _key(entry_key):
+    created_at, log_id = entry_key
+    return datetime.fromisoformat(created_at), log_id
+
+_file_cache = OrderedDict()
+_file_cache_lock = threading.Lock()
+
+def _read_file(path: str):
+    with _file_cache_lock:
+        if path in _file_cache:
+            _file_cache.move_to_end(path)
+            return _file_cache[path]
+    records = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            record["created_at"] = datetime.fromisoformat(record["created_at"])
+            records.append(record)
+    if AUDIT_ARCHIVE_CACHE_FILES > 0:
+        with _file_cache_lock:
+            _file_cache[path] = records
+            while len(_file_cache) > AUDIT_ARCHIVE_CACHE_FILES:
+                _file_cache.popitem(last=False)
+    return records
+
+def _record_matches(record, user_id, action, entity, entity_id, start, end, before):
+    if user_id is not None and record["user_id"] != user_id:
+        return False
+    if action is not None and record["action_type"] != action.value:
+        return False
+    if entity is not None and record["entity_type"] != entity.value:
+        return False
+    if entity_id is not None and record["entity_id"] != entity_id:
+        return False
+    created_at = record["created_at"]
+    if start is not None and created_at < start:
+        return False
+    if end is not None and created_at >= end:
+        return False
+    return before is None or (created_at, record["id"]) < before
+
+def _to_log(record):
+    return models.AuditLog(
+        id=record["id"],
+        user_id=record["user_id"],
+        action_type=models.ActionType(record["action_type"]),
+        entity_type=models.EntityType(record["entity_type"]),
+        entity_id=record["entity_id"],
+        description=record["description"],
+        metadata_json=record["metadata_json"],
+        created_at=record["created_at"],
+    )
+
+def has_rows_after(key, archive_dir: str = None) -> bool:
+    """Whether any archived row sorts after the (created_at, id) key; only the manifest is read."""
+    created_at, log_id = _naive_utc(key[0]), key[1]
+    return any(
+        _key(entry["last"]) > (created_at, log_id)
+        for entry in load_manifest(archive_dir or AUDIT_ARCHIVE_DIR).get("files", [])
+    )
+
+def read_archived(
+    user_id: int = None,
+    action: models.ActionType = None,
+    entity: models.EntityType = None,
+    entity_id: int = None,
+    start: datetime = None,
+    end: datetime = None,
+    before=None,
+    limit: int = 50,
+    archive_dir: str = None
+):
+    """
+    Newest-first archived rows matching the filters and strictly below the
+    `before` (created_at, id) key, as transient AuditLog objects. Files are
+    visited newest-first and reading stops as soon as no remaining file can
+    beat the rows already collected.
+    """
+    archive_dir = archive_dir or AUDIT_ARCHIVE_DIR
+    start, end = _naive_utc(start), _naive_utc(end)
+    if before is not None:
+        before = (_naive_utc(before[0]), before[1])
+
+    # Month partitions outside the window are skipped without parsing their keys
+    low = start.strftime("%Y-%m") if start is not None else None
+    high = [p for p in (
+        (end - timedelta(microseconds=1)).strftime("%Y-%m") if end is not None else None,
+        before[0].strftime("%Y-%m") if before is not None else None,
+    ) if p is not None]
+    high = min(high) if high else None
+
+    candidates = []
+    for entry in load_manifest(archive_dir).get("files", []):
+        period = entry.get("period")
+        if period and ((low and period < low) or (high and period > high)):
+            continue
+        first, last = _key(entry["first"]), _key(entry["last"])
+        if end is not None and first[0] >= end:
+            continue
+        if start is not None and last[0] < start:
+            continue
+        if before is not None and first >= before:
+            continue
+        candidates.append((last, entry))
+    candidates.sort(key=lambda c: c[0], reverse=True)
+
+    found = {}
+    for last, entry in candidates:
+        # `found` never holds more than `limit` rows, so its minimum is the cut-off
+        if len(found) >= limit and last < min(found):
+            break
+        for record in _read_file(os.path.join(archive_dir, entry["path"])):
+            if _record_matches(record, user_id, action, entity, entity_id, start, end, before):
+                found[(record["created_at"], record["id"])] = record
+        if len(found) > limit:
+            found = {k: found[k] for k in sorted(found, reverse=True)[:limit]}
+
+    return [_to_log(found[k]) for k in sorted(found, reverse=True)[:limit]]
@@ -1,11 +1,17 @@
+import asyncio
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
 import models, database
 from database import get_db
 
@@ -14,14 +20,100 @@ SECRET_KEY = os.environ.get("SECRET_KEY", "DEVELOPMENT_SECRET_KEY_CHANGE_ME")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor; hashes below it are upgraded on the next successful login
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=BCRYPT_ROUNDS
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# ==================== PASSWORD HASHING POOL ====================
+
+class PasswordPool:
+    """
+    Dedicated, bounded executor for bcrypt work so a login burst cannot take
+    over the request threadpool. At most `workers + max_queue` calls are
+    admitted at once; the rest are shed immediately with a 503.
+    workers=0 runs hashing inline on the calling thread (no limit).
+    """
+
+    def __init__(self, workers: int, max_queue: int, timeout: float):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.shed = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt") if workers else None
+        self._slots = threading.BoundedSemaphore(workers + max_queue) if workers else None
+
+    def _busy(self):
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.shed += 1
+            raise self._busy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _f: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        """Blocking form for sync handlers; holds the calling thread until the hash is done."""
+        if self._executor is None:
+            return fn(*args)
+        future = self._submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FuturesTimeout:
+            raise self._busy()
+
+    async def run_async(self, fn, *args):
+        """Awaitable form for async handlers: no request thread waits on bcrypt."""
+        if self._executor is None:
+            return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+        future = self._submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise self._busy()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+password_pool = PasswordPool(
+    workers=int(os.environ.get("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    max_queue=int(os.environ.get("PASSWORD_HASH_QUEUE", "16")),
+    timeout=float(os.environ.get("PASSWORD_HASH_TIMEOUT", "10")),
+)
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_pool.run(pwd_context.verify, plain_password, hashed_password)
+
+def verify_and_update_password(plain_password, hashed_password):
+    """Returns (is_valid, new_hash); new_hash is set when the stored hash is below the current policy."""
+    return password_pool.run(pwd_context.verify_and_update, plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_pool.run(pwd_context.hash, password)
+
+async def verify_password_async(plain_password, hashed_password):
+    return await password_pool.run_async(pwd_context.verify, plain_password, hashed_password)
+
+async def verify_and_update_password_async(plain_password, hashed_password):
+    return await password_pool.run_async(pwd_context.verify_and_update, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await password_pool.run_async(pwd_context.hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -29,6 +121,15 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def create_user_token(db: Session, user: models.User, expires_delta: Optional[timedelta] = None):
+    """Access token carrying the claims get_current_user needs to skip the user lookup."""
+    return create_access_token(data={
+        "sub": user.email,
+        "uid": user.id,
+        "rid": user.role_id,
+        "pv": permission_cache.current_version(db),
+    }, expires_delta=expires_delta)
+
 # THIS IS THE FUNCTION THE ERROR WAS ASKING FOR
 def get_current_user(db: Session = Depends(database.get_db), token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
@@ -43,24 +144,192 @@ def get_current_user(db: Session = Depends(database.get_db), token: str = Depend
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-        
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if user is None:
+
+    user_id = payload.get("uid")
+    token_version = payload.get("pv")
+    # A token minted after a permission change this worker has not seen yet
+    # forces a re-check; a token older than the current version is stale.
+    current_version = permission_cache.current_version(db, token_version)
+    fresh = user_id is not None and token_version == current_version
+
+    if fresh:
+        user = user_cache.attach(db, user_id)
+        if user is not None and user.email == email and user.role_id == payload.get("rid"):
+            return user
+        if user is not None:
+            db.expunge(user)
+
+    if user_id is not None:
+        user = db.query(models.User).filter(models.User.id == user_id).first()
+    else:
+        # Tokens issued before claims were added only carry the email
+        user = db.query(models.User).filter(models.User.email == email).first()
+    if user is None or user.email != email:
         raise credentials_exception
+    user_cache.put(user)
     return user
 
+# ==================== PERMISSION CACHE ====================
+
+PERMISSIONS_VERSION_KEY = "role_permissions"
+
+def read_version(db: Session, name: str) -> int:
+    row = db.query(models.CacheVersion.version).filter(models.CacheVersion.name == name).first()
+    return row[0] if row else 0
+
+def bump_version(db: Session, name: str):
+    """Increments a shared version counter. Does not commit, so it joins the caller's transaction."""
+    updated = db.query(models.CacheVersion).filter(models.CacheVersion.name == name).update(
+        {models.CacheVersion.version: models.CacheVersion.version + 1}, synchronize_session=False
+    )
+    if not updated:
+        db.add(models.CacheVersion(name=name, version=1))
+
+class PermissionCache:
+    """
+    Process-local role_id -> permission names map.
+
+    The shared version in cache_versions is re-read at most every
+    check_interval seconds (so other workers' edits show up within that
+    window); when it moved, the whole map is dropped and refilled lazily.
+    """
+
+    def __init__(self, check_interval: float = 5.0, enabled: bool = True):
+        self.check_interval = check_interval
+        self.enabled = enabled
+        self.version = None
+        self._checked_at = 0.0
+        self._roles = {}
+        self._lock = threading.Lock()
+
+    def _sync(self, db: Session):
+        now = time.monotonic()
+        if self.version is not None and now - self._checked_at < self.check_interval:
+            return
+        version = read_version(db, PERMISSIONS_VERSION_KEY)
+        with self._lock:
+            if version != self.version:
+                self._roles = {}
+                self.version = version
+            self._checked_at = now
+
+    def current_version(self, db: Session, seen_version: int = None) -> int:
+        """
+        The permission version this worker trusts. Passing a version seen
+        elsewhere (e.g. in a token) that is newer forces an immediate re-read.
+        """
+        if not self.enabled:
+            return read_version(db, PERMISSIONS_VERSION_KEY)
+        if seen_version is not None and self.version is not None and seen_version > self.version:
+            self._checked_at = 0.0
+        self._sync(db)
+        return self.version
+
+    def permissions_for(self, db: Session, role_id: int) -> frozenset:
+        if not self.enabled:
+            return _load_role_permissions(db, role_id)
+        self._sync(db)
+        perms = self._roles.get(role_id)
+        if perms is None:
+            perms = _load_role_permissions(db, role_id)
+            with self._lock:
+                self._roles[role_id] = perms
+        return perms
+
+    def bump(self, db: Session):
+        """Call from permission writers before their commit; this worker re-reads once it lands."""
+        bump_version(db, PERMISSIONS_VERSION_KEY)
+        event.listen(db, "after_commit", lambda session: self.invalidate(), once=True)
+
+    def invalidate(self):
+        with self._lock:
+            self._roles = {}
+            self.version = None
+
+def _load_role_permissions(db: Session, role_id: int) -> frozenset:
+    perms = (
+        db.query(models.RolePermission.permission_name)
+        .filter(models.RolePermission.role_id == role_id)
+        .all()
+    )
+    return frozenset(p[0] for p in perms)
+
+permission_cache = PermissionCache(
+    check_interval=float(os.environ.get("PERMISSION_CACHE_CHECK_INTERVAL", "5")),
+    enabled=os.environ.get("PERMISSION_CACHE_ENABLED", "true").lower() not in ("0", "false", "no"),
+)
+
+# ==================== USER CACHE ====================
+
+class UserCache:
+    """
+    Short-TTL, size-bounded cache of users' column values keyed by id.
+
+    attach() rebuilds a User from the cached values and adds it to the
+    request session as an already-persistent row, so endpoints get a normal
+    ORM object (changes to it are flushed as usual) without a SELECT.
+    Columns in UNCACHED are never kept; reading them on an attached user
+    loads the current value from the database.
+    """
+
+    UNCACHED = {"password_hash"}
+
+    def __init__(self, ttl: float = 30.0, max_size: int = 10000, enabled: bool = True):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.enabled = enabled
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, user: models.User):
+        if not self.enabled:
+            return
+        values = {c.key: getattr(user, c.key) for c in sa_inspect(models.User).column_attrs if c.key not in self.UNCACHED}
+        with self._lock:
+            self._data[user.id] = (values, time.monotonic())
+            self._data.move_to_end(user.id)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def attach(self, db: Session, user_id: int):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[1] > self.ttl:
+                del self._data[user_id]
+                return None
+            self._data.move_to_end(user_id)
+        if db.identity_map.get(sa_inspect(models.User).identity_key_from_primary_key((user_id,))) is not None:
+            return None
+        user = models.User(**entry[0])
+        make_transient_to_detached(user)
+        db.add(user)
+        return user
+
+    def invalidate(self, user_ids=None):
+        """Drops the given users, or everyone when called without ids."""
+        with self._lock:
+            if user_ids is None:
+                self._data.clear()
+                return
+            for user_id in user_ids:
+                self._data.pop(user_id, None)
+
+user_cache = UserCache(
+    ttl=float(os.environ.get("USER_CACHE_TTL", "30")),
+    max_size=int(os.environ.get("USER_CACHE_SIZE", "10000")),
+    enabled=os.environ.get("USER_CACHE_ENABLED", "true").lower() not in ("0", "false", "no"),
+)
+
 def check_permission(required_permission):
     def dependency(
         current_user: models.User = Depends(get_current_user),
         db: Session = Depends(get_db)
     ):
-        perms = (
-            db.query(models.RolePermission.permission_name)
-            .filter(models.RolePermission.role_id == current_user.role_id)
-            .all()
-        )
-
-        permission_set = {p[0] for p in perms}
+        permission_set = permission_cache.permissions_for(db, current_user.role_id)
 
         if required_permission.value not in permission_set:
             raise HTTPException(
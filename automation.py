@@ -1,36 +1,374 @@
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import DateTime, exists, func, insert, literal, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.sql import Select
 from sqlalchemy.orm import Session
+from database import SessionLocal
 import models
 import services
+import score_rules
+import numpy as np
 from datetime import datetime, timezone
+import base64
+import json
+import multiprocessing
+import os
+
+# Lower bounds of each score band, ascending, and the recommendation for
+# every band: [<50, 50-69, 70-94, 95+]. Shared with the what-if simulator.
+SCORE_THRESHOLDS = [50, 70, 95]
+BAND_RECOMMENDATIONS = [
+    models.RecommendationType.FINAL_WARNING,
+    models.RecommendationType.WARNING,
+    None,
+    models.RecommendationType.BONUS,
+]
+
+# Org-wide evaluation scores in chunks of EVALUATION_CHUNK_SIZE users; with
+# more than one worker the chunks are scored in spawned processes.
+EVALUATION_WORKERS = int(os.environ.get("EVALUATION_WORKERS", "1"))
+EVALUATION_CHUNK_SIZE = int(os.environ.get("EVALUATION_CHUNK_SIZE", "2000"))
+
+def recommendation_for_score(score: float):
+    """Maps a weighted score onto its built-in recommendation band (None = satisfactory)."""
+    band = 0
+    for threshold in SCORE_THRESHOLDS:
+        if score >= threshold:
+            band += 1
+    return BAND_RECOMMENDATIONS[band]
+
+# Fallback set while no role_id NULL rules are stored, so a fresh install behaves as before
+DEFAULT_RULES = [
+    models.ScoreBandRule(role_id=None, min_score=low, max_score=None, consecutive_periods=1,
+                         recommendation=rec, position=0)
+    for low, rec in zip([None] + SCORE_THRESHOLDS, BAND_RECOMMENDATIONS)
+]
+rule_cache = score_rules.RuleCache(DEFAULT_RULES)
+
+def _history_periods(month: int, year: int, count: int):
+    """(month, year) of the evaluated period and the count - 1 before it, newest first."""
+    periods = []
+    for _ in range(count):
+        periods.append((month, year))
+        month, year = (12, year - 1) if month == 1 else (month - 1, year)
+    return periods
+
+def _score_history(db: Session, user_ids, periods):
+    """Scores per user for each period: [[period0, period1, ...], ...] in user_ids order."""
+    # Always from the database: a batch that touches every user would only
+    # flush the API's score cache, and recommendations must not use stale scores
+    columns = [services.calculate_scores_bulk(db, user_ids, m, y, use_cache=False) for m, y in periods]
+    return [[column[uid] for column in columns] for uid in user_ids]
+
+def _score_chunk(user_ids, periods):
+    """Runs in a pool process: scores one chunk with its own session."""
+    db = SessionLocal()
+    try:
+        return _score_history(db, user_ids, periods)
+    finally:
+        db.close()
+
+def evaluate_users(db: Session, users, month: int, year: int, workers: int = 1):
+    """
+    Scores users [(id, role_id, created_at)] for the period (plus as many
+    earlier periods as the rules look back) and classifies them all in one
+    vectorized pass. Returns ({user_id: score}, {user_id: recommendation or None}).
+    """
+    if not users:
+        return {}, {}
+    rules = rule_cache.get(db)
+    periods = _history_periods(month, year, rules.periods)
+    user_ids = [uid for uid, _role_id, _created in users]
+    chunks = [user_ids[i:i + EVALUATION_CHUNK_SIZE] for i in range(0, len(user_ids), EVALUATION_CHUNK_SIZE)]
+
+    history = []
+    if workers > 1 and len(chunks) > 1:
+        # spawn: children start clean instead of inheriting the API's threads and DB connections
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            for part in pool.map(_score_chunk, chunks, [periods] * len(chunks)):
+                history.extend(part)
+    else:
+        for chunk in chunks:
+            history.extend(_score_history(db, chunk, periods))
+    history = np.array(history, dtype=np.float64).reshape(len(user_ids), len(periods))
+
+    # Periods that ended before a user was created don't count towards "N periods in a row"
+    created = np.array([
+        np.datetime64(c.replace(tzinfo=None)) if c else np.datetime64("NaT") for _uid, _role, c in users
+    ], dtype="datetime64[us]")
+    for col, (m, y) in enumerate(periods[1:], start=1):
+        _start, end = services.period_bounds(m, y)
+        history[created >= np.datetime64(end), col] = np.nan
+
+    labels = rules.classify([role_id if role_id is not None else -1 for _uid, role_id, _c in users], history)
+    scores = dict(zip(user_ids, history[:, 0].tolist()))
+    recs = {uid: score_rules.LABELS[label] for uid, label in zip(user_ids, labels.tolist())}
+    return scores, recs
 
 def evaluate_performance(db: Session, user_id: int, month: int, year: int):
     """
-    Senior Logic: Evaluates score against corporate thresholds.
-    Thresholds:
-    - 95%+: Bonus/Promotion
+    Senior Logic: Evaluates one user's score against their role's rules
+    (score_band_rules, or these built-in thresholds when none are configured):
+    - 95%+: Bonus
     - 70-94%: Satisfactory (No recommendation)
     - 50-69%: Warning
-    - <50%: Final Warning / Termination
+    - <50%: Final Warning
     """
-    score = services.calculate_user_kpi_score(db, user_id, month, year)
+    users = db.query(models.User.id, models.User.role_id, models.User.created_at).filter(
+        models.User.id == user_id
+    ).all()
+    started = datetime.now(timezone.utc)
+    scores, recs = evaluate_users(db, users, month, year)
     period_str = f"{year}-{month:02d}"
-    
-    rec_type = None
-    if score >= 95:
-        rec_type = models.RecommendationType.BONUS
-    elif 50 <= score < 70:
-        rec_type = models.RecommendationType.WARNING
-    elif score < 50:
-        rec_type = models.RecommendationType.FINAL_WARNING
-
-    if rec_type:
-        new_rec = models.AutomationRule(
-            user_id=user_id,
-            score_achieved=score,
-            recommendation=rec_type,
-            period=period_str
+    upsert_recommendations(db, scores, recs, period_str)
+    _clear_dirty(db, period_str, [user_id], started)
+    db.commit()
+    return db.query(models.AutomationRule).filter(
+        models.AutomationRule.user_id == user_id,
+        models.AutomationRule.period == period_str
+    ).first()
+
+def _insert_recommendations(db: Session, rows):
+    """
+    Inserts recommendation rows; a row another evaluation inserted meanwhile
+    for the same (user_id, period) is updated instead, so concurrent runs
+    (an admin request and the month-close job) never trip
+    uq_automation_user_period.
+    """
+    dialect = {"sqlite": sqlite, "postgresql": postgresql}.get(db.get_bind().dialect.name)
+    if dialect is None:
+        db.bulk_insert_mappings(models.AutomationRule, rows)
+        return
+    stmt = dialect.insert(models.AutomationRule)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "period"],
+        set_={
+            "score_achieved": stmt.excluded.score_achieved,
+            "recommendation": stmt.excluded.recommendation,
+            "created_at": stmt.excluded.created_at,
+        },
+    )
+    db.execute(stmt, rows)
+
+def upsert_recommendations(db: Session, scores: dict, recommendations: dict, period: str):
+    """
+    Makes automation_recommendations hold exactly one row per (user_id, period)
+    for the given scores: new rows are inserted, changed ones updated and rows
+    for users now without a recommendation removed, so re-running an
+    evaluation never duplicates. Does not commit.
+    Returns {"created": n, "updated": n, "removed": n}.
+    """
+    stats = {"created": 0, "updated": 0, "removed": 0}
+    user_ids = list(scores)
+    for start in range(0, len(user_ids), services.BULK_CHUNK_SIZE):
+        chunk = user_ids[start:start + services.BULK_CHUNK_SIZE]
+        existing = {
+            uid: (rec_id, score, rec)
+            for rec_id, uid, score, rec in db.query(
+                models.AutomationRule.id, models.AutomationRule.user_id,
+                models.AutomationRule.score_achieved, models.AutomationRule.recommendation
+            ).filter(models.AutomationRule.period == period, models.AutomationRule.user_id.in_(chunk))
+        }
+        inserts, updates, removed = [], [], []
+        for uid in chunk:
+            score = scores[uid]
+            rec_type = recommendations[uid]
+            current = existing.get(uid)
+            if rec_type is None:
+                if current:
+                    removed.append(current[0])
+            elif current is None:
+                inserts.append({"user_id": uid, "score_achieved": score, "recommendation": rec_type,
+                                "period": period, "created_at": datetime.now(timezone.utc)})
+            elif (current[1], current[2]) != (score, rec_type):
+                updates.append({"id": current[0], "score_achieved": score, "recommendation": rec_type,
+                                "created_at": datetime.now(timezone.utc)})
+        if inserts:
+            _insert_recommendations(db, inserts)
+        if updates:
+            db.bulk_update_mappings(models.AutomationRule, updates)
+        if removed:
+            db.query(models.AutomationRule).filter(
+                models.AutomationRule.id.in_(removed)
+            ).delete(synchronize_session=False)
+        stats["created"] += len(inserts)
+        stats["updated"] += len(updates)
+        stats["removed"] += len(removed)
+    return stats
+
+def evaluate_period(db: Session, month: int, year: int, role_id: int = None, workers: int = None):
+    """
+    Senior Logic: Month-end close. Scores every user (optionally one role) in
+    bulk chunks, upserts their recommendations for the period and commits
+    once. Returns counts per recommendation plus what changed.
+    """
+    workers = EVALUATION_WORKERS if workers is None else workers
+    period = f"{year}-{month:02d}"
+    query = select(models.User.id, models.User.role_id, models.User.created_at).order_by(models.User.id)
+    if role_id is not None:
+        query = query.where(models.User.role_id == role_id)
+    started = datetime.now(timezone.utc)
+    users = db.execute(query).all()
+    scores, recs = evaluate_users(db, users, month, year, workers)
+
+    buckets = {score_rules.label_name(rec): 0 for rec in score_rules.LABELS}
+    for rec in recs.values():
+        buckets[score_rules.label_name(rec)] += 1
+
+    stats = upsert_recommendations(db, scores, recs, period)
+    # Everyone in scope was just evaluated, so their marks for this period are settled
+    Dirty = models.DirtyEvaluation
+    settled = db.query(Dirty).filter(Dirty.period == period, Dirty.marked_at <= started)
+    if role_id is not None:
+        settled = settled.filter(Dirty.user_id.in_(select(models.User.id).where(models.User.role_id == role_id)))
+    settled.delete(synchronize_session=False)
+    db.commit()
+    return {"period": period, "role_id": role_id, "evaluated": len(scores), "buckets": buckets, **stats}
+
+# ==================== DIRTY SET ====================
+
+def evaluated_periods(db: Session):
+    """Periods that already have recommendations, i.e. have been evaluated at least once."""
+    return [p for (p,) in db.query(models.AutomationRule.period).distinct()]
+
+def mark_dirty(db: Session, user_ids, periods):
+    """
+    Flags (user, period) pairs for reevaluate_dirty(). user_ids is a list or a
+    select() of user ids. Existing marks get a fresh marked_at so a
+    re-evaluation already in progress does not clear them. Does not commit.
+    """
+    now = datetime.now(timezone.utc)
+    Dirty = models.DirtyEvaluation
+    if not isinstance(user_ids, Select):
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return
+        user_ids = select(models.User.id).where(models.User.id.in_(user_ids))
+    candidates = user_ids.subquery()
+    candidate_id = candidates.c[0]
+    for period in dict.fromkeys(periods):
+        db.execute(
+            update(Dirty).where(Dirty.period == period, Dirty.user_id.in_(select(candidate_id))).values(marked_at=now)
         )
-        db.add(new_rec)
-        db.commit()
-        return new_rec
-    return None
\ No newline at end of file
+        db.execute(insert(Dirty).from_select(
+            ["user_id", "period", "marked_at"],
+            select(candidate_id, literal(period), literal(now, DateTime)).where(
+                ~exists().where(Dirty.user_id == candidate_id, Dirty.period == period)
+            )
+        ))
+
+def _clear_dirty(db: Session, period: str, user_ids, before: datetime):
+    Dirty = models.DirtyEvaluation
+    db.query(Dirty).filter(
+        Dirty.period == period, Dirty.user_id.in_(user_ids), Dirty.marked_at <= before
+    ).delete(synchronize_session=False)
+
+def reevaluate_dirty(db: Session):
+    """
+    Senior Logic: Re-scores only the flagged (user, period) pairs with the bulk
+    scorer and updates their recommendations in place, one commit per chunk.
+    Pairs in periods that were never evaluated are dropped (the month-end
+    close will cover them). Returns what changed, including how many users
+    moved to a different recommendation.
+    """
+    started = datetime.now(timezone.utc)
+    Dirty = models.DirtyEvaluation
+    evaluated = set(evaluated_periods(db))
+    pending = {}
+    for user_id, period in db.query(Dirty.user_id, Dirty.period).filter(Dirty.marked_at <= started):
+        pending.setdefault(period, []).append(user_id)
+
+    result = {"periods": [], "users": 0, "changed": 0, "transitions": {}, "skipped": 0,
+              "created": 0, "updated": 0, "removed": 0}
+    for period in sorted(pending):
+        user_ids = sorted(pending[period])
+        if period not in evaluated:
+            for start in range(0, len(user_ids), EVALUATION_CHUNK_SIZE):
+                _clear_dirty(db, period, user_ids[start:start + EVALUATION_CHUNK_SIZE], started)
+            db.commit()
+            result["skipped"] += len(user_ids)
+            continue
+
+        year, month = (int(x) for x in period.split("-"))
+        result["periods"].append(period)
+        for start in range(0, len(user_ids), EVALUATION_CHUNK_SIZE):
+            chunk = user_ids[start:start + EVALUATION_CHUNK_SIZE]
+            users = db.query(models.User.id, models.User.role_id, models.User.created_at).filter(
+                models.User.id.in_(chunk)
+            ).all()
+            before = dict(db.query(models.AutomationRule.user_id, models.AutomationRule.recommendation).filter(
+                models.AutomationRule.period == period, models.AutomationRule.user_id.in_(chunk)
+            ))
+            scores, recs = evaluate_users(db, users, month, year)
+            for uid, rec in recs.items():
+                if before.get(uid) != rec:
+                    key = f"{score_rules.label_name(before.get(uid))} -> {score_rules.label_name(rec)}"
+                    result["transitions"][key] = result["transitions"].get(key, 0) + 1
+                    result["changed"] += 1
+            for key, count in upsert_recommendations(db, scores, recs, period).items():
+                result[key] += count
+            _clear_dirty(db, period, chunk, started) # Includes ids whose user no longer exists
+            db.commit()
+            result["users"] += len(users)
+    return result
+
+# ==================== LISTING ====================
+
+RECOMMENDATION_PAGE_MAX = 500
+
+def encode_cursor(period: str, rec_id: int) -> str:
+    raw = json.dumps([period, rec_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    """Returns (period, id); raises ValueError for anything that is not one of our cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        period, rec_id = json.loads(raw)
+        return str(period), int(rec_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def query_recommendations(
+    db: Session,
+    period: str = None,
+    recommendation: models.RecommendationType = None,
+    user_id: int = None,
+    cursor: str = None,
+    limit: int = 50
+):
+    """
+    Senior Logic: Keyset-paginated recommendations, newest period first, with
+    the user's name joined in. Returns ([(AutomationRule, full_name)], next_cursor or None).
+    """
+    Rec = models.AutomationRule
+    query = db.query(Rec, models.User.full_name).outerjoin(models.User, models.User.id == Rec.user_id)
+    if period:
+        query = query.filter(Rec.period == period)
+    if recommendation:
+        query = query.filter(Rec.recommendation == recommendation)
+    if user_id is not None:
+        query = query.filter(Rec.user_id == user_id)
+    if cursor:
+        query = query.filter(tuple_(Rec.period, Rec.id) < tuple_(*decode_cursor(cursor)))
+
+    limit = max(1, min(limit, RECOMMENDATION_PAGE_MAX))
+    rows = query.order_by(Rec.period.desc(), Rec.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        next_cursor = encode_cursor(last.period, last.id)
+    return rows, next_cursor
+
+def dedupe_recommendations(db: Session):
+    """Keeps only the newest row per (user_id, period). Returns how many rows were deleted."""
+    keep = select(func.max(models.AutomationRule.id)).group_by(
+        models.AutomationRule.user_id, models.AutomationRule.period
+    )
+    removed = db.query(models.AutomationRule).filter(
+        models.AutomationRule.id.not_in(keep)
+    ).delete(synchronize_session=False)
+    db.commit()
+    return removed
@@ -0,0 +1,110 @@
+"""
+Benchmark: peak memory of the Excel export as the org grows.
+
+Seeds one throwaway SQLite database per size (users, role KPIs and score
+rollups), then runs the export in a fresh child process and reports how
+much its peak RSS grew (score cache disabled, so only the export itself is
+measured). The streaming path (server-side cursor + write-only
+workbook) should stay flat; --legacy also runs the old build-a-list +
+DataFrame path for comparison.
+
+Usage:
+    python benchmarks/bench_export_memory.py [--sizes 1000,10000,100000] [--legacy]
+"""
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def seed(url, users, kpis_per_role=5, roles=3):
+    from sqlalchemy import create_engine, insert
+    from database import Base
+    import models
+
+    random.seed(7)
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    period = datetime.utcnow().strftime("%Y-%m")
+    with engine.begin() as conn:
+        conn.execute(insert(models.Role), [{"id": r, "name": f"Role {r}"} for r in range(1, roles + 1)])
+        kpis = [{"id": r * 100 + i, "name": f"KPI {r}-{i}", "category": "Sales", "target_value": 50,
+                 "weightage": 100 / kpis_per_role, "measurement_type": models.MeasurementType.COUNT, "role_id": r}
+                for r in range(1, roles + 1) for i in range(kpis_per_role)]
+        conn.execute(insert(models.KPI), kpis)
+        for start in range(1, users + 1, 10000):
+            ids = range(start, min(start + 10000, users + 1))
+            roles_of = {uid: random.randint(1, roles) for uid in ids}
+            conn.execute(insert(models.User), [
+                {"id": uid, "full_name": f"User {uid}", "email": f"user{uid}@bench.local",
+                 "password_hash": "x", "role_id": roles_of[uid], "is_active": True} for uid in ids
+            ])
+            conn.execute(insert(models.KPIScoreRollup), [
+                {"user_id": uid, "kpi_id": k["id"], "period": period, "verified_sum": random.randint(0, 60)}
+                for uid in ids for k in kpis if k["role_id"] == roles_of[uid]
+            ])
+    engine.dispose()
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+def measure(url, legacy):
+    """Child process: export every user and print peak RSS growth and output size."""
+    os.environ["DATABASE_URL"] = url
+    os.environ["SCORE_CACHE_ENABLED"] = "0"
+    import services
+    import reports
+    from database import SessionLocal
+
+    now = datetime.utcnow()
+    baseline = peak_rss_mb()
+    t0 = time.perf_counter()
+    db = SessionLocal()
+    if legacy:
+        data = [{"user_id": uid, "full_name": name, "score": score, "period": f"{now.year}-{now.month}"}
+                for uid, name, score in services.iter_user_scores(db, now.month, now.year)]
+        size = len(reports.generate_excel_report(data))
+    else:
+        rows = ((uid, name, score, f"{now.year}-{now.month}")
+                for uid, name, score in services.iter_user_scores(db, now.month, now.year))
+        size = sum(len(chunk) for chunk in reports.stream_excel_report(rows))
+    db.close()
+    print(f"{peak_rss_mb() - baseline:.1f} {size} {time.perf_counter() - t0:.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--legacy", action="store_true", help="Also measure the pre-streaming export")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    parser.add_argument("--measure-legacy", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.measure_legacy)
+        return
+
+    modes = [("streaming", False)] + ([("legacy", True)] if args.legacy else [])
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'users':>8} {'mode':>10} {'peak RSS growth':>16} {'xlsx size':>10} {'time':>7}")
+        for users in (int(s) for s in args.sizes.split(",")):
+            url = f"sqlite:///{os.path.join(tmp, f'export_{users}.db')}"
+            seed(url, users)
+            for label, legacy in modes:
+                cmd = [sys.executable, os.path.abspath(__file__), "--measure", url]
+                if legacy:
+                    cmd.append("--measure-legacy")
+                out = subprocess.run(cmd, capture_output=True, text=True, check=True, cwd=ROOT).stdout.split()
+                growth, size, seconds = float(out[-3]), int(out[-2]), float(out[-1])
+                print(f"{users:>8} {label:>10} {growth:>13.1f} MB {size / 1024:>7.0f} KB {seconds:>6.2f}s")
+
+if __name__ == "__main__":
+    main()
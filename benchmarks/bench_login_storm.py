@@ -0,0 +1,106 @@
+"""
+Benchmark: latency of a non-auth endpoint during a login storm.
+
+Starts the API with uvicorn on a throwaway SQLite database and fires
+concurrent POST /token requests while a probe thread measures GET /health
+latency. Runs once with bcrypt inline on the request threadpool
+(PASSWORD_HASH_WORKERS=0, the old behaviour) and once with the bounded
+password pool, then reports probe p50/p99 and login outcomes.
+
+Usage:
+    python benchmarks/bench_login_storm.py [--seconds 5] [--storm-threads 64] [--rounds 12]
+"""
+import argparse
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+
+import requests
+import uvicorn
+from passlib.hash import bcrypt
+import app as api
+import auth
+import models
+from database import SessionLocal
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def run_storm(base, seconds, storm_threads):
+    stop = time.perf_counter() + seconds
+    outcomes = {}
+    probe = []
+    lock = threading.Lock()
+
+    def login():
+        session = requests.Session()
+        while time.perf_counter() < stop:
+            code = session.post(f"{base}/token", data={"username": "storm@bench.local", "password": "stormpass"}).status_code
+            with lock:
+                outcomes[code] = outcomes.get(code, 0) + 1
+
+    def health():
+        session = requests.Session()
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            session.get(f"{base}/health")
+            probe.append((time.perf_counter() - t0) * 1000)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=login) for _ in range(storm_threads)]
+    threads.append(threading.Thread(target=health))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return probe, outcomes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--storm-threads", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=auth.BCRYPT_ROUNDS)
+    parser.add_argument("--workers", type=int, default=auth.password_pool.workers or 4)
+    parser.add_argument("--queue", type=int, default=auth.password_pool.max_queue)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    db.add(models.User(full_name="Storm", email="storm@bench.local",
+                       password_hash=bcrypt.using(rounds=args.rounds).hash("stormpass")))
+    db.commit()
+    db.close()
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    base = f"http://127.0.0.1:{port}"
+
+    print(f"{args.storm_threads} concurrent logins for {args.seconds:.0f}s, bcrypt rounds={args.rounds}")
+    for label, workers in (("inline bcrypt", 0), (f"password pool ({args.workers} workers, queue {args.queue})", args.workers)):
+        auth.password_pool = auth.PasswordPool(workers=workers, max_queue=args.queue, timeout=10)
+        probe, outcomes = run_storm(base, args.seconds, args.storm_threads)
+        auth.password_pool.shutdown()
+        print(f"\n[{label}]")
+        print(f"  /health p50 {statistics.median(probe):8.1f} ms   p99 {percentile(probe, 99):8.1f} ms   ({len(probe)} probes)")
+        print(f"  /token outcomes: {dict(sorted(outcomes.items()))}")
+
+    server.should_exit = True
+
+if __name__ == "__main__":
+    main()
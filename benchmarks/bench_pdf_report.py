@@ -0,0 +1,56 @@
+"""
+Benchmark: full multi-page PDF report (reports.generate_pdf_report).
+
+Builds synthetic per-KPI breakdowns in memory (no database), then times
+layout + parallel page rendering + merge for each worker count. Target:
+10k users under 10 seconds on 8 cores.
+
+Usage:
+    python benchmarks/bench_pdf_report.py [--users 10000] [--kpis 6] [--workers 1,8]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import automation
+import reports
+import score_rules
+
+def build_users(users, kpis, seed=7):
+    random.seed(seed)
+    names = [f"KPI {i} - Outbound activity" for i in range(kpis)]
+    rows = []
+    for uid in range(1, users + 1):
+        parts = []
+        for name in names:
+            target = random.choice([10, 20, 40, 80])
+            achieved = float(random.randint(0, 100))
+            points = min(achieved / target, 1.0) * (100 / kpis)
+            parts.append((name, target, achieved, points))
+        rows.append((uid, f"User {uid}", round(sum(p[3] for p in parts), 2), parts))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--kpis", type=int, default=6)
+    parser.add_argument("--workers", default=f"1,{os.cpu_count() or 1}")
+    args = parser.parse_args()
+
+    users = build_users(args.users, args.kpis)
+    # Built-in bands for every user, as on an install without stored rules
+    rules, roles = score_rules.CompiledRules([], defaults=automation.DEFAULT_RULES), {}
+    print(f"{args.users} users x {args.kpis} KPIs, {os.cpu_count()} CPUs available")
+    for workers in dict.fromkeys(int(w) for w in args.workers.split(",")):
+        t0 = time.perf_counter()
+        pdf = reports.generate_pdf_report(users, "2025-12", rules, roles, workers=workers)
+        elapsed = time.perf_counter() - t0
+        pages = pdf.count(b"/Type /Page") - pdf.count(b"/Type /Pages")
+        print(f"workers={workers:>2}: {elapsed:6.2f}s, {pages} pages, {len(pdf) / 1024 / 1024:.1f} MB")
+
+if __name__ == "__main__":
+    main()
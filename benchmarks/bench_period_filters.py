@@ -0,0 +1,152 @@
+"""
+Benchmark: extract()-based vs half-open range period filters on achievements.
+
+Seeds a throwaway SQLite database with one account that has several years
+of achievement history (plus background users), then compares query plans
+and latency of the monthly verified-sum query before and after switching
+to services.period_bounds() and the composite achievements index.
+
+Usage:
+    python benchmarks/bench_period_filters.py [--years 6] [--per-month 60] [--url sqlite:///bench.db]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func, inspect, text
+from sqlalchemy.orm import sessionmaker
+from database import Base
+import models
+import services
+
+INDEX_NAME = "ix_achievements_user_kpi_status_date"
+
+def seed(Session, years, per_month, background_users):
+    random.seed(42)
+    db = Session()
+    role = models.Role(name="SDR")
+    db.add(role)
+    db.flush()
+    kpis = [models.KPI(name=f"KPI {i}", category="Sales", target_value=50, weightage=12.5,
+                       measurement_type=models.MeasurementType.COUNT, role_id=role.id) for i in range(8)]
+    users = [models.User(full_name=f"User {i}", email=f"user{i}@bench.local", password_hash="x",
+                         role_id=role.id) for i in range(background_users + 1)]
+    db.add_all(kpis + users)
+    db.flush()
+
+    now = datetime(datetime.utcnow().year, datetime.utcnow().month, 1)
+    rows = []
+    for user in users:
+        # The first user is the long-lived account; others get a lighter history
+        months = years * 12 if user is users[0] else 12
+        volume = per_month if user is users[0] else max(1, per_month // 10)
+        for m in range(months):
+            month_start = now - timedelta(days=30 * m)
+            for _ in range(volume):
+                rows.append({
+                    "user_id": user.id,
+                    "kpi_id": random.choice(kpis).id,
+                    "achieved_value": random.randint(1, 10),
+                    "description": "bench",
+                    "achievement_date": month_start + timedelta(days=random.randint(0, 27), minutes=random.randint(0, 1440)),
+                    "status": random.choice(list(models.AchievementStatus)),
+                })
+    db.bulk_insert_mappings(models.Achievement, rows)
+    db.commit()
+    target = users[0].id, [k.id for k in kpis]
+    db.close()
+    return target, len(rows)
+
+def extract_query(db, user_id, kpi_id, month, year):
+    return db.query(func.sum(models.Achievement.achieved_value)).filter(
+        models.Achievement.user_id == user_id,
+        models.Achievement.kpi_id == kpi_id,
+        models.Achievement.status == models.AchievementStatus.VERIFIED,
+        func.extract('month', models.Achievement.achievement_date) == month,
+        func.extract('year', models.Achievement.achievement_date) == year
+    )
+
+def range_query(db, user_id, kpi_id, month, year):
+    start, end = services.period_bounds(month, year)
+    return db.query(func.sum(models.Achievement.achieved_value)).filter(
+        models.Achievement.user_id == user_id,
+        models.Achievement.kpi_id == kpi_id,
+        models.Achievement.status == models.AchievementStatus.VERIFIED,
+        models.Achievement.achievement_date >= start,
+        models.Achievement.achievement_date < end
+    )
+
+def explain(engine, query):
+    compiled = query.statement.compile(engine, compile_kwargs={"literal_binds": True})
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    with engine.connect() as conn:
+        rows = conn.execute(text(prefix + str(compiled))).fetchall()
+    return [" ".join(str(c) for c in row) for row in rows]
+
+def time_query(Session, build, user_id, kpi_ids, month, year, repeat):
+    db = Session()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for kpi_id in kpi_ids:
+            build(db, user_id, kpi_id, month, year).scalar()
+        samples.append((time.perf_counter() - t0) * 1000)
+    db.close()
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=int, default=6)
+    parser.add_argument("--per-month", type=int, default=60)
+    parser.add_argument("--background-users", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--url", help="Empty database to seed (defaults to a temporary SQLite file)")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_engine(url)
+    # The benchmark seeds tables and drops/creates an index; never do that to a database with data in it
+    existing = inspect(engine).get_table_names()
+    if existing:
+        parser.error(f"{engine.url!r} already has tables ({', '.join(existing[:5])}); pass an empty database")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    (user_id, kpi_ids), total = seed(Session, args.years, args.per_month, args.background_users)
+    now = datetime.utcnow()
+    print(f"Seeded {total} achievements ({args.years} years for user {user_id}) into {engine.url}")
+
+    results = {}
+    for indexed in (False, True):
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP INDEX IF EXISTS {INDEX_NAME}"))
+            if indexed:
+                conn.execute(text(
+                    f"CREATE INDEX {INDEX_NAME} ON achievements (user_id, kpi_id, status, achievement_date)"
+                ))
+            conn.execute(text("ANALYZE"))
+        label = "with composite index" if indexed else "without composite index"
+        for name, build in (("extract", extract_query), ("range", range_query)):
+            db = Session()
+            plan = explain(engine, build(db, user_id, kpi_ids[0], now.month, now.year))
+            db.close()
+            ms = time_query(Session, build, user_id, kpi_ids, now.month, now.year, args.repeat)
+            results[(name, indexed)] = ms
+            print(f"\n[{name} filter, {label}] median {ms:.2f} ms for {len(kpi_ids)} KPI sums")
+            for line in plan:
+                print(f"    {line}")
+
+    baseline = results[("extract", False)]
+    print("\nSummary (median ms per score, lower is better):")
+    for (name, indexed), ms in results.items():
+        print(f"  {name:<8} index={'yes' if indexed else 'no ':<4} {ms:8.2f} ms  ({baseline / ms:5.1f}x vs extract/no index)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark: requests/sec on a permission-guarded endpoint with and without
+the process-local role-permission cache (auth.permission_cache).
+
+Starts the API with uvicorn on a throwaway SQLite database, logs in as an
+admin and hammers GET /admin/score-cache (guarded by SYSTEM_CONFIG) from a
+few client threads.
+
+Usage:
+    python benchmarks/bench_permission_cache.py [--seconds 5] [--threads 4]
+"""
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+
+import requests
+import uvicorn
+import app as api
+import auth
+import models
+from database import SessionLocal
+
+ENDPOINT = "/admin/score-cache"
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def setup_admin(base):
+    requests.get(f"{base}/bootstrap")
+    db = SessionLocal()
+    db.add(models.User(full_name="Bench Admin", email="admin@bench.local",
+                       password_hash=auth.get_password_hash("benchpass"), role_id=1))
+    db.commit()
+    db.close()
+    token = requests.post(f"{base}/token", data={"username": "admin@bench.local", "password": "benchpass"}).json()
+    return {"Authorization": f"Bearer {token['access_token']}"}
+
+def measure(base, headers, seconds, threads):
+    count = [0] * threads
+    stop = time.perf_counter() + seconds
+
+    def worker(i):
+        session = requests.Session()
+        while time.perf_counter() < stop:
+            resp = session.get(f"{base}{ENDPOINT}", headers=headers)
+            assert resp.status_code == 200, resp.text
+            count[i] += 1
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return sum(count) / seconds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    base = f"http://127.0.0.1:{port}"
+    headers = setup_admin(base)
+
+    results = {}
+    for enabled in (False, True):
+        auth.permission_cache.enabled = enabled
+        auth.permission_cache.invalidate()
+        measure(base, headers, 1, args.threads)  # warm-up
+        results[enabled] = measure(base, headers, args.seconds, args.threads)
+        print(f"permission cache {'on ' if enabled else 'off'}: {results[enabled]:8.1f} req/s on {ENDPOINT}")
+
+    print(f"speedup: {results[True] / results[False]:.2f}x")
+    server.should_exit = True
+
+if __name__ == "__main__":
+    main()
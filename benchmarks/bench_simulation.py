@@ -0,0 +1,76 @@
+"""
+Benchmark: vectorized what-if scoring (simulation.run_simulation).
+
+Builds a synthetic PeriodArrays snapshot in memory (no database) and times
+a full baseline + proposed recompute with histograms and bucket changes.
+
+Usage:
+    python benchmarks/bench_simulation.py [--users 50000] [--kpis 20] [--roles 4]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import automation
+import score_rules
+import simulation
+
+def build_arrays(users, kpis, roles, seed=7):
+    rng = np.random.default_rng(seed)
+    kpi_roles = np.arange(kpis, dtype=np.int64) % roles + 1
+    kpi_targets = rng.integers(10, 100, kpis).astype(np.float64)
+    # Spread 100 weightage points across each role's KPIs
+    kpi_weights = np.zeros(kpis)
+    for role in range(1, roles + 1):
+        cols = np.flatnonzero(kpi_roles == role)
+        kpi_weights[cols] = 100.0 / len(cols)
+
+    sums = rng.gamma(2.0, kpi_targets / 2.2, size=(users, kpis)).round()
+    overrides = np.full((users, kpis), np.nan)
+    mask = rng.random((users, kpis)) < 0.05
+    overrides[mask] = rng.integers(5, 120, mask.sum())
+
+    return simulation.PeriodArrays(
+        user_ids=np.arange(1, users + 1, dtype=np.int64),
+        user_roles=rng.integers(1, roles + 1, users),
+        kpi_ids=np.arange(1, kpis + 1, dtype=np.int64),
+        kpi_roles=kpi_roles,
+        kpi_targets=kpi_targets,
+        kpi_weights=kpi_weights,
+        sums=sums,
+        override_targets=overrides,
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--kpis", type=int, default=20)
+    parser.add_argument("--roles", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    arrays = build_arrays(args.users, args.kpis, args.roles)
+    kpi_changes = [(1, float(arrays.kpi_targets[0]) * 1.2, None), (2, None, 10.0)]
+    overrides = [(int(u), 3, 15.0) for u in arrays.user_ids[:1000]]
+    # Built-in bands for every role, compiled once as the API's rule cache would
+    rules = score_rules.CompiledRules([], defaults=automation.DEFAULT_RULES)
+
+    samples = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        result = simulation.run_simulation(arrays, rules, kpi_changes=kpi_changes, overrides=overrides)
+        samples.append((time.perf_counter() - t0) * 1000)
+
+    print(f"{args.users} users x {args.kpis} KPIs, {len(overrides)} proposed overrides")
+    print(f"run_simulation: median {statistics.median(samples):.1f} ms, max {max(samples):.1f} ms over {args.repeat} runs")
+    print(f"users changing recommendation bucket: {result['changed_users_count']}")
+    print(f"baseline buckets: {result['baseline']['recommendations']}")
+    print(f"proposed buckets: {result['proposed']['recommendations']}")
+
+if __name__ == "__main__":
+    main()
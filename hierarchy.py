@@ -0,0 +1,276 @@
+from sqlalchemy import func, select, literal, insert, update, true
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+import models
+import services
+
+# Hard stop for the recursive walk so a corrupted (cyclic) manager chain
+# can never make the CTE run forever.
+MAX_TREE_DEPTH = 64
+
+def subtree_cte(root_id: int, max_depth: int = None):
+    """
+    Recursive CTE of (id, manager_id, depth) for everyone reporting to root_id,
+    directly (depth 1) or indirectly. The root itself is not included.
+    """
+    depth_limit = min(max_depth or MAX_TREE_DEPTH, MAX_TREE_DEPTH)
+
+    tree = select(
+        models.User.id.label("id"),
+        models.User.manager_id.label("manager_id"),
+        literal(1).label("depth")
+    ).where(models.User.manager_id == root_id).cte("subtree", recursive=True)
+
+    parent = aliased(tree, name="parent")
+    tree = tree.union_all(
+        select(models.User.id, models.User.manager_id, parent.c.depth + 1)
+        .join(parent, models.User.manager_id == parent.c.id)
+        .where(parent.c.depth < depth_limit)
+    )
+    return tree
+
+def load_subtree(db: Session, root_id: int, max_depth: int = None):
+    """All users under root_id with their depth, in one query, ordered by (depth, id)."""
+    tree = subtree_cte(root_id, max_depth)
+    return db.query(models.User, tree.c.depth).join(
+        tree, models.User.id == tree.c.id
+    ).order_by(tree.c.depth, models.User.id).all()
+
+def subtree_user_ids(db: Session, root_id: int, max_depth: int = None):
+    tree = subtree_cte(root_id, max_depth)
+    return [uid for (uid,) in db.execute(select(tree.c.id)).all()]
+
+def _member_dict(user: models.User):
+    return {
+        "id": user.id,
+        "email": user.email,
+        "full_name": user.full_name,
+        "role_id": user.role_id,
+        "is_active": user.is_active,
+        "created_at": user.created_at,
+        "subordinates": [],
+    }
+
+def build_team_tree(root: models.User, rows):
+    """Nests load_subtree() rows under root without touching the lazy `subordinates` relationship."""
+    root_node = _member_dict(root)
+    nodes = {root.id: root_node}
+    # Rows come ordered by depth, so every manager is placed before their reports
+    for user, _depth in rows:
+        node = _member_dict(user)
+        nodes[user.id] = node
+        parent = nodes.get(user.manager_id)
+        if parent is not None:
+            parent["subordinates"].append(node)
+    return root_node
+
+
+# ==================== CLOSURE TABLE ====================
+# user_hierarchy_closure mirrors User.manager_id so ancestry questions are a
+# single indexed lookup. Writers call these helpers before their own
+# db.commit() so the closure and manager_id change in one transaction.
+
+Closure = models.HierarchyClosure
+
+def add_user_node(db: Session, user_id: int):
+    """Registers a new user (self row). Call after flush so the id exists."""
+    db.add(Closure(ancestor_id=user_id, descendant_id=user_id, depth=0))
+
+def move_subtree(db: Session, user_id: int, new_manager_id: int = None):
+    """Re-parents user_id (and everyone under them) below new_manager_id, or detaches it."""
+    subtree = select(Closure.descendant_id).where(Closure.ancestor_id == user_id)
+    old_ancestors = select(Closure.ancestor_id).where(
+        Closure.descendant_id == user_id, Closure.ancestor_id != user_id
+    )
+    # 1. Cut every path from the old ancestors into the subtree
+    db.query(Closure).filter(
+        Closure.descendant_id.in_(subtree),
+        Closure.ancestor_id.in_(old_ancestors)
+    ).delete(synchronize_session=False)
+
+    # 2. Connect each of the new manager's ancestors (incl. itself) to each subtree node
+    if new_manager_id is not None:
+        sup = aliased(Closure, name="sup")
+        sub = aliased(Closure, name="sub")
+        db.execute(insert(Closure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(sup.ancestor_id, sub.descendant_id, sup.depth + sub.depth + 1)
+            .select_from(sup).join(sub, true()) # Deliberate cross product
+            .where(sup.descendant_id == new_manager_id, sub.ancestor_id == user_id)
+        ))
+
+def is_descendant(db: Session, ancestor_id: int, user_id: int) -> bool:
+    """True when user_id reports to ancestor_id at any depth (not counting themselves)."""
+    return db.query(
+        db.query(Closure).filter(
+            Closure.ancestor_id == ancestor_id,
+            Closure.descendant_id == user_id,
+            Closure.depth > 0
+        ).exists()
+    ).scalar()
+
+def would_create_cycle(db: Session, user_id: int, proposed_manager_id: int) -> bool:
+    """Making proposed_manager_id the manager of user_id is a cycle if the manager is in user_id's subtree."""
+    return user_id == proposed_manager_id or is_descendant(db, user_id, proposed_manager_id)
+
+def descendant_ids(db: Session, ancestor_id: int, max_depth: int = None):
+    query = db.query(Closure.descendant_id).filter(
+        Closure.ancestor_id == ancestor_id, Closure.depth > 0
+    )
+    if max_depth:
+        query = query.filter(Closure.depth <= max_depth)
+    return [uid for (uid,) in query.order_by(Closure.depth, Closure.descendant_id).all()]
+
+def _expected_closure(db: Session):
+    """Closure rows implied by the current users.manager_id column, computed in memory."""
+    managers = dict(db.query(models.User.id, models.User.manager_id).all())
+    expected = {}
+    for user_id in managers:
+        expected[(user_id, user_id)] = 0
+        depth, current = 0, managers.get(user_id)
+        seen = {user_id}
+        while current is not None and current not in seen and current in managers:
+            depth += 1
+            expected[(current, user_id)] = depth
+            seen.add(current)
+            current = managers.get(current)
+    return expected
+
+def rebuild_closure(db: Session):
+    """Recomputes user_hierarchy_closure from users.manager_id. Returns the row count."""
+    expected = _expected_closure(db)
+    db.query(Closure).delete(synchronize_session=False)
+    db.bulk_insert_mappings(Closure, [
+        {"ancestor_id": a, "descendant_id": d, "depth": depth}
+        for (a, d), depth in expected.items()
+    ])
+    db.commit()
+    return len(expected)
+
+def ensure_closure(db: Session):
+    """
+    Rebuilds the closure when some user has no self row: the table predates
+    the users (first start after upgrading) or users were inserted outside
+    the API. Ancestry checks read only the closure, so such users would pass
+    every cycle check and have no subtree.
+    Returns the rows written, 0 when nothing was needed.
+    """
+    users = db.query(func.count(models.User.id)).scalar()
+    self_rows = db.query(func.count()).select_from(Closure).filter(Closure.depth == 0).scalar()
+    if users == self_rows:
+        return 0
+    try:
+        return rebuild_closure(db)
+    except IntegrityError:
+        db.rollback() # Another worker built it first
+        return 0
+
+def verify_closure(db: Session):
+    """Compares the stored closure with users.manager_id; returns missing/extra/wrong-depth pairs."""
+    expected = _expected_closure(db)
+    actual = {(a, d): depth for a, d, depth in db.query(Closure.ancestor_id, Closure.descendant_id, Closure.depth).all()}
+    return {
+        "missing": sorted(set(expected) - set(actual)),
+        "extra": sorted(set(actual) - set(expected)),
+        "wrong_depth": sorted(k for k in set(expected) & set(actual) if expected[k] != actual[k]),
+    }
+
+
+# ==================== BULK REORG ====================
+
+def _find_cycle(parents: dict, start_ids):
+    """First reporting cycle reachable by walking up from start_ids, or None."""
+    done = set()
+    for start in start_ids:
+        path, on_path = [], set()
+        current = start
+        while current is not None and current not in done:
+            if current in on_path:
+                return path[path.index(current):]
+            path.append(current)
+            on_path.add(current)
+            current = parents.get(current)
+        done.update(path)
+    return None
+
+def apply_reorg(db: Session, moves):
+    """
+    Applies many (user_id, manager_id) moves at once. The current hierarchy
+    is loaded once, moves are applied to the in-memory parent map, the final
+    graph is checked for cycles, then users and the closure table are updated.
+    Does not commit. Raises ValueError on invalid input or a cycle.
+    Returns the list of (user_id, old_manager_id, new_manager_id) actually changed.
+    """
+    parents = dict(db.query(models.User.id, models.User.manager_id).all())
+
+    seen, unknown = set(), set()
+    for user_id, manager_id in moves:
+        if user_id in seen:
+            raise ValueError(f"User {user_id} appears in more than one move")
+        seen.add(user_id)
+        if user_id not in parents:
+            unknown.add(user_id)
+        if manager_id is not None and manager_id not in parents:
+            unknown.add(manager_id)
+    if unknown:
+        raise ValueError(f"Unknown user id(s): {sorted(unknown)[:20]}")
+
+    changed = [(u, parents[u], m) for u, m in moves if parents[u] != m]
+    for user_id, _old, manager_id in changed:
+        if user_id == manager_id:
+            raise ValueError(f"User {user_id} cannot manage themselves")
+        parents[user_id] = manager_id
+
+    # Any new cycle must pass through a moved user
+    cycle = _find_cycle(parents, [u for u, _old, _new in changed])
+    if cycle:
+        raise ValueError(f"Circular reporting detected: {' -> '.join(str(u) for u in cycle[:20])}")
+    if not changed:
+        return changed
+
+    db.execute(update(models.User), [
+        {"id": user_id, "manager_id": manager_id} for user_id, _old, manager_id in changed
+    ])
+    _refresh_closure(db, parents, [u for u, _old, _new in changed])
+    return changed
+
+def _refresh_closure(db: Session, parents: dict, moved_ids):
+    """Rewrites closure rows for every user whose ancestor chain changed (moved users and their subtrees)."""
+    children = {}
+    for user_id, manager_id in parents.items():
+        if manager_id is not None:
+            children.setdefault(manager_id, []).append(user_id)
+
+    affected, stack = set(), list(moved_ids)
+    while stack:
+        user_id = stack.pop()
+        if user_id in affected:
+            continue
+        affected.add(user_id)
+        stack.extend(children.get(user_id, ()))
+
+    # Memoised ancestor chains: chain[u] = [manager, manager's manager, ...]
+    chains = {}
+    def chain(user_id):
+        pending = []
+        current = user_id
+        while current is not None and current not in chains:
+            pending.append(current)
+            current = parents.get(current)
+        tail = chains.get(current, []) if current is not None else []
+        for node in reversed(pending):
+            manager_id = parents.get(node)
+            tail = ([manager_id] + tail) if manager_id is not None else []
+            chains[node] = tail
+        return chains[user_id]
+
+    rows = []
+    for user_id in affected:
+        rows.append({"ancestor_id": user_id, "descendant_id": user_id, "depth": 0})
+        for depth, ancestor_id in enumerate(chain(user_id), start=1):
+            rows.append({"ancestor_id": ancestor_id, "descendant_id": user_id, "depth": depth})
+
+    for chunk in services._chunks(affected):
+        db.query(Closure).filter(Closure.descendant_id.in_(chunk)).delete(synchronize_session=False)
+    if rows:
+        db.execute(insert(Closure), rows)
\ No newline at end of file
@@ -0,0 +1,176 @@
+"""
+Maintenance commands for the KPIs Tracker backend.
+
+Usage:
+    python manage.py migrate
+    python manage.py rebuild-rollups [--period YYYY-MM]
+    python manage.py rebuild-hierarchy
+    python manage.py verify-hierarchy
+    python manage.py archive-audit [--days N] [--batch-size N]
+    python manage.py evaluate [--period YYYY-MM] [--role-id N] [--workers N]
+    python manage.py reevaluate
+"""
+import argparse
+from sqlalchemy import inspect, text
+from database import engine, Base, SessionLocal
+import models
+import services
+import hierarchy
+import audit_archive
+import automation
+from datetime import datetime, timezone
+
+def _parse_period(value: str):
+    year, month = value.split("-")
+    return int(month), int(year)
+
+def migrate(args):
+    """
+    Brings an existing SQLite/Postgres database up to the current models.
+    create_all() only creates missing tables, so nullable columns and
+    indexes added to tables that already exist are created here.
+    """
+    inspector = inspect(engine)
+    added = 0
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                    print(f"Added column {table.name}.{column.name}")
+                    added += 1
+    if added:
+        inspector = inspect(engine)
+
+    created = 0
+    for table in Base.metadata.sorted_tables:
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            if index.name not in existing:
+                if index.name == "uq_automation_user_period":
+                    # Older versions inserted a new row on every evaluation
+                    db = SessionLocal()
+                    try:
+                        print(f"Removed {automation.dedupe_recommendations(db)} duplicate recommendation(s).")
+                    finally:
+                        db.close()
+                index.create(bind=engine)
+                print(f"Created index {index.name} on {table.name}")
+                created += 1
+    print(f"Migration complete: {created} index(es) created.")
+
+    # Backfill the hierarchy closure and score rollups when they are missing or incomplete
+    db = SessionLocal()
+    try:
+        built = hierarchy.ensure_closure(db)
+        if built:
+            print(f"Built hierarchy closure: {built} rows.")
+        built = services.ensure_score_rollups(db)
+        if built:
+            print(f"Built {built} score rollup rows.")
+    finally:
+        db.close()
+
+def rebuild_rollups(args):
+    db = SessionLocal()
+    try:
+        if args.period:
+            month, year = _parse_period(args.period)
+            written = services.rebuild_score_rollups(db, month, year)
+        else:
+            written = services.rebuild_score_rollups(db)
+        print(f"Rebuilt {written} score rollup rows.")
+    finally:
+        db.close()
+
+def rebuild_hierarchy(args):
+    db = SessionLocal()
+    try:
+        print(f"Rebuilt {hierarchy.rebuild_closure(db)} hierarchy closure rows.")
+    finally:
+        db.close()
+
+def verify_hierarchy(args):
+    db = SessionLocal()
+    try:
+        problems = hierarchy.verify_closure(db)
+    finally:
+        db.close()
+    if not any(problems.values()):
+        print("Hierarchy closure is consistent with users.manager_id.")
+        return
+    for kind, pairs in problems.items():
+        if pairs:
+            print(f"{kind}: {len(pairs)} (ancestor, descendant) pairs, e.g. {pairs[:5]}")
+    raise SystemExit("Hierarchy closure is inconsistent; run 'python manage.py rebuild-hierarchy'.")
+
+def archive_audit(args):
+    result = audit_archive.archive_old_logs(days=args.days, batch_size=args.batch_size)
+    print(f"Archived {result['rows']} audit rows older than {result['cutoff']} into {result['files']} file(s).")
+
+def evaluate(args):
+    now = datetime.now(timezone.utc)
+    month, year = _parse_period(args.period) if args.period else (now.month, now.year)
+    db = SessionLocal()
+    try:
+        result = automation.evaluate_period(db, month, year, role_id=args.role_id, workers=args.workers)
+    finally:
+        db.close()
+    buckets = ", ".join(f"{label}: {count}" for label, count in result["buckets"].items())
+    print(f"Evaluated {result['evaluated']} users for {result['period']} ({buckets}).")
+    print(f"Recommendations: {result['created']} created, {result['updated']} updated, {result['removed']} removed.")
+
+def reevaluate(args):
+    db = SessionLocal()
+    try:
+        result = automation.reevaluate_dirty(db)
+    finally:
+        db.close()
+    print(f"Re-evaluated {result['users']} flagged users in {len(result['periods'])} period(s); "
+          f"{result['changed']} changed recommendation.")
+    for transition, count in sorted(result["transitions"].items()):
+        print(f"  {transition}: {count}")
+    if result["skipped"]:
+        print(f"Dropped {result['skipped']} flag(s) for periods that were never evaluated.")
+
+def main():
+    parser = argparse.ArgumentParser(description="KPIs Tracker maintenance commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("migrate", help="Create missing tables and indexes on an existing database")
+    p.set_defaults(func=migrate)
+
+    p = sub.add_parser("rebuild-rollups", help="Recompute kpi_score_rollups from verified achievements")
+    p.add_argument("--period", help="Only rebuild one month, e.g. 2025-12")
+    p.set_defaults(func=rebuild_rollups)
+
+    p = sub.add_parser("rebuild-hierarchy", help="Recompute user_hierarchy_closure from users.manager_id")
+    p.set_defaults(func=rebuild_hierarchy)
+
+    p = sub.add_parser("verify-hierarchy", help="Check user_hierarchy_closure against users.manager_id")
+    p.set_defaults(func=verify_hierarchy)
+
+    p = sub.add_parser("archive-audit", help="Move old audit_logs rows into compressed monthly archive files")
+    p.add_argument("--days", type=int, help=f"Keep this many days in the database (default {audit_archive.AUDIT_RETENTION_DAYS})")
+    p.add_argument("--batch-size", type=int, help=f"Rows moved per transaction (default {audit_archive.AUDIT_ARCHIVE_BATCH_SIZE})")
+    p.set_defaults(func=archive_audit)
+
+    p = sub.add_parser("evaluate", help="Score every user for a period and upsert their recommendations")
+    p.add_argument("--period", help="Month to evaluate, e.g. 2025-12 (default: current month)")
+    p.add_argument("--role-id", type=int, help="Only evaluate users with this role")
+    p.add_argument("--workers", type=int, help=f"Scoring processes (default {automation.EVALUATION_WORKERS})")
+    p.set_defaults(func=evaluate)
+
+    p = sub.add_parser("reevaluate", help="Re-score only users flagged since the last evaluation and update their recommendations")
+    p.set_defaults(func=reevaluate)
+
+    args = parser.parse_args()
+    Base.metadata.create_all(bind=engine)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
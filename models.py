@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Float, Enum, JSON
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Float, Enum, JSON, UniqueConstraint, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -20,10 +20,17 @@ class Role(Base):
 class RolePermission(Base):
     __tablename__ = "role_permissions"
     id = Column(Integer, primary_key=True, index=True)
-    role_id = Column(Integer, ForeignKey("roles.id"), nullable=False)
+    role_id = Column(Integer, ForeignKey("roles.id"), nullable=False, index=True)
     permission_name = Column(String, nullable=False)
     role = relationship("Role", back_populates="permissions")
 
+class CacheVersion(Base):
+    """Named, monotonically increasing counters that let every worker notice shared-data changes."""
+    __tablename__ = "cache_versions"
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -31,13 +38,24 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     password_hash = Column(String, nullable=False)
     role_id = Column(Integer, ForeignKey("roles.id"), nullable=True) # Changed to nullable for bootstrap
-    manager_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    manager_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
     manager = relationship("User", remote_side=[id], backref="subordinates")
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     # Hierarchy Field
     # Relationships
 
+class HierarchyClosure(Base):
+    """Transitive closure of User.manager_id: one row per (ancestor, descendant) pair, self rows at depth 0."""
+    __tablename__ = "user_hierarchy_closure"
+    __table_args__ = (
+        Index("ix_user_hierarchy_closure_descendant", "descendant_id", "depth"),
+    )
+
+    ancestor_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    depth = Column(Integer, nullable=False)
+
 class MeasurementType(str, enum.Enum):
     COUNT = "COUNT"
     AMOUNT = "AMOUNT"
@@ -66,6 +84,9 @@ class KPI(Base):
 
 class KPIOverride(Base):
     __tablename__ = "kpi_overrides"
+    __table_args__ = (
+        Index("ix_kpi_overrides_user_kpi", "user_id", "kpi_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -83,6 +104,12 @@ class AchievementStatus(str, enum.Enum):
 
 class Achievement(Base):
     __tablename__ = "achievements"
+    __table_args__ = (
+        # Serves per-user/KPI verified sums over a [start, end) date range
+        Index("ix_achievements_user_kpi_status_date", "user_id", "kpi_id", "status", "achievement_date"),
+        # Serves date-range exports of raw achievements
+        Index("ix_achievements_date", "achievement_date", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -101,6 +128,20 @@ class Achievement(Base):
     verifier = relationship("User", foreign_keys="[Achievement.verifier_id]", backref="verified_achievements")
     kpi = relationship("KPI")
 
+class KPIScoreRollup(Base):
+    """Running total of VERIFIED achievement values per user/KPI/month."""
+    __tablename__ = "kpi_score_rollups"
+    __table_args__ = (
+        UniqueConstraint("user_id", "kpi_id", "period", name="uq_rollup_user_kpi_period"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kpi_id = Column(Integer, ForeignKey("kpis.id"), nullable=False)
+    period = Column(String, nullable=False) # e.g., "2025-12"
+    verified_sum = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
 class ActionType(str, enum.Enum):
     CREATE = "CREATE"
     UPDATE = "UPDATE"
@@ -116,6 +157,14 @@ class EntityType(str, enum.Enum):
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    __table_args__ = (
+        # Keyset pagination walks (created_at, id) newest-first; each filter gets
+        # an index with its equality columns first so the page is an index range scan.
+        Index("ix_audit_logs_created_id", "created_at", "id"),
+        Index("ix_audit_logs_user_created", "user_id", "created_at", "id"),
+        Index("ix_audit_logs_action_created", "action_type", "created_at", "id"),
+        Index("ix_audit_logs_entity_created", "entity_type", "entity_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True) # Nullable for system actions
@@ -148,6 +197,42 @@ class AutomationRule(Base):
 
     user = relationship("User")
 
+    __table_args__ = (
+        # One recommendation per user per period; evaluations upsert onto it
+        Index("uq_automation_user_period", "user_id", "period", unique=True),
+        # Listing pages newest period first by (period, id), optionally filtered by type
+        Index("ix_automation_period_recommendation", "period", "recommendation", "id"),
+        Index("ix_automation_period_id", "period", "id"),
+    )
+
+class DirtyEvaluation(Base):
+    """(user, period) pairs whose recommendation may be stale since the last evaluation."""
+    __tablename__ = "dirty_evaluations"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    period = Column(String, primary_key=True)
+    marked_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index("ix_dirty_evaluations_period", "period", "user_id"),
+    )
+
+class ScoreBandRule(Base):
+    """
+    One recommendation rule; see score_rules.py for how a role's set is applied.
+    role_id NULL = the set for roles without their own rules.
+    """
+    __tablename__ = "score_band_rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    role_id = Column(Integer, ForeignKey("roles.id"), nullable=True, index=True)
+    min_score = Column(Float, nullable=True) # Inclusive; NULL = no lower bound
+    max_score = Column(Float, nullable=True) # Exclusive; condition rules only, NULL = no upper bound
+    consecutive_periods = Column(Integer, nullable=False, default=1) # 1 = plain score band
+    recommendation = Column(Enum(RecommendationType), nullable=True) # NULL = satisfactory
+    position = Column(Integer, nullable=False, default=0) # Order among condition rules
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
 class PasswordResetToken(Base):
     __tablename__ = "password_reset_tokens"
     
@@ -158,4 +243,72 @@ class PasswordResetToken(Base):
     used = Column(Boolean, default=False)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+
+
+class ReportJobStatus(str, enum.Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+
+class ReportJob(Base):
+    """Background export; the rendered file lives on local disk until expires_at."""
+    __tablename__ = "report_jobs"
+    __table_args__ = (
+        # Finds an in-flight job for the same report to coalesce onto
+        Index("ix_report_jobs_format_period_status", "format", "period", "status"),
+        # At most one in-flight job per report, across every API worker
+        Index("uq_report_jobs_in_flight", "params_hash", unique=True,
+              sqlite_where=text("status IN ('PENDING', 'RUNNING')"),
+              postgresql_where=text("status IN ('PENDING', 'RUNNING')")),
+    )
+
+    id = Column(String, primary_key=True) # uuid4 hex
+    format = Column(String, nullable=False) # "excel" or "pdf"
+    period = Column(String, nullable=False) # e.g., "2025-12"
+    params_hash = Column(String, nullable=True) # sha256 of everything that determines the output
+    status = Column(Enum(ReportJobStatus), nullable=False, default=ReportJobStatus.PENDING)
+    rows_total = Column(Integer, nullable=True)
+    rows_done = Column(Integer, nullable=False, default=0)
+    artifact_path = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    requested_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=True)
+
+class JobRunStatus(str, enum.Enum):
+    RUNNING = "RUNNING"
+    SUCCEEDED = "SUCCEEDED"
+    FAILED = "FAILED"
+
+class ScheduledJob(Base):
+    """
+    One row per scheduler job: the shared next fire time plus the lease that
+    lets exactly one API worker run it (see scheduler.py).
+    """
+    __tablename__ = "scheduled_jobs"
+
+    name = Column(String, primary_key=True)
+    schedule = Column(String, nullable=False) # Cron expression, UTC
+    next_run_at = Column(DateTime, nullable=False)
+    lease_holder = Column(String, nullable=True)
+    lease_until = Column(DateTime, nullable=True)
+
+class JobRun(Base):
+    """History of scheduler runs: who ran a job, how long it took and how it ended."""
+    __tablename__ = "job_runs"
+    __table_args__ = (
+        Index("ix_job_runs_job_started", "job_name", "started_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_name = Column(String, nullable=False)
+    holder = Column(String, nullable=False)
+    status = Column(Enum(JobRunStatus), nullable=False, default=JobRunStatus.RUNNING)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    detail = Column(String, nullable=True) # Job summary, or the error for failed runs
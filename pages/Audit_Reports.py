@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+import time
 
 API_URL = "http://13.61.15.68:8000"
 
@@ -14,40 +15,138 @@ if st.session_state.user.get('role_id') != 1:
 headers = {"Authorization": f"Bearer {st.session_state.token}"}
 st.title("📜 Reports & Audits")
 
+REPORT_FORMATS = {
+    "excel": ("performance_report.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "pdf": ("performance_summary.pdf", "application/pdf"),
+}
+
+def queue_report(fmt):
+    res = requests.post(f"{API_URL}/reports/jobs", json={"format": fmt}, headers=headers)
+    if res.status_code == 202:
+        st.session_state[f"report_job_{fmt}"] = res.json()["id"]
+    else:
+        st.error(f"Failed to queue {fmt} report.")
+
+def render_report_job(fmt):
+    """Polls the background job for this format and offers the file once it is ready."""
+    job_id = st.session_state.get(f"report_job_{fmt}")
+    if not job_id:
+        return False
+    res = requests.get(f"{API_URL}/reports/jobs/{job_id}", headers=headers)
+    if res.status_code != 200:
+        st.error("Report job not found.")
+        st.session_state.pop(f"report_job_{fmt}")
+        return False
+    job = res.json()
+    if job["status"] in ("PENDING", "RUNNING"):
+        st.progress(job["progress"] / 100, text=f"{job['status'].title()}... {job['progress']:.0f}%")
+        return True
+    if job["status"] == "FAILED":
+        st.error(f"Report failed: {job['error']}")
+        return False
+    file_res = requests.get(f"{API_URL}{job['download_url']}", headers=headers)
+    if file_res.status_code == 200:
+        file_name, mime = REPORT_FORMATS[fmt]
+        st.download_button(label="📥 Download File", data=file_res.content, file_name=file_name, mime=mime)
+    else:
+        st.warning("Report expired, generate it again.")
+        st.session_state.pop(f"report_job_{fmt}")
+    return False
+
 col1, col2 = st.columns(2)
+pending_jobs = False
 
 # --- EXCEL EXPORT ---
 with col1:
     st.info("📄 **Excel Report**")
     st.write("Detailed breakdown of all user scores, achievements, and weighted averages.")
     if st.button("Generate Excel Report"):
-        res = requests.get(f"{API_URL}/reports/export?format=excel", headers=headers)
-        if res.status_code == 200:
-            st.download_button(
-                label="📥 Download Excel File",
-                data=res.content,
-                file_name="performance_report.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-        else:
-            st.error("Failed to generate Excel report.")
+        queue_report("excel")
+    pending_jobs |= render_report_job("excel")
 
 # --- PDF EXPORT ---
 with col2:
     st.info("📕 **PDF Summary**")
     st.write("Executive summary suitable for management review and printing.")
     if st.button("Generate PDF Report"):
-        res = requests.get(f"{API_URL}/reports/export?format=pdf", headers=headers)
-        if res.status_code == 200:
-            st.download_button(
-                label="📥 Download PDF File",
-                data=res.content,
-                file_name="performance_summary.pdf",
-                mime="application/pdf"
-            )
-        else:
-            st.error("Failed to generate PDF report.")
+        queue_report("pdf")
+    pending_jobs |= render_report_job("pdf")
 
 st.divider()
 st.subheader("System Audit Log")
-st.write("Access logs and write-operations history (Coming in Module 15).")
\ No newline at end of file
+st.write("Access logs and write-operations history, newest first.")
+
+ACTION_TYPES = ["All", "CREATE", "UPDATE", "DELETE", "VERIFY", "LOGIN"]
+ENTITY_TYPES = ["All", "USER", "KPI", "ACHIEVEMENT", "OVERRIDE"]
+
+with st.form("audit_filters"):
+    f1, f2, f3 = st.columns(3)
+    with f1:
+        action_type = st.selectbox("Action", ACTION_TYPES)
+        user_id = st.number_input("Actor user ID (0 = any)", min_value=0, step=1)
+    with f2:
+        entity_type = st.selectbox("Entity", ENTITY_TYPES)
+        entity_id = st.number_input("Entity ID (0 = any)", min_value=0, step=1)
+    with f3:
+        date_from = st.date_input("From", value=None)
+        date_to = st.date_input("To (exclusive)", value=None)
+    apply_filters = st.form_submit_button("Search")
+
+filters = {"limit": 100}
+if action_type != "All":
+    filters["action_type"] = action_type
+if entity_type != "All":
+    filters["entity_type"] = entity_type
+if user_id:
+    filters["user_id"] = int(user_id)
+if entity_id:
+    filters["entity_id"] = int(entity_id)
+if date_from:
+    filters["from"] = date_from.isoformat()
+if date_to:
+    filters["to"] = date_to.isoformat()
+
+def fetch_audit_page(params, cursor=None):
+    res = requests.get(
+        f"{API_URL}/audit",
+        headers=headers,
+        params={**params, "cursor": cursor} if cursor else params
+    )
+    if res.status_code != 200:
+        st.error("Failed to load audit log.")
+        return [], None
+    data = res.json()
+    return data["items"], data["next_cursor"]
+
+# Rows accumulate across "Load more" clicks until the filters change
+if apply_filters or st.session_state.get("audit_filters") != filters:
+    st.session_state.audit_filters = filters
+    st.session_state.audit_rows, st.session_state.audit_cursor = fetch_audit_page(filters)
+
+if st.session_state.audit_rows:
+    st.dataframe(
+        [{
+            "When": row["created_at"],
+            "Actor": row["user_name"] or (f"User {row['user_id']}" if row["user_id"] else "System"),
+            "Action": row["action_type"],
+            "Entity": row["entity_type"],
+            "Entity ID": row["entity_id"],
+            "Description": row["description"],
+        } for row in st.session_state.audit_rows],
+        use_container_width=True,
+        hide_index=True
+    )
+    st.caption(f"Showing {len(st.session_state.audit_rows)} entries")
+else:
+    st.info("No audit entries match these filters.")
+
+if st.session_state.audit_cursor and st.button("Load more"):
+    rows, cursor = fetch_audit_page(filters, st.session_state.audit_cursor)
+    st.session_state.audit_rows += rows
+    st.session_state.audit_cursor = cursor
+    st.rerun()
+
+# Keep polling while a report is still rendering
+if pending_jobs:
+    time.sleep(2)
+    st.rerun()
@@ -50,6 +50,21 @@ with col3:
 
 st.divider()
 
+# Everyone below the manager (all levels)
+subtree = data.get("subtree")
+if subtree and subtree["count"]:
+    st.header("🏢 Organization Below Me")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("People", subtree["count"])
+    with col2:
+        st.metric("Average Score", f"{subtree['average']:.2f}")
+    with col3:
+        st.metric("Min / Max", f"{subtree['min']:.0f} / {subtree['max']:.0f}")
+    with col4:
+        st.metric(f"Below {subtree['threshold']:.0f}", subtree["below_threshold"])
+    st.divider()
+
 # Team performance
 st.header("👥 Team Performance")
 team_data = data["team"]
@@ -89,6 +104,17 @@ if team_data:
             "Score": [m["total_weighted_score"] for m in team_data]
         })
         st.bar_chart(chart_data.set_index("Name"))
+
+    # Team trend (last 12 months, single request)
+    st.subheader("Team Score Trend")
+    history_resp = requests.get(
+        f"{API_BASE}/dashboard/score/history",
+        params={"scope": "team", "to": f"{year}-{month:02d}"},
+        headers=api_headers()
+    )
+    if history_resp.status_code == 200:
+        trend_df = pd.DataFrame(history_resp.json()["periods"])
+        st.line_chart(trend_df.set_index("period")[["average", "min", "max"]])
 else:
     st.info("No team members assigned yet")
 
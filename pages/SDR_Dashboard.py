@@ -51,6 +51,22 @@ with col4:
 
 st.divider()
 
+# Score trend (last 12 months, single request)
+st.header("📉 Score Trend")
+history_resp = requests.get(
+    f"{API_BASE}/users/{current_user['id']}/score/history",
+    params={"to": f"{year}-{month:02d}"},
+    headers=api_headers()
+)
+if history_resp.status_code == 200:
+    history = history_resp.json()["history"]
+    trend_df = pd.DataFrame(history).rename(columns={"total_weighted_score": "Score"})
+    st.line_chart(trend_df.set_index("period"))
+else:
+    st.info("Score history unavailable")
+
+st.divider()
+
 # KPI Details
 st.header("🎯 My KPIs")
 
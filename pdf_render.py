@@ -0,0 +1,105 @@
+from io import BytesIO
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+
+# Kept free of pandas/SQLAlchemy imports: reports.py ships page ranges to
+# spawned worker processes that only need to import this module.
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+MARGIN = 48
+HEADER_HEIGHT = 46
+LINE_HEIGHT = 13
+LINES_PER_PAGE = int((PAGE_HEIGHT - 2 * MARGIN - HEADER_HEIGHT) // LINE_HEIGHT)
+
+# The body is set in a monospaced font, one string per line, so each page is a
+# single text object instead of one object per table cell.
+FONT_SIZE = 8
+LINE_CHARS = int((PAGE_WIDTH - 2 * MARGIN) / (0.6 * FONT_SIZE)) # Courier glyphs are 0.6em wide
+KPI_NAME_CHARS = LINE_CHARS - 2 - 4 * 11
+
+def _kpi_line(kpi_name, target, achieved, completion, points):
+    return (f"  {str(kpi_name)[:KPI_NAME_CHARS]:<{KPI_NAME_CHARS}}"
+            f"{target:>11g}{achieved:>11g}{completion:>11.0%}{points:>11.2f}")
+
+def _spread(left: str, right: str):
+    """left and right justified on one line."""
+    return left[:LINE_CHARS - len(right) - 1].ljust(LINE_CHARS - len(right)) + right
+
+TABLE_HEADER = f"  {'KPI':<{KPI_NAME_CHARS}}{'Target':>11}{'Achieved':>11}{'Completion':>11}{'Points':>11}"
+
+def _user_block(user):
+    """Lines for one user: a header line followed by one line per KPI."""
+    user_id, full_name, score, parts = user
+    lines = [("user", user_id, full_name, score, False)]
+    for kpi_name, target, achieved, points in parts:
+        completion = min(achieved / target, 1.0) if target > 0 else 0.0
+        lines.append(("kpi", kpi_name, target, achieved, completion, points))
+    if not parts:
+        lines.append(("note", "No KPIs assigned to this user's role"))
+    return lines
+
+def paginate(users, summary_lines=()):
+    """
+    Splits users into pages of at most LINES_PER_PAGE lines. A user's block
+    is moved to the next page rather than split, unless it is longer than a
+    whole page, in which case it continues with a "(cont.)" header.
+    """
+    pages, page = [], [("text", line) for line in summary_lines]
+    if page:
+        page.append(("blank",))
+    for user in users:
+        block = _user_block(user)
+        if len(page) + len(block) > LINES_PER_PAGE and len(block) <= LINES_PER_PAGE and page:
+            pages.append(page)
+            page = []
+        for line in block:
+            if len(page) == LINES_PER_PAGE:
+                pages.append(page)
+                page = [] if line[0] == "user" else [("user",) + block[0][1:4] + (True,)]
+            page.append(line)
+    if page:
+        pages.append(page)
+    return pages
+
+def _draw_header(c, title, page_no, total_pages):
+    top = PAGE_HEIGHT - MARGIN
+    c.setFont("Helvetica-Bold", 13)
+    c.drawString(MARGIN, top - 12, title)
+    c.setFont("Helvetica", 8)
+    c.drawRightString(PAGE_WIDTH - MARGIN, top - 12, f"Page {page_no} of {total_pages}")
+    c.setFont("Courier-Bold", FONT_SIZE)
+    c.drawString(MARGIN, top - 34, TABLE_HEADER)
+    c.line(MARGIN, top - 38, PAGE_WIDTH - MARGIN, top - 38)
+
+# (font, text) for each kind of line produced by paginate()
+def _format_line(line):
+    kind = line[0]
+    if kind == "user":
+        _, user_id, full_name, score, cont = line
+        return "Courier-Bold", _spread(f"{full_name} (ID {user_id}){' (cont.)' if cont else ''}", f"Score: {score:.2f}")
+    if kind == "kpi":
+        return "Courier", _kpi_line(*line[1:])
+    if kind == "note":
+        return "Courier-Oblique", f"  {line[1]}"
+    if kind == "text":
+        return "Courier", line[1]
+    return "Courier", ""
+
+def render_pages(pages, first_page_no: int, total_pages: int, title: str):
+    """Draws a contiguous run of pages (from paginate()) and returns the PDF bytes."""
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter, pageCompression=1)
+    for offset, page in enumerate(pages):
+        _draw_header(c, title, first_page_no + offset, total_pages)
+        text = c.beginText(MARGIN, PAGE_HEIGHT - MARGIN - HEADER_HEIGHT - LINE_HEIGHT)
+        current_font = None
+        for line in page:
+            font, content = _format_line(line)
+            if font != current_font:
+                text.setFont(font, FONT_SIZE, LINE_HEIGHT)
+                current_font = font
+            text.textLine(content)
+        c.drawText(text)
+        c.showPage()
+    c.save()
+    return buffer.getvalue()
@@ -0,0 +1,137 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from sqlalchemy.orm import Session
+import models
+import auth
+import hashlib
+import json
+import os
+import uuid
+
+# Finished exports are kept on local disk under a key derived from everything
+# that determines their bytes: format, dataset, period range, fields and the
+# shared "report_data" version. Every write to achievements, KPIs, overrides
+# or users bumps that version in the writer's transaction, so a cached file
+# can never be served after the data behind it changed.
+DATA_VERSION_KEY = "report_data"
+REPORT_CACHE_ENABLED = os.environ.get("REPORT_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+REPORT_CACHE_DIR = os.environ.get("REPORT_CACHE_DIR", "report_cache")
+REPORT_CACHE_MAX_BYTES = int(os.environ.get("REPORT_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+def bump_data_version(db: Session):
+    """Marks report inputs as changed. Does not commit; call before the writer's db.commit()."""
+    auth.bump_version(db, DATA_VERSION_KEY)
+
+def data_version(db: Session):
+    """(version, last_modified) of the report data; last_modified is an aware UTC datetime."""
+    row = db.query(models.CacheVersion.version, models.CacheVersion.updated_at).filter(
+        models.CacheVersion.name == DATA_VERSION_KEY
+    ).first()
+    if not row:
+        return 0, datetime(1970, 1, 1, tzinfo=timezone.utc)
+    version, updated_at = row
+    updated_at = updated_at or datetime(1970, 1, 1)
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return version, updated_at.replace(microsecond=0)
+
+class CachedReport:
+    """Cache entry for one export request at one data version."""
+
+    def __init__(self, version: int, last_modified: datetime, extension: str, **key_parts):
+        self.version = version
+        self.last_modified = last_modified
+        raw = json.dumps({"v": version, **key_parts}, sort_keys=True)
+        self.key = hashlib.sha256(raw.encode()).hexdigest()
+        self.etag = f'"{self.key[:32]}"'
+        self.path = os.path.join(REPORT_CACHE_DIR, f"{version}-{self.key}{extension}")
+
+    @property
+    def headers(self):
+        return {
+            "ETag": self.etag,
+            "Last-Modified": format_datetime(self.last_modified, usegmt=True),
+            "Cache-Control": "private, no-cache", # Always revalidate; 304s are cheap
+        }
+
+    def not_modified(self, if_none_match: str = None, if_modified_since: str = None) -> bool:
+        """Conditional-request check; If-None-Match wins over If-Modified-Since as in RFC 9110."""
+        if if_none_match:
+            tags = [t.strip() for t in if_none_match.split(",")]
+            return "*" in tags or self.etag in tags or f"W/{self.etag}" in tags
+        if if_modified_since:
+            try:
+                return self.last_modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def exists(self) -> bool:
+        if not (REPORT_CACHE_ENABLED and os.path.exists(self.path)):
+            return False
+        os.utime(self.path) # Recently used files survive eviction
+        return True
+
+    def store(self, content: bytes):
+        if REPORT_CACHE_ENABLED:
+            tmp = self._tmp_path()
+            with open(tmp, "wb") as f:
+                f.write(content)
+            self._commit(tmp)
+        return content
+
+    def tee(self, chunks):
+        """Passes a streamed body through while saving it; only a fully sent body is cached."""
+        if not REPORT_CACHE_ENABLED:
+            yield from chunks
+            return
+        tmp = self._tmp_path()
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._commit(tmp)
+
+    def _tmp_path(self):
+        os.makedirs(REPORT_CACHE_DIR, exist_ok=True)
+        return f"{self.path}.{uuid.uuid4().hex}.tmp"
+
+    def _commit(self, tmp: str):
+        os.replace(tmp, self.path)
+        evict(self.version)
+
+def evict(current_version: int):
+    """Drops entries from older data versions, then least-recently-used files beyond the size budget."""
+    try:
+        names = os.listdir(REPORT_CACHE_DIR)
+    except FileNotFoundError:
+        return
+    entries = []
+    for name in names:
+        if name.endswith(".tmp"):
+            continue
+        path = os.path.join(REPORT_CACHE_DIR, name)
+        version = name.split("-", 1)[0]
+        try:
+            if version.isdigit() and int(version) < current_version:
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue # Removed by another worker
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _mtime, size, _path in entries)
+    for _mtime, size, path in sorted(entries):
+        if total <= REPORT_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
@@ -0,0 +1,264 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone, timedelta
+from functools import partial
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import SessionLocal, engine
+import models
+import reports
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+
+# Exports render in separate processes so a large org never ties up an API
+# worker. Job state lives in the report_jobs table (any API worker can answer
+# status polls) and finished files sit in REPORT_JOB_DIR until they expire.
+REPORT_JOB_DIR = os.environ.get("REPORT_JOB_DIR", "report_artifacts")
+REPORT_JOB_WORKERS = int(os.environ.get("REPORT_JOB_WORKERS", "2"))
+REPORT_JOB_TTL = int(os.environ.get("REPORT_JOB_TTL", "3600")) # Seconds a finished file is kept
+# In-flight jobs older than this are assumed lost (e.g. server restart) and marked FAILED
+REPORT_JOB_STALE_AFTER = int(os.environ.get("REPORT_JOB_STALE_AFTER", "1800"))
+PROGRESS_EVERY = 1000
+
+FORMATS = {
+    "excel": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "pdf": (".pdf", "application/pdf"),
+}
+
+Status = models.ReportJobStatus
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# ==================== PARENT SIDE ====================
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: children start clean instead of inheriting the API's threads and DB connections
+            _executor = ProcessPoolExecutor(
+                max_workers=REPORT_JOB_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+def params_hash(format: str, period: str):
+    return hashlib.sha256(json.dumps({"format": format, "period": period}, sort_keys=True).encode()).hexdigest()
+
+def submit_job(db: Session, format: str, month: int, year: int, requested_by: int = None):
+    """
+    Queues a render, or returns the in-flight job for the same (format, period)
+    so identical concurrent requests share one render. The unique in-flight
+    index on params_hash makes this hold across API workers: the insert
+    either wins or fails and the winner's row is returned. Returns (job, created).
+    """
+    period = f"{year}-{month:02d}"
+    key = params_hash(format, period)
+    fail_stale(db, key)
+    for _attempt in range(3):
+        job = models.ReportJob(
+            id=uuid.uuid4().hex, format=format, period=period, params_hash=key,
+            status=Status.PENDING, requested_by=requested_by, created_at=_utcnow()
+        )
+        db.add(job)
+        try:
+            db.commit()
+            break
+        except IntegrityError:
+            db.rollback()
+        existing = db.query(models.ReportJob).filter(
+            models.ReportJob.params_hash == key,
+            models.ReportJob.status.in_([Status.PENDING, Status.RUNNING])
+        ).first()
+        if existing:
+            return existing, False
+        # The in-flight job finished between our insert and the lookup; try again
+    else:
+        raise RuntimeError(f"Could not queue {format} report for {period}")
+
+    future = _get_executor().submit(render_job, job.id, format, month, year, REPORT_JOB_DIR)
+    future.add_done_callback(partial(_on_done, job.id))
+    return job, True
+
+def _on_done(job_id: str, future):
+    """Records failures the child could not record itself (crash, pool shutdown)."""
+    if future.cancelled() or future.exception() is not None:
+        error = "Cancelled" if future.cancelled() else f"Worker failed: {future.exception()}"
+        _mark_failed(job_id, error)
+
+def _mark_failed(job_id: str, error: str):
+    with engine.begin() as conn:
+        conn.execute(
+            update(models.ReportJob)
+            .where(models.ReportJob.id == job_id, models.ReportJob.status.in_([Status.PENDING, Status.RUNNING]))
+            .values(status=Status.FAILED, error=error[:500], finished_at=_utcnow())
+        )
+
+def fail_stale(db: Session, key: str = None):
+    """
+    Marks in-flight jobs that made no progress for REPORT_JOB_STALE_AFTER
+    seconds as FAILED (their worker died, or the server restarted before the
+    pool picked them up), which frees their report for a new job. A PENDING
+    job's last progress is its creation; a RUNNING job's is its start or the
+    latest write of its progress file, whichever is newer.
+    Returns how many were marked.
+    """
+    cutoff = _utcnow() - timedelta(seconds=REPORT_JOB_STALE_AFTER)
+    pending = update(models.ReportJob).where(
+        models.ReportJob.status == Status.PENDING, models.ReportJob.created_at < cutoff
+    )
+    running = db.query(models.ReportJob.id).filter(
+        models.ReportJob.status == Status.RUNNING, models.ReportJob.started_at < cutoff
+    )
+    if key is not None:
+        pending = pending.where(models.ReportJob.params_hash == key)
+        running = running.filter(models.ReportJob.params_hash == key)
+    stalled = [job_id for (job_id,) in running.all() if _last_progress(job_id) < cutoff]
+
+    values = {"status": Status.FAILED, "error": "Timed out", "finished_at": _utcnow()}
+    marked = db.execute(pending.values(**values)).rowcount
+    if stalled:
+        marked += db.execute(
+            update(models.ReportJob)
+            .where(models.ReportJob.id.in_(stalled), models.ReportJob.status == Status.RUNNING)
+            .values(**values)
+        ).rowcount
+    db.commit()
+    return marked
+
+def _last_progress(job_id: str):
+    """Naive UTC time of the job's last progress-file write, or datetime.min when there is none."""
+    try:
+        mtime = os.path.getmtime(_progress_path(REPORT_JOB_DIR, job_id))
+    except FileNotFoundError:
+        return datetime.min
+    return datetime.fromtimestamp(mtime, timezone.utc).replace(tzinfo=None)
+
+def purge_expired(db: Session):
+    """Deletes expired artifacts and their job rows. Returns how many jobs were removed."""
+    now = _utcnow()
+    expired = db.query(models.ReportJob).filter(
+        models.ReportJob.expires_at.isnot(None), models.ReportJob.expires_at < now
+    ).all()
+    for job in expired:
+        if job.artifact_path and os.path.exists(job.artifact_path):
+            os.remove(job.artifact_path)
+        db.delete(job)
+    db.commit()
+    return len(expired)
+
+def _progress_path(artifact_dir: str, job_id: str):
+    return os.path.join(artifact_dir, f"{job_id}.progress")
+
+def _read_progress(job: models.ReportJob):
+    try:
+        with open(_progress_path(REPORT_JOB_DIR, job.id), encoding="utf-8") as f:
+            return int(f.read() or 0)
+    except (FileNotFoundError, ValueError):
+        return job.rows_done
+
+def is_expired(job: models.ReportJob):
+    return job.expires_at is not None and job.expires_at < _utcnow()
+
+def job_status(job: models.ReportJob):
+    rows_done = _read_progress(job) if job.status == Status.RUNNING else job.rows_done
+    progress = 100.0 if job.status == Status.DONE else (
+        round(100.0 * rows_done / job.rows_total, 1) if job.rows_total else 0.0
+    )
+    return {
+        "id": job.id,
+        "format": job.format,
+        "period": job.period,
+        "status": job.status,
+        "progress": progress,
+        "rows_done": rows_done,
+        "rows_total": job.rows_total,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+        "expires_at": job.expires_at,
+        "download_url": f"/reports/jobs/{job.id}/file" if job.status == Status.DONE else None,
+    }
+
+# ==================== CHILD SIDE ====================
+
+def _tracked(progress_path: str, rows):
+    """
+    Passes rows through, writing the running count to a small file every
+    PROGRESS_EVERY rows. Progress stays off the database so the job never
+    writes while its own export cursor is open (SQLite would deadlock).
+    """
+    done = 0
+    for row in rows:
+        yield row
+        done += 1
+        if done % PROGRESS_EVERY == 0:
+            with open(f"{progress_path}.tmp", "w", encoding="utf-8") as f:
+                f.write(str(done))
+            os.replace(f"{progress_path}.tmp", progress_path)
+
+def render_job(job_id: str, format: str, month: int, year: int, artifact_dir: str):
+    """Runs in a pool process: renders the report to artifact_dir and records the outcome on the job row."""
+    db = SessionLocal()
+    try:
+        # Only a job still PENDING starts; one already timed out by fail_stale is dropped
+        started = db.execute(
+            update(models.ReportJob)
+            .where(models.ReportJob.id == job_id, models.ReportJob.status == Status.PENDING)
+            .values(status=Status.RUNNING, started_at=_utcnow(),
+                    rows_total=db.query(func.count(models.User.id)).scalar_subquery())
+        ).rowcount
+        db.commit()
+        if started != 1:
+            return
+
+        os.makedirs(artifact_dir, exist_ok=True)
+        path = os.path.abspath(os.path.join(artifact_dir, f"{job_id}{FORMATS[format][0]}"))
+        tmp = f"{path}.tmp"
+        progress_path = _progress_path(artifact_dir, job_id)
+        if format == "excel":
+            reports.write_excel_report(_tracked(progress_path, reports.score_rows(month, year)), tmp)
+        else:
+            rules, roles = reports.recommendation_rules()
+            content = reports.generate_pdf_report(
+                _tracked(progress_path, reports.breakdown_rows(month, year)), f"{year}-{month:02d}", rules, roles
+            )
+            with open(tmp, "wb") as f:
+                f.write(content)
+        os.replace(tmp, path)
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+
+        # Only a job still RUNNING finishes; one failed meanwhile (timeout, pool callback) stays FAILED
+        finished = _utcnow()
+        done = db.execute(
+            update(models.ReportJob)
+            .where(models.ReportJob.id == job_id, models.ReportJob.status == Status.RUNNING)
+            .values(status=Status.DONE, rows_done=models.ReportJob.rows_total, artifact_path=path,
+                    finished_at=finished, expires_at=finished + timedelta(seconds=REPORT_JOB_TTL))
+        ).rowcount
+        db.commit()
+        if done != 1:
+            os.remove(path)
+    except Exception as e:
+        db.rollback()
+        _mark_failed(job_id, str(e))
+        if os.path.exists(_progress_path(artifact_dir, job_id)):
+            os.remove(_progress_path(artifact_dir, job_id))
+    finally:
+        db.close()
@@ -1,7 +1,22 @@
 import pandas as pd
-from io import BytesIO
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
+from io import BytesIO, StringIO
+from itertools import islice
+from operator import itemgetter
+from openpyxl import Workbook
+from sqlalchemy import select, String, type_coerce
+import csv
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pypdf import PdfReader, PdfWriter
+from database import SessionLocal
+import models
+import services
+import automation
+import score_rules
+import pdf_render
+import multiprocessing
 
 def generate_excel_report(data: list):
     """Senior Logic: Converts list of dicts to an Excel buffer."""
@@ -11,16 +26,273 @@ def generate_excel_report(data: list):
         df.to_excel(writer, index=False, sheet_name='KPI_Report')
     return output.getvalue()
 
-def generate_pdf_report(data: list):
-    """Senior Logic: Basic PDF generation for achievements."""
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    p.drawString(100, 750, "KPI Performance Report")
-    y = 700
-    for item in data[:20]:  # Limit rows for sample PDF
-        text = f"User ID: {item.get('user_id')} | Score: {item.get('score')}"
-        p.drawString(100, y, text)
-        y -= 20
-    p.showPage()
-    p.save()
-    return buffer.getvalue()
\ No newline at end of file
+EXCEL_COLUMNS = ["user_id", "full_name", "score", "period"]
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# PDF page ranges are drawn in parallel once a report is big enough to pay for the worker start-up
+REPORT_PDF_WORKERS = int(os.environ.get("REPORT_PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = 40
+PDF_PAGES_PER_TASK = 100
+
+def score_rows(month: int, year: int):
+    """(user_id, full_name, score, period) for every user, streamed. Owns its session so it can outlive a request."""
+    db = SessionLocal()
+    try:
+        for user_id, full_name, score in services.iter_user_scores(db, month, year):
+            yield user_id, full_name, score, f"{year}-{month:02d}"
+    finally:
+        db.close()
+
+def write_excel_report(rows, path: str, columns=EXCEL_COLUMNS):
+    """Senior Logic: Constant-memory Excel writer; openpyxl spools write-only sheets to disk as rows arrive."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("KPI_Report")
+    ws.append(columns)
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+
+def stream_excel_report(rows, columns=EXCEL_COLUMNS):
+    """
+    Senior Logic: Constant-memory Excel export. The workbook is written to a
+    temp file, then yielded in chunks and removed.
+    """
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        write_excel_report(rows, path, columns)
+        with open(path, "rb") as f:
+            while chunk := f.read(STREAM_CHUNK_SIZE):
+                yield chunk
+    finally:
+        os.remove(path)
+
+def breakdown_rows(month: int, year: int):
+    """(user_id, full_name, score, [(kpi_name, target, achieved, points)]) for every user, streamed."""
+    db = SessionLocal()
+    try:
+        kpi_names = dict(db.query(models.KPI.id, models.KPI.name).all())
+        for user_id, full_name, score, parts in services.iter_score_breakdowns(db, month, year):
+            yield user_id, full_name, score, [
+                (kpi_names.get(kpi_id, f"KPI {kpi_id}"), target, achieved, points)
+                for kpi_id, target, achieved, points in parts
+            ]
+    finally:
+        db.close()
+
+def recommendation_rules():
+    """(compiled rules, {user_id: role_id}) for generate_pdf_report. Owns its session like breakdown_rows."""
+    db = SessionLocal()
+    try:
+        return automation.rule_cache.get(db), dict(db.query(models.User.id, models.User.role_id).all())
+    finally:
+        db.close()
+
+def _pdf_summary_lines(users, period: str, rules, roles):
+    scores = [score for _uid, _name, score, _parts in users]
+    summary = services.score_summary(scores)
+    role_ids = [roles.get(uid) if roles.get(uid) is not None else -1 for uid, _name, _score, _parts in users]
+    bands = {}
+    for label in rules.classify_scores(role_ids, scores).tolist():
+        name = score_rules.label_name(score_rules.LABELS[label])
+        bands[name] = bands.get(name, 0) + 1
+    return [
+        f"Period: {period}    Users: {summary['count']}    Average score: {summary['average']:.2f}"
+        f"    Min: {summary['min']:.2f}    Max: {summary['max']:.2f}",
+        "Recommendation bands: " + ", ".join(f"{label} {count}" for label, count in sorted(bands.items())),
+    ]
+
+def generate_pdf_report(users, period: str, rules, roles, workers: int = None):
+    """
+    Senior Logic: Full tabular PDF, one block per user with their per-KPI
+    breakdown. Pages are laid out up front so every page number is known,
+    then page ranges are drawn in worker processes and merged in order.
+    `users` is an iterable of breakdown_rows() tuples; `rules` and `roles`
+    ({user_id: role_id}, see recommendation_rules()) classify the summary.
+    Never touches the database.
+    """
+    users = list(users)
+    title = f"KPI Performance Report - {period}"
+    pages = pdf_render.paginate(users, _pdf_summary_lines(users, period, rules, roles))
+    total = len(pages)
+    workers = REPORT_PDF_WORKERS if workers is None else workers
+
+    if workers <= 1 or total < PDF_PARALLEL_MIN_PAGES:
+        return pdf_render.render_pages(pages, 1, total, title)
+
+    # Enough tasks to keep every worker busy, each a contiguous page range
+    per_task = max(1, min(PDF_PAGES_PER_TASK, -(-total // workers)))
+    starts = range(0, total, per_task)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        parts = list(pool.map(
+            pdf_render.render_pages,
+            [pages[i:i + per_task] for i in starts],
+            [i + 1 for i in starts],
+            [total] * len(starts),
+            [title] * len(starts)
+        ))
+
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(PdfReader(BytesIO(part)))
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+# ==================== DATASET EXPORTS (CSV / NDJSON / PARQUET) ====================
+# Machine-readable dumps for BI. Every dataset is a stream of tuples produced
+# chunk by chunk from the same server-side-cursor query path as the Excel
+# export; `fields` picks columns by position, and for achievements the
+# projection is pushed down into the SELECT itself.
+
+# name -> Arrow type name, in output order
+DATASETS = {
+    "scores": {
+        "user_id": "int64", "full_name": "string", "score": "float64", "period": "string",
+    },
+    "breakdown": {
+        "user_id": "int64", "full_name": "string", "kpi_id": "int64", "kpi_name": "string",
+        "target": "float64", "achieved": "float64", "completion": "float64", "points": "float64",
+        "period": "string",
+    },
+    "achievements": {
+        "id": "int64", "user_id": "int64", "kpi_id": "int64", "achieved_value": "float64",
+        "status": "string", "achievement_date": "timestamp", "verified_at": "timestamp",
+        "verifier_id": "int64", "description": "string", "evidence_url": "string",
+    },
+}
+
+EXPORT_MEDIA_TYPES = {
+    "csv": ("text/csv", ".csv"),
+    "ndjson": ("application/x-ndjson", ".ndjson"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+
+EXPORT_CHUNK_ROWS = 5000
+
+def resolve_fields(dataset: str, fields: str = None):
+    """Column list for a comma-separated `fields` value (all columns when empty). Raises ValueError."""
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset '{dataset}'. Choose from: {', '.join(DATASETS)}")
+    available = list(DATASETS[dataset])
+    if not fields:
+        return available
+    columns = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [c for c in columns if c not in DATASETS[dataset]]
+    if unknown or not columns:
+        raise ValueError(f"Unknown field(s) {unknown} for '{dataset}'. Available: {', '.join(available)}")
+    return columns
+
+def _projector(dataset: str, columns):
+    """Picks `columns` (in that order) out of a full-width dataset tuple."""
+    positions = [list(DATASETS[dataset]).index(c) for c in columns]
+    if len(positions) == 1:
+        pos = positions[0]
+        return lambda row: (row[pos],)
+    return itemgetter(*positions)
+
+def dataset_rows(dataset: str, periods, columns):
+    """Streams tuples in `columns` order for the given "YYYY-MM" periods. Owns its session."""
+    db = SessionLocal()
+    try:
+        if dataset == "achievements":
+            first_year, first_month = _split_period(periods[0])
+            last_year, last_month = _split_period(periods[-1])
+            first_start, _ = services.period_bounds(first_month, first_year)
+            _, last_end = services.period_bounds(last_month, last_year)
+            table = models.Achievement.__table__
+            selected = [
+                # Enum column comes back as its stored label instead of an Enum member
+                type_coerce(table.c.status, String).label("status") if c == "status" else table.c[c]
+                for c in columns
+            ]
+            result = db.execute(
+                select(*selected)
+                .where(table.c.achievement_date >= first_start, table.c.achievement_date < last_end)
+                .order_by(table.c.achievement_date, table.c.id)
+                .execution_options(yield_per=EXPORT_CHUNK_ROWS)
+            )
+            for chunk in result.partitions():
+                yield from (tuple(row) for row in chunk)
+            return
+
+        project = _projector(dataset, columns)
+        kpi_names = dict(db.query(models.KPI.id, models.KPI.name).all()) if dataset == "breakdown" else {}
+        for period in periods:
+            year, month = _split_period(period)
+            if dataset == "scores":
+                for user_id, full_name, score in services.iter_user_scores(db, month, year):
+                    yield project((user_id, full_name, score, period))
+            else:
+                for user_id, full_name, _score, parts in services.iter_score_breakdowns(db, month, year):
+                    for kpi_id, target, achieved, points in parts:
+                        completion = min(achieved / target, 1.0) if target > 0 else 0.0
+                        yield project((
+                            user_id, full_name, kpi_id, kpi_names.get(kpi_id), target,
+                            achieved, completion, points, period
+                        ))
+    finally:
+        db.close()
+
+def _split_period(period: str):
+    year, month = period.split("-")
+    return int(year), int(month)
+
+def _chunked(rows, size: int = EXPORT_CHUNK_ROWS):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+def stream_csv(columns, rows):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for chunk in _chunked(rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+def stream_ndjson(columns, rows):
+    """One JSON object per line, assembled from pre-encoded keys rather than a dict per row."""
+    keys = [("{" if i == 0 else ",") + json.dumps(c) + ":" for i, c in enumerate(columns)]
+    dumps = json.dumps
+    for chunk in _chunked(rows):
+        yield "".join(
+            "".join(key + dumps(value, default=str) for key, value in zip(keys, row)) + "}\n"
+            for row in chunk
+        ).encode("utf-8")
+
+def parquet_available():
+    try:
+        import pyarrow # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def stream_parquet(dataset: str, columns, rows):
+    """
+    One Parquet row group per chunk, written column-wise with a fixed schema.
+    Parquet's footer comes last, so the file is spooled to disk and then
+    yielded like the Excel export. Requires the optional pyarrow package.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_types = {"int64": pa.int64(), "float64": pa.float64(), "string": pa.string(), "timestamp": pa.timestamp("us")}
+    schema = pa.schema([(c, arrow_types[DATASETS[dataset][c]]) for c in columns])
+    fd, path = tempfile.mkstemp(suffix=".parquet")
+    os.close(fd)
+    try:
+        with pq.ParquetWriter(path, schema, compression="snappy") as writer:
+            for chunk in _chunked(rows):
+                arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        with open(path, "rb") as f:
+            while data := f.read(STREAM_CHUNK_SIZE):
+                yield data
+    finally:
+        os.remove(path)
@@ -0,0 +1,353 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import SessionLocal
+import models
+import audit_archive
+import automation
+import report_jobs
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+# Every API worker runs this loop, but a job only runs where its scheduled_jobs
+# row was claimed: the claim is a single UPDATE guarded by next_run_at <= now
+# and an expired lease, so exactly one worker wins each fire time. Claimed
+# jobs run on a small thread pool, so a long month-close evaluation does not
+# hold up other due jobs. While a job runs the holder keeps extending its
+# lease; a worker that dies mid-run stops doing so, the lease expires and
+# the job is retried.
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "true").lower() not in ("0", "false", "no")
+SCHEDULER_TICK_SECONDS = float(os.environ.get("SCHEDULER_TICK_SECONDS", "30"))
+SCHEDULER_WORKERS = int(os.environ.get("SCHEDULER_WORKERS", "2"))
+
+logger = logging.getLogger(__name__)
+
+# ==================== CRON ====================
+
+_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)] # minute hour day-of-month month day-of-week
+
+def _parse_field(text: str, low: int, high: int):
+    values = set()
+    for part in text.split(","):
+        part, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(x) for x in part.split("-"))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        top = 7 if high == 6 else high # Day of week: 7 is Sunday too
+        if start < low or end > top or start > end or step < 1:
+            raise ValueError(f"Invalid cron field '{text}'")
+        values.update(v % 7 if high == 6 else v for v in range(start, end + 1, step))
+    return values
+
+def parse_cron(expr: str):
+    """Five-field cron (minute hour day month weekday; *, lists, ranges, steps) -> sets of values."""
+    parts = expr.split()
+    if len(parts) != 5:
+        raise ValueError(f"Cron expression needs 5 fields: '{expr}'")
+    minutes, hours, days, months, weekdays = (_parse_field(p, lo, hi) for p, (lo, hi) in zip(parts, _FIELDS))
+    # As in cron: when both day fields are restricted, either may match
+    days_any, weekdays_any = parts[2] == "*", parts[4] == "*"
+    return minutes, hours, days, months, weekdays, days_any, weekdays_any
+
+def next_fire(expr: str, after: datetime):
+    """First minute strictly after `after` (naive UTC) that matches the cron expression."""
+    minutes, hours, days, months, weekdays, days_any, weekdays_any = parse_cron(expr)
+    t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = after + timedelta(days=366 * 5)
+    while t <= limit:
+        weekday = (t.weekday() + 1) % 7 # cron counts from Sunday
+        if days_any or weekdays_any:
+            day_ok = t.day in days and weekday in weekdays
+        else:
+            day_ok = t.day in days or weekday in weekdays
+        if t.month not in months or not day_ok:
+            t = t.replace(hour=0, minute=0) + timedelta(days=1)
+        elif t.hour not in hours:
+            t = t.replace(minute=0) + timedelta(hours=1)
+        elif t.minute not in minutes:
+            t += timedelta(minutes=1)
+        else:
+            return t
+    raise ValueError(f"Cron expression never fires: '{expr}'")
+
+# ==================== JOBS ====================
+
+class Job:
+    def __init__(self, name: str, schedule: str, func, lease_seconds: int):
+        parse_cron(schedule) # Fail at registration, not at 2am
+        self.name = name
+        self.schedule = schedule
+        self.func = func
+        self.lease_seconds = lease_seconds
+
+JOBS = {}
+
+def register(name: str, schedule: str, lease_seconds: int = 3600):
+    """Decorator: runs func(db) on a cron schedule (UTC); its return value is stored as the run's detail."""
+    def wrap(func):
+        JOBS[name] = Job(name, schedule, func, lease_seconds)
+        return func
+    return wrap
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+@register("month-close-evaluation", "0 2 1 * *")
+def month_close_evaluation(db: Session):
+    """Evaluates the month that just ended."""
+    today = _utcnow()
+    month, year = (12, today.year - 1) if today.month == 1 else (today.month - 1, today.year)
+    result = automation.evaluate_period(db, month, year)
+    return {key: result[key] for key in ("period", "evaluated", "buckets", "created", "updated", "removed")}
+
+@register("reevaluate-dirty", "15 * * * *")
+def reevaluate_dirty(db: Session):
+    result = automation.reevaluate_dirty(db)
+    return {key: result[key] for key in ("users", "changed", "transitions", "skipped")}
+
+@register("purge-password-reset-tokens", "0 3 * * *", lease_seconds=600)
+def purge_password_reset_tokens(db: Session):
+    removed = db.query(models.PasswordResetToken).filter(or_(
+        models.PasswordResetToken.expires_at < _utcnow(),
+        models.PasswordResetToken.used.is_(True)
+    )).delete(synchronize_session=False)
+    db.commit()
+    return {"removed": removed}
+
+@register("audit-retention", "30 3 * * *")
+def audit_retention(db: Session):
+    return audit_archive.archive_old_logs()
+
+@register("purge-report-jobs", "*/15 * * * *", lease_seconds=600)
+def purge_report_jobs(db: Session):
+    return {"timed_out": report_jobs.fail_stale(db), "removed": report_jobs.purge_expired(db)}
+
+# ==================== RUNNER ====================
+
+class Scheduler:
+    def __init__(self, jobs, tick_seconds: float = SCHEDULER_TICK_SECONDS, workers: int = SCHEDULER_WORKERS):
+        self.jobs = jobs
+        self.tick_seconds = tick_seconds
+        self.workers = max(1, workers)
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._active = set() # Jobs queued or running on this worker's pool
+        self._active_lock = threading.Lock()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+            self._thread.start()
+
+    def shutdown(self, timeout: float = 5.0):
+        """Stops claiming new runs; a job already running finishes in the background."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Scheduler tick failed")
+            self._stop.wait(self.tick_seconds)
+
+    def sync_jobs(self, db: Session):
+        """Creates rows for new jobs and reschedules jobs whose cron expression changed."""
+        now = _utcnow()
+        rows = {row.name: row for row in db.query(models.ScheduledJob)}
+        for job in self.jobs.values():
+            row = rows.get(job.name)
+            if row is None:
+                db.add(models.ScheduledJob(name=job.name, schedule=job.schedule,
+                                           next_run_at=next_fire(job.schedule, now)))
+            elif row.schedule != job.schedule:
+                row.schedule = job.schedule
+                row.next_run_at = next_fire(job.schedule, now)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback() # Another worker inserted the same rows first
+
+    def tick(self):
+        """Hands every due job to the pool, which claims and runs it. Returns the futures."""
+        db = SessionLocal()
+        try:
+            self.sync_jobs(db)
+            now = _utcnow()
+            due = [name for (name,) in db.query(models.ScheduledJob.name).filter(
+                models.ScheduledJob.next_run_at <= now
+            )]
+            db.rollback()
+        finally:
+            db.close()
+
+        futures = []
+        for name in due:
+            job = self.jobs.get(name)
+            if job is None or self._stop.is_set():
+                continue
+            with self._active_lock:
+                if name in self._active:
+                    continue
+                self._active.add(name)
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scheduler-job")
+                futures.append(self._executor.submit(self._claim_and_run, job))
+        return futures
+
+    def _claim_and_run(self, job: Job):
+        # Claimed only once a pool thread is free, so a queued job does not use up its lease waiting
+        db = SessionLocal()
+        try:
+            if not self._stop.is_set() and self.claim(db, job):
+                return self.run(db, job)
+        except Exception:
+            logger.exception("Scheduler job %s failed to run", job.name)
+        finally:
+            db.close()
+            with self._active_lock:
+                self._active.discard(job.name)
+
+    def claim(self, db: Session, job: Job) -> bool:
+        now = _utcnow()
+        claimed = db.execute(
+            update(models.ScheduledJob)
+            .where(
+                models.ScheduledJob.name == job.name,
+                models.ScheduledJob.next_run_at <= now,
+                or_(models.ScheduledJob.lease_until.is_(None), models.ScheduledJob.lease_until < now)
+            )
+            .values(lease_holder=self.holder, lease_until=now + timedelta(seconds=job.lease_seconds))
+        ).rowcount
+        db.commit()
+        return claimed == 1
+
+    def renew(self, job: Job) -> bool:
+        """Extends our lease on job; False when another worker holds it now."""
+        db = SessionLocal()
+        try:
+            renewed = db.query(models.ScheduledJob).filter(
+                models.ScheduledJob.name == job.name, models.ScheduledJob.lease_holder == self.holder
+            ).update({
+                models.ScheduledJob.lease_until: _utcnow() + timedelta(seconds=job.lease_seconds)
+            }, synchronize_session=False)
+            db.commit()
+            return renewed == 1
+        finally:
+            db.close()
+
+    def _heartbeat(self, job: Job, done: threading.Event):
+        """Renews the lease every third of its length until the run finishes."""
+        interval = max(1.0, job.lease_seconds / 3)
+        while not done.wait(interval):
+            try:
+                if not self.renew(job):
+                    logger.warning("Scheduler lease on %s was taken over while it was running", job.name)
+                    return
+            except Exception:
+                logger.exception("Scheduler could not renew the lease on %s", job.name)
+
+    def run(self, db: Session, job: Job):
+        """Runs a claimed job, records the outcome and schedules the next fire time."""
+        run = models.JobRun(job_name=job.name, holder=self.holder, status=models.JobRunStatus.RUNNING,
+                            started_at=_utcnow())
+        db.add(run)
+        db.commit()
+        run_id = run.id
+
+        started = time.perf_counter()
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, done), name=f"lease-{job.name}", daemon=True)
+        heartbeat.start()
+        job_db = SessionLocal()
+        try:
+            detail = job.func(job_db)
+            status, detail = models.JobRunStatus.SUCCEEDED, json.dumps(detail, default=str) if detail is not None else None
+        except Exception as e:
+            job_db.rollback()
+            status, detail = models.JobRunStatus.FAILED, f"{type(e).__name__}: {e}"
+        finally:
+            job_db.close()
+            done.set()
+            heartbeat.join()
+        duration = time.perf_counter() - started
+
+        # Only the current holder may reschedule; if the lease was lost another
+        # worker has claimed (and will reschedule) this fire time
+        finished = _utcnow()
+        released = db.query(models.ScheduledJob).filter(
+            models.ScheduledJob.name == job.name, models.ScheduledJob.lease_holder == self.holder
+        ).update({
+            models.ScheduledJob.next_run_at: next_fire(job.schedule, finished),
+            models.ScheduledJob.lease_holder: None,
+            models.ScheduledJob.lease_until: None,
+        }, synchronize_session=False)
+        if released != 1:
+            logger.warning("Scheduler lease on %s expired before the run finished", job.name)
+            detail = f"Lease lost before finishing; {detail or ''}".rstrip("; ")
+        db.query(models.JobRun).filter(models.JobRun.id == run_id).update({
+            models.JobRun.status: status,
+            models.JobRun.finished_at: finished,
+            models.JobRun.duration_seconds: round(duration, 3),
+            models.JobRun.detail: detail[:2000] if detail else None,
+        }, synchronize_session=False)
+        db.commit()
+        return status
+
+scheduler = Scheduler(JOBS)
+
+def start():
+    if SCHEDULER_ENABLED:
+        scheduler.start()
+
+def shutdown():
+    scheduler.shutdown()
+
+def trigger(db: Session, name: str) -> bool:
+    """Makes a job due now; the next tick of any worker picks it up."""
+    updated = db.query(models.ScheduledJob).filter(models.ScheduledJob.name == name).update(
+        {models.ScheduledJob.next_run_at: _utcnow()}, synchronize_session=False
+    )
+    db.commit()
+    return bool(updated)
+
+def job_status(db: Session, runs_per_job: int = 5):
+    rows = {row.name: row for row in db.query(models.ScheduledJob)}
+    result = []
+    for job in JOBS.values():
+        row = rows.get(job.name)
+        runs = db.query(models.JobRun).filter(models.JobRun.job_name == job.name).order_by(
+            models.JobRun.started_at.desc()
+        ).limit(runs_per_job).all()
+        result.append({
+            "name": job.name,
+            "schedule": job.schedule,
+            "next_run_at": row.next_run_at if row else None,
+            "running_on": row.lease_holder if row and row.lease_until and row.lease_until > _utcnow() else None,
+            "recent_runs": [{
+                "status": r.status, "started_at": r.started_at, "finished_at": r.finished_at,
+                "duration_seconds": r.duration_seconds, "holder": r.holder, "detail": r.detail,
+            } for r in runs],
+        })
+    return result
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, EmailStr, field_validator, Field
 from typing import Optional, List
 from datetime import datetime
-from models import PermissionType, MeasurementType, PeriodType, AchievementStatus
+from models import PermissionType, MeasurementType, PeriodType, AchievementStatus, RecommendationType
 
 class User(BaseModel):
     id: int
@@ -157,4 +157,54 @@ class DashboardData(BaseModel):
 class AdminDashboardResponse(BaseModel):
     user_scores: List[DashboardData]
     total_users: int
-    period: str
\ No newline at end of file
+    period: str
+
+class SimulationKPIChange(BaseModel):
+    kpi_id: int
+    target_value: Optional[float] = Field(None, gt=0)
+    weightage: Optional[float] = Field(None, ge=0, le=100)
+
+class SimulationOverride(BaseModel):
+    user_id: int
+    kpi_id: int
+    custom_target_value: float = Field(..., gt=0)
+
+class SimulationRequest(BaseModel):
+    month: Optional[int] = Field(None, ge=1, le=12)
+    year: Optional[int] = None
+    role_id: Optional[int] = None
+    kpi_changes: List[SimulationKPIChange] = []
+    overrides: List[SimulationOverride] = []
+    max_changed_users: int = Field(500, ge=0, le=50000)
+
+
+class ManagerMove(BaseModel):
+    user_id: int
+    manager_id: Optional[int] = None
+
+class BulkReorgRequest(BaseModel):
+    moves: List[ManagerMove] = Field(..., min_length=1, max_length=50000)
+
+class EvaluationRequest(BaseModel):
+    month: Optional[int] = Field(None, ge=1, le=12)
+    year: Optional[int] = None
+    role_id: Optional[int] = None
+    workers: Optional[int] = Field(None, ge=1, le=32)
+
+
+class ScoreBandRuleIn(BaseModel):
+    min_score: Optional[float] = None # Inclusive lower bound; None = open
+    max_score: Optional[float] = None # Exclusive upper bound, condition rules only
+    consecutive_periods: int = Field(1, ge=1, le=12) # 1 = plain score band
+    recommendation: Optional[RecommendationType] = None # None = satisfactory
+
+
+class ScoreRuleSet(BaseModel):
+    role_id: Optional[int] = None # None = the set for roles without their own
+    rules: List[ScoreBandRuleIn] = [] # Condition rules are checked in list order
+
+
+class ReportJobRequest(BaseModel):
+    format: str = Field("excel", pattern="^(excel|pdf)$")
+    month: Optional[int] = Field(None, ge=1, le=12)
+    year: Optional[int] = None
@@ -0,0 +1,124 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import models
+import auth
+import numpy as np
+import threading
+
+# Recommendation rules live in score_band_rules, one ordered set per role
+# (role_id NULL = the set used by roles without their own). Two kinds:
+#   band rules (consecutive_periods 1): lower bound -> recommendation, the
+#     highest min_score <= score wins, like automation.SCORE_THRESHOLDS;
+#   condition rules (consecutive_periods N > 1): min_score <= score < max_score
+#     in each of the last N periods; checked in position order, the first
+#     match replaces the band's recommendation.
+# A rule set is compiled once into numpy arrays and reused until the shared
+# "score_rules" version moves.
+RULES_VERSION_KEY = "score_rules"
+
+# Label index 0 is "no recommendation"; the rest follow the enum order
+LABELS = [None] + list(models.RecommendationType)
+LABEL_INDEX = {rec: i for i, rec in enumerate(LABELS)}
+
+def label_name(rec):
+    return rec.value if rec else "SATISFACTORY"
+
+class CompiledRoleRules:
+    """Array form of one role's rule set."""
+
+    def __init__(self, rules):
+        bands = sorted((r for r in rules if (r.consecutive_periods or 1) <= 1),
+                       key=lambda r: -np.inf if r.min_score is None else r.min_score)
+        self.bounds = np.array([-np.inf if r.min_score is None else r.min_score for r in bands], dtype=np.float64)
+        self.band_labels = np.array([LABEL_INDEX[r.recommendation] for r in bands], dtype=np.int64)
+        # Upper edge of the lowest band: scores below it get the bottom band's recommendation
+        self.floor = float(self.bounds[1]) if len(self.bounds) > 1 else float("-inf")
+
+        conditions = sorted((r for r in rules if (r.consecutive_periods or 1) > 1), key=lambda r: (r.position, r.id or 0))
+        self.cond_low = np.array([-np.inf if r.min_score is None else r.min_score for r in conditions], dtype=np.float64)
+        self.cond_high = np.array([np.inf if r.max_score is None else r.max_score for r in conditions], dtype=np.float64)
+        self.cond_periods = [r.consecutive_periods for r in conditions]
+        self.cond_labels = [LABEL_INDEX[r.recommendation] for r in conditions]
+        self.periods = max(self.cond_periods, default=1)
+
+    def classify(self, history):
+        """
+        history: float array [users x periods], column 0 = the evaluated period,
+        NaN where the user did not exist yet. Returns label indexes.
+        """
+        current = history[:, 0]
+        if len(self.bounds):
+            band = np.searchsorted(self.bounds, current, side="right") - 1
+            out = np.where(band >= 0, self.band_labels[np.maximum(band, 0)], 0)
+        else:
+            out = np.zeros(len(current), dtype=np.int64)
+
+        decided = np.zeros(len(current), dtype=bool)
+        for low, high, periods, label in zip(self.cond_low, self.cond_high, self.cond_periods, self.cond_labels):
+            if periods > history.shape[1]:
+                continue
+            window = history[:, :periods]
+            # NaN (before the user existed) compares False, so short histories never match
+            hit = ~decided & np.all((window >= low) & (window < high), axis=1)
+            out[hit] = label
+            decided |= hit
+        return out
+
+class CompiledRules:
+    """Every role's compiled rule set plus the fallback set for roles without one."""
+
+    def __init__(self, rules, version: int = None, defaults=()):
+        self.version = version
+        by_role = {}
+        for rule in rules:
+            by_role.setdefault(rule.role_id, []).append(rule)
+        self.default = CompiledRoleRules(by_role.pop(None, None) or list(defaults))
+        self.roles = {role_id: CompiledRoleRules(role_rules) for role_id, role_rules in by_role.items()}
+        self.periods = max([self.default.periods] + [r.periods for r in self.roles.values()])
+
+    def for_role(self, role_id):
+        return self.roles.get(role_id, self.default)
+
+    def classify(self, role_ids, history):
+        """Label index per user in one pass per distinct role."""
+        role_ids = np.asarray(role_ids)
+        out = np.zeros(len(role_ids), dtype=np.int64)
+        for role_id in np.unique(role_ids):
+            mask = role_ids == role_id
+            out[mask] = self.for_role(role_id).classify(history[mask])
+        return out
+
+    def classify_scores(self, role_ids, scores):
+        """Label index per user from one period's scores; rules that look back more periods never match."""
+        return self.classify(role_ids, np.asarray(scores, dtype=np.float64).reshape(-1, 1))
+
+class RuleCache:
+    """
+    Process-local compiled rules. The shared version is re-read on every
+    evaluation (one small query, evaluations are rare); rules are loaded and
+    compiled again only when it moved.
+    """
+
+    def __init__(self, defaults):
+        self.defaults = defaults # Fallback set while no role_id NULL rules are stored
+        self._compiled = None
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> CompiledRules:
+        version = auth.read_version(db, RULES_VERSION_KEY)
+        compiled = self._compiled
+        if compiled is not None and compiled.version == version:
+            return compiled
+        compiled = CompiledRules(db.query(models.ScoreBandRule).all(), version, self.defaults)
+        with self._lock:
+            self._compiled = compiled
+        return compiled
+
+    def bump(self, db: Session):
+        """Call from rule writers before their commit."""
+        auth.bump_version(db, RULES_VERSION_KEY)
+        event.listen(db, "after_commit", lambda session: self.invalidate(), once=True)
+
+    def invalidate(self):
+        with self._lock:
+            self._compiled = None
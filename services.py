@@ -1,16 +1,199 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from collections import OrderedDict
+from datetime import datetime, timezone
+import os
+import threading
+import time
 import models
+import report_cache
 
-def calculate_user_kpi_score(db: Session, user_id: int, month: int, year: int):
+# Upper bound on ids per IN (...) clause so bulk queries stay under the
+# bind-parameter limits of SQLite and keep Postgres plans reasonable.
+BULK_CHUNK_SIZE = 1000
+
+def _chunks(items, size=BULK_CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def period_bounds(month: int, year: int):
+    """Half-open [start, end) range for a calendar month; unlike extract() it can use indexes."""
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
+# ==================== SCORE CACHE ====================
+
+class ScoreCache:
+    """
+    Process-local LRU cache of final scores keyed by (user_id, "YYYY-MM").
+
+    Every entry belongs to one value of the shared "report_data" version,
+    which each achievement, KPI, override and user write bumps in its own
+    transaction: sync() drops the whole cache as soon as another worker's
+    write moved it. The open period also expires after open_period_ttl
+    seconds as a backstop for writes made outside the API.
+    """
+
+    def __init__(self, max_size: int = 50000, open_period_ttl: float = 60.0, enabled: bool = True):
+        self.max_size = max_size
+        self.open_period_ttl = open_period_ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Bumped by every invalidation; results computed across a bump are not stored
+        self.generation = 0
+        self.version = None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _open_period():
+        now = datetime.now(timezone.utc)
+        return f"{now.year}-{now.month:02d}"
+
+    def sync(self, version: int):
+        """Clears the cache when the shared data version differs from the one it was filled at."""
+        if not self.enabled or version == self.version:
+            return
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                self.generation += 1
+                self.invalidations += 1
+                self._data.clear()
+
+    def get_many(self, user_ids, period: str):
+        """Returns ({user_id: score} for hits, [user_ids that missed])."""
+        if not self.enabled:
+            return {}, list(user_ids)
+        hits, missing = {}, []
+        expires = period >= self._open_period()
+        now = time.monotonic()
+        with self._lock:
+            for uid in user_ids:
+                entry = self._data.get((uid, period))
+                if entry is not None and expires and now - entry[1] > self.open_period_ttl:
+                    del self._data[(uid, period)]
+                    entry = None
+                if entry is None:
+                    missing.append(uid)
+                else:
+                    self._data.move_to_end((uid, period))
+                    hits[uid] = entry[0]
+            self.hits += len(hits)
+            self.misses += len(missing)
+        return hits, missing
+
+    def set_many(self, scores: dict, period: str, generation: int):
+        """Stores freshly computed scores unless an invalidation ran since `generation` was read."""
+        if not self.enabled or not scores:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if generation != self.generation:
+                return
+            for uid, score in scores.items():
+                self._data[(uid, period)] = (score, now)
+                self._data.move_to_end((uid, period))
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_ids, period: str = None):
+        """Drops cached scores for the given users, for one period or all of them."""
+        user_ids = set(user_ids)
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            stale = [
+                key for key in self._data
+                if key[0] in user_ids and (period is None or key[1] == period)
+            ]
+            for key in stale:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+score_cache = ScoreCache(
+    max_size=int(os.environ.get("SCORE_CACHE_SIZE", "50000")),
+    open_period_ttl=float(os.environ.get("SCORE_CACHE_OPEN_PERIOD_TTL", "60")),
+    enabled=os.environ.get("SCORE_CACHE_ENABLED", "true").lower() not in ("0", "false", "no"),
+)
+
+def sync_score_cache(db: Session):
+    """Call before reading score_cache so other workers' writes are seen."""
+    if score_cache.enabled:
+        score_cache.sync(report_cache.data_version(db)[0])
+
+def invalidate_user_scores(user_ids, month: int = None, year: int = None):
+    """Hook: a user's targets or verified sums changed (one period, or all periods)."""
+    period = f"{year}-{month:02d}" if month and year else None
+    score_cache.invalidate(user_ids, period)
+
+def invalidate_role_scores(db: Session, role_id: int):
+    """Hook: a role's KPI set changed, so every user holding that role is stale."""
+    user_ids = [uid for (uid,) in db.query(models.User.id).filter(models.User.role_id == role_id).all()]
+    if user_ids:
+        score_cache.invalidate(user_ids)
+
+def _kpi_score(actual_sum: float, target: float, weightage: float) -> float:
+    """(Actual / Target) * Weightage with completion capped at 100%."""
+    completion_pct = (actual_sum / target) if target > 0 else 0
+
+    # Requirement: Cap completion percentage at 1.0 (100%)
+    if completion_pct > 1.0:
+        completion_pct = 1.0
+
+    return completion_pct * weightage
+
+def calculate_user_kpi_score(db: Session, user_id: int, month: int, year: int, use_cache: bool = True):
     """
     Senior Logic: Aggregates VERIFIED achievements vs Targets.
     Calculates weighted score, capped at 100% per KPI.
     """
+    period = f"{year}-{month:02d}"
+    if use_cache:
+        sync_score_cache(db)
+        hits, _ = score_cache.get_many([user_id], period)
+        if user_id in hits:
+            return hits[user_id]
+    generation = score_cache.generation
+
     # 1. Get all KPIs assigned to the user's role
     user = db.query(models.User).filter(models.User.id == user_id).first()
     role_kpis = db.query(models.KPI).filter(models.KPI.role_id == user.role_id).all()
-    
+
+    # Verified totals come from the rollup table, one row per KPI
+    verified_sums = dict(
+        db.query(models.KPIScoreRollup.kpi_id, models.KPIScoreRollup.verified_sum).filter(
+            models.KPIScoreRollup.user_id == user_id,
+            models.KPIScoreRollup.period == period
+        ).all()
+    )
+
     total_performance_score = 0.0
 
     for kpi in role_kpis:
@@ -19,26 +202,305 @@ def calculate_user_kpi_score(db: Session, user_id: int, month: int, year: int):
             models.KPIOverride.user_id == user_id,
             models.KPIOverride.kpi_id == kpi.id
         ).first()
-        
+
         target = override.custom_target_value if override else kpi.target_value
 
-        # 3. Sum only VERIFIED achievements for this KPI in the given month/year
-        actual_sum = db.query(func.sum(models.Achievement.achieved_value)).filter(
-            models.Achievement.user_id == user_id,
-            models.Achievement.kpi_id == kpi.id,
-            models.Achievement.status == models.AchievementStatus.VERIFIED,
-            func.extract('month', models.Achievement.achievement_date) == month,
-            func.extract('year', models.Achievement.achievement_date) == year
-        ).scalar() or 0.0
+        # 3. Sum of VERIFIED achievements for this KPI in the given month/year
+        actual_sum = verified_sums.get(kpi.id) or 0.0
 
         # 4. Calculation: (Actual / Target) * Weightage
-        completion_pct = (actual_sum / target) if target > 0 else 0
-        
-        # Requirement: Cap completion percentage at 1.0 (100%)
-        if completion_pct > 1.0:
-            completion_pct = 1.0
-            
-        kpi_score = completion_pct * kpi.weightage
-        total_performance_score += kpi_score
-
-    return round(total_performance_score, 2)
\ No newline at end of file
+        total_performance_score += _kpi_score(actual_sum, target, kpi.weightage)
+
+    score = round(total_performance_score, 2)
+    score_cache.set_many({user_id: score}, period, generation)
+    return score
+
+def _load_score_inputs(db: Session, user_ids):
+    """
+    Everything except verified sums that scoring needs, for many users at once:
+    ({user_id: role_id}, {role_id: [(kpi_id, target, weightage)]}, {(user_id, kpi_id): override_target})
+    """
+    # 1. Users -> role
+    user_roles = {}
+    for chunk in _chunks(user_ids):
+        rows = db.query(models.User.id, models.User.role_id).filter(
+            models.User.id.in_(chunk)
+        ).all()
+        user_roles.update({uid: rid for uid, rid in rows})
+
+    # 2. KPIs for every role involved, in the same order the per-user query sees them
+    role_ids = {rid for rid in user_roles.values() if rid is not None}
+    kpis_by_role = {rid: [] for rid in role_ids}
+    if role_ids:
+        role_kpis = db.query(models.KPI.id, models.KPI.role_id, models.KPI.target_value, models.KPI.weightage).filter(
+            models.KPI.role_id.in_(role_ids)
+        ).order_by(models.KPI.id).all()
+        for kpi_id, role_id, target_value, weightage in role_kpis:
+            kpis_by_role[role_id].append((kpi_id, target_value, weightage))
+
+    # 3. Overrides keyed by (user_id, kpi_id)
+    overrides = {}
+    for chunk in _chunks(user_roles):
+        rows = db.query(
+            models.KPIOverride.user_id, models.KPIOverride.kpi_id, models.KPIOverride.custom_target_value
+        ).filter(
+            models.KPIOverride.user_id.in_(chunk)
+        ).order_by(models.KPIOverride.id.desc()).all()
+        # Descending id so the oldest row per pair is applied last, matching .first()
+        for uid, kpi_id, value in rows:
+            overrides[(uid, kpi_id)] = value
+
+    return user_roles, kpis_by_role, overrides
+
+def _load_verified_sums(db: Session, user_ids, first_period: str, last_period: str):
+    """Rolled-up VERIFIED sums keyed by (user_id, kpi_id, period) for an inclusive period range."""
+    sums = {}
+    for chunk in _chunks(user_ids):
+        query = db.query(
+            models.KPIScoreRollup.user_id, models.KPIScoreRollup.kpi_id,
+            models.KPIScoreRollup.period, models.KPIScoreRollup.verified_sum
+        ).filter(models.KPIScoreRollup.user_id.in_(chunk))
+        # "YYYY-MM" labels sort chronologically, so a string range is a period range
+        if first_period == last_period:
+            query = query.filter(models.KPIScoreRollup.period == first_period)
+        else:
+            query = query.filter(
+                models.KPIScoreRollup.period >= first_period,
+                models.KPIScoreRollup.period <= last_period
+            )
+        for uid, kpi_id, period, total in query.all():
+            sums[(uid, kpi_id, period)] = total
+    return sums
+
+def _weighted_score(uid, role_id, period, kpis_by_role, overrides, sums):
+    total_performance_score = 0.0
+    for kpi_id, target_value, weightage in kpis_by_role.get(role_id, []):
+        target = overrides.get((uid, kpi_id), target_value)
+        actual_sum = sums.get((uid, kpi_id, period)) or 0.0
+        total_performance_score += _kpi_score(actual_sum, target, weightage)
+    return round(total_performance_score, 2)
+
+def calculate_scores_bulk(db: Session, user_ids, month: int, year: int, use_cache: bool = True):
+    """
+    Senior Logic: Set-based version of calculate_user_kpi_score.
+    Loads users, role KPIs, overrides and rolled-up verified sums with one
+    query each (per chunk of ids) and scores everyone in memory.
+    Returns {user_id: score} for every requested user that exists.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {}
+    period = f"{year}-{month:02d}"
+
+    scores = {}
+    if use_cache:
+        sync_score_cache(db)
+        scores, user_ids = score_cache.get_many(user_ids, period)
+        if not user_ids:
+            return scores
+    generation = score_cache.generation
+
+    user_roles, kpis_by_role, overrides = _load_score_inputs(db, user_ids)
+    sums = _load_verified_sums(db, user_roles, period, period)
+
+    computed = {
+        uid: _weighted_score(uid, role_id, period, kpis_by_role, overrides, sums)
+        for uid, role_id in user_roles.items()
+    }
+    score_cache.set_many(computed, period, generation)
+    scores.update(computed)
+    return scores
+
+def iter_user_scores(db: Session, month: int, year: int, chunk_size: int = BULK_CHUNK_SIZE):
+    """
+    Yields (user_id, full_name, score) for every user, ordered by id, without
+    materialising the whole org: users stream from a server-side cursor and
+    are scored one chunk at a time with calculate_scores_bulk.
+    """
+    result = db.execute(
+        select(models.User.id, models.User.full_name)
+        .order_by(models.User.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    for chunk in result.partitions():
+        scores = calculate_scores_bulk(db, [uid for uid, _name in chunk], month, year)
+        for uid, full_name in chunk:
+            yield uid, full_name, scores[uid]
+
+def iter_score_breakdowns(db: Session, month: int, year: int, chunk_size: int = BULK_CHUNK_SIZE):
+    """
+    Like iter_user_scores, but also yields the per-KPI parts of each score:
+    (user_id, full_name, score, [(kpi_id, target, achieved, points), ...]).
+    Always computed fresh; the score cache only holds totals.
+    """
+    period = f"{year}-{month:02d}"
+    result = db.execute(
+        select(models.User.id, models.User.full_name)
+        .order_by(models.User.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    for chunk in result.partitions():
+        user_roles, kpis_by_role, overrides = _load_score_inputs(db, [uid for uid, _name in chunk])
+        sums = _load_verified_sums(db, user_roles, period, period)
+        for uid, full_name in chunk:
+            parts = []
+            for kpi_id, target_value, weightage in kpis_by_role.get(user_roles.get(uid), []):
+                target = overrides.get((uid, kpi_id), target_value)
+                actual_sum = sums.get((uid, kpi_id, period)) or 0.0
+                parts.append((kpi_id, target, actual_sum, _kpi_score(actual_sum, target, weightage)))
+            yield uid, full_name, round(sum(points for *_rest, points in parts), 2), parts
+
+def score_summary(scores, threshold: float = None, thresholds=None):
+    """
+    Count/average/min/max of a list of scores, plus how many fall below
+    `threshold`, or below each score's own entry in `thresholds`.
+    """
+    scores = list(scores)
+    summary = {
+        "count": len(scores),
+        "average": round(sum(scores) / len(scores), 2) if scores else 0.0,
+        "min": min(scores) if scores else 0.0,
+        "max": max(scores) if scores else 0.0
+    }
+    if threshold is not None:
+        summary["threshold"] = threshold
+        summary["below_threshold"] = sum(1 for score in scores if score < threshold)
+    elif thresholds is not None:
+        summary["threshold"] = None
+        summary["below_threshold"] = sum(1 for score, floor in zip(scores, thresholds) if score < floor)
+    return summary
+
+def month_range(first_period: str, last_period: str):
+    """Inclusive list of "YYYY-MM" labels between two periods."""
+    year, month = (int(x) for x in first_period.split("-"))
+    last_year, last_month = (int(x) for x in last_period.split("-"))
+    periods = []
+    while (year, month) <= (last_year, last_month):
+        periods.append(f"{year}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return periods
+
+def calculate_score_history(db: Session, user_ids, first_period: str, last_period: str, use_cache: bool = True):
+    """
+    Scores for every month in [first_period, last_period] (inclusive, "YYYY-MM")
+    with the same constant number of queries as a single-period bulk pass.
+    Returns {user_id: [{"period": ..., "score": ...}, ...]} in chronological order.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    periods = month_range(first_period, last_period)
+    if not user_ids or not periods:
+        return {}
+
+    # Users with every month cached skip the database entirely
+    cached = {period: {} for period in periods}
+    to_compute = user_ids
+    if use_cache:
+        sync_score_cache(db)
+        missing = set()
+        for period in periods:
+            cached[period], period_missing = score_cache.get_many(user_ids, period)
+            missing.update(period_missing)
+        to_compute = [uid for uid in user_ids if uid in missing]
+    generation = score_cache.generation
+
+    computed = {period: {} for period in periods}
+    if to_compute:
+        user_roles, kpis_by_role, overrides = _load_score_inputs(db, to_compute)
+        sums = _load_verified_sums(db, user_roles, periods[0], periods[-1])
+        for period in periods:
+            computed[period] = {
+                uid: _weighted_score(uid, role_id, period, kpis_by_role, overrides, sums)
+                for uid, role_id in user_roles.items()
+            }
+            score_cache.set_many(computed[period], period, generation)
+
+    history = {}
+    for uid in user_ids:
+        source = computed if uid in computed[periods[0]] else cached
+        if uid not in source[periods[0]]:
+            continue # Unknown user
+        history[uid] = [{"period": period, "score": source[period][uid]} for period in periods]
+    return history
+
+# ==================== SCORE ROLLUPS ====================
+
+def apply_verified_achievement(db: Session, achievement: models.Achievement):
+    """
+    Adds a newly VERIFIED achievement to its (user, KPI, month) rollup row.
+    Does not commit: call it before the verification's own db.commit() so
+    the rollup and the status change land in the same transaction.
+    """
+    if achievement.achievement_date is None:
+        return
+    period = f"{achievement.achievement_date.year}-{achievement.achievement_date.month:02d}"
+
+    updated = db.query(models.KPIScoreRollup).filter(
+        models.KPIScoreRollup.user_id == achievement.user_id,
+        models.KPIScoreRollup.kpi_id == achievement.kpi_id,
+        models.KPIScoreRollup.period == period
+    ).update(
+        {models.KPIScoreRollup.verified_sum: models.KPIScoreRollup.verified_sum + achievement.achieved_value},
+        synchronize_session=False
+    )
+    if not updated:
+        db.add(models.KPIScoreRollup(
+            user_id=achievement.user_id,
+            kpi_id=achievement.kpi_id,
+            period=period,
+            verified_sum=achievement.achieved_value
+        ))
+
+def ensure_score_rollups(db: Session):
+    """
+    Builds the rollups when there are VERIFIED achievements but no rollup
+    rows (first start after upgrading). Scores are read from the rollups
+    only, so without them every score would be 0. Returns the rows written.
+    """
+    if db.query(models.KPIScoreRollup.id).first() or not db.query(models.Achievement.id).filter(
+        models.Achievement.status == models.AchievementStatus.VERIFIED
+    ).first():
+        return 0
+    try:
+        return rebuild_score_rollups(db)
+    except IntegrityError:
+        db.rollback() # Another worker built them first
+        return 0
+
+def rebuild_score_rollups(db: Session, month: int = None, year: int = None):
+    """
+    Backfill: recomputes rollup rows from raw VERIFIED achievements.
+    Rebuilds a single month when month/year are given, otherwise everything.
+    Returns the number of rollup rows written.
+    """
+    year_col = func.extract('year', models.Achievement.achievement_date)
+    month_col = func.extract('month', models.Achievement.achievement_date)
+
+    sums_query = db.query(
+        models.Achievement.user_id, models.Achievement.kpi_id, year_col, month_col,
+        func.sum(models.Achievement.achieved_value)
+    ).filter(
+        models.Achievement.status == models.AchievementStatus.VERIFIED,
+        models.Achievement.achievement_date.isnot(None)
+    )
+    stale = db.query(models.KPIScoreRollup)
+    if month and year:
+        start, end = period_bounds(month, year)
+        sums_query = sums_query.filter(
+            models.Achievement.achievement_date >= start,
+            models.Achievement.achievement_date < end
+        )
+        stale = stale.filter(models.KPIScoreRollup.period == f"{year}-{month:02d}")
+
+    rows = sums_query.group_by(models.Achievement.user_id, models.Achievement.kpi_id, year_col, month_col).all()
+
+    stale.delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.KPIScoreRollup, [{
+        "user_id": user_id,
+        "kpi_id": kpi_id,
+        "period": f"{int(y)}-{int(m):02d}",
+        "verified_sum": total or 0.0
+    } for user_id, kpi_id, y, m, total in rows])
+    report_cache.bump_data_version(db)
+    db.commit()
+    score_cache.clear()
+    return len(rows)
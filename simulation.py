@@ -0,0 +1,200 @@
+import numpy as np
+from sqlalchemy.orm import Session
+import models
+import score_rules
+
+# Score histogram bucket edges (0-10, 10-20, ... 90-100)
+HISTOGRAM_EDGES = np.linspace(0, 100, 11)
+
+class PeriodArrays:
+    """
+    Dense, read-only snapshot of everything a period's scores depend on.
+    Rows are users (sorted by id), columns are KPIs (sorted by id).
+    """
+
+    def __init__(self, user_ids, user_roles, kpi_ids, kpi_roles, kpi_targets, kpi_weights, sums, override_targets):
+        self.user_ids = user_ids                  # (U,) int64
+        self.user_roles = user_roles              # (U,) int64, -1 for users without a role
+        self.kpi_ids = kpi_ids                    # (K,) int64
+        self.kpi_roles = kpi_roles                # (K,) int64
+        self.kpi_targets = kpi_targets            # (K,) float64
+        self.kpi_weights = kpi_weights            # (K,) float64
+        self.sums = sums                          # (U, K) verified sums
+        self.override_targets = override_targets  # (U, K) NaN where no override
+
+    def user_index(self, user_ids):
+        """Row positions for user ids; raises ValueError for unknown ids."""
+        return _positions(self.user_ids, user_ids, "user")
+
+    def kpi_index(self, kpi_ids):
+        """Column positions for KPI ids; raises ValueError for unknown ids."""
+        return _positions(self.kpi_ids, kpi_ids, "KPI")
+
+def _positions(sorted_ids, ids, label):
+    ids = np.asarray(ids, dtype=np.int64)
+    pos = np.searchsorted(sorted_ids, ids)
+    pos = np.minimum(pos, max(len(sorted_ids) - 1, 0))
+    if len(sorted_ids) == 0 or not np.array_equal(sorted_ids[pos], ids):
+        missing = sorted(set(ids.tolist()) - set(sorted_ids.tolist()))
+        raise ValueError(f"Unknown {label} id(s): {missing}")
+    return pos
+
+def load_period_arrays(db: Session, month: int, year: int, role_id: int = None):
+    """Loads users, KPIs, overrides and rolled-up verified sums for one period (4 queries)."""
+    users_query = db.query(models.User.id, models.User.role_id).order_by(models.User.id)
+    kpis_query = db.query(models.KPI.id, models.KPI.role_id, models.KPI.target_value, models.KPI.weightage).order_by(models.KPI.id)
+    if role_id is not None:
+        users_query = users_query.filter(models.User.role_id == role_id)
+        kpis_query = kpis_query.filter(models.KPI.role_id == role_id)
+
+    users = users_query.all()
+    kpis = kpis_query.all()
+
+    user_ids = np.array([u[0] for u in users], dtype=np.int64)
+    user_roles = np.array([-1 if u[1] is None else u[1] for u in users], dtype=np.int64)
+    kpi_ids = np.array([k[0] for k in kpis], dtype=np.int64)
+    kpi_roles = np.array([k[1] for k in kpis], dtype=np.int64)
+    kpi_targets = np.array([k[2] for k in kpis], dtype=np.float64)
+    kpi_weights = np.array([k[3] for k in kpis], dtype=np.float64)
+
+    sums = np.zeros((len(user_ids), len(kpi_ids)), dtype=np.float64)
+    override_targets = np.full((len(user_ids), len(kpi_ids)), np.nan, dtype=np.float64)
+    if len(user_ids) == 0 or len(kpi_ids) == 0:
+        return PeriodArrays(user_ids, user_roles, kpi_ids, kpi_roles, kpi_targets, kpi_weights, sums, override_targets)
+
+    rollups = db.query(
+        models.KPIScoreRollup.user_id, models.KPIScoreRollup.kpi_id, models.KPIScoreRollup.verified_sum
+    ).filter(models.KPIScoreRollup.period == f"{year}-{month:02d}")
+    # Descending id so the oldest override per pair is applied last, matching .first()
+    overrides = db.query(
+        models.KPIOverride.user_id, models.KPIOverride.kpi_id, models.KPIOverride.custom_target_value
+    ).order_by(models.KPIOverride.id.desc())
+    if role_id is not None:
+        rollups = rollups.filter(models.KPIScoreRollup.kpi_id.in_(kpi_ids.tolist()))
+        overrides = overrides.filter(models.KPIOverride.kpi_id.in_(kpi_ids.tolist()))
+
+    for rows, target in ((rollups.all(), sums), (overrides.all(), override_targets)):
+        if not rows:
+            continue
+        data = np.array(rows, dtype=np.float64)
+        rows_pos, cols_pos, values = _scatter_positions(user_ids, kpi_ids, data)
+        target[rows_pos, cols_pos] = values
+
+    return PeriodArrays(user_ids, user_roles, kpi_ids, kpi_roles, kpi_targets, kpi_weights, sums, override_targets)
+
+def _scatter_positions(user_ids, kpi_ids, data):
+    """Maps (user_id, kpi_id, value) rows onto matrix positions, dropping ids outside the snapshot."""
+    uids = data[:, 0].astype(np.int64)
+    kids = data[:, 1].astype(np.int64)
+    upos = np.minimum(np.searchsorted(user_ids, uids), len(user_ids) - 1)
+    kpos = np.minimum(np.searchsorted(kpi_ids, kids), len(kpi_ids) - 1)
+    keep = (user_ids[upos] == uids) & (kpi_ids[kpos] == kids)
+    return upos[keep], kpos[keep], data[keep, 2]
+
+def compute_scores(arrays: PeriodArrays, kpi_targets=None, kpi_weights=None, override_targets=None):
+    """
+    Vectorized calculate_user_kpi_score for every user in the snapshot.
+    KPI columns are accumulated in id order so totals add up in the same
+    order as the scalar implementation.
+    """
+    kpi_targets = arrays.kpi_targets if kpi_targets is None else kpi_targets
+    kpi_weights = arrays.kpi_weights if kpi_weights is None else kpi_weights
+    override_targets = arrays.override_targets if override_targets is None else override_targets
+
+    targets = np.where(np.isnan(override_targets), kpi_targets[np.newaxis, :], override_targets)
+    applies = arrays.user_roles[:, np.newaxis] == arrays.kpi_roles[np.newaxis, :]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        completion = np.where(targets > 0, arrays.sums / targets, 0.0)
+    # Requirement: Cap completion percentage at 1.0 (100%)
+    completion = np.minimum(completion, 1.0)
+    kpi_scores = np.where(applies, completion * kpi_weights[np.newaxis, :], 0.0)
+
+    totals = np.zeros(len(arrays.user_ids), dtype=np.float64)
+    for col in range(kpi_scores.shape[1]):
+        totals += kpi_scores[:, col]
+    return np.round(totals, 2)
+
+def classify_scores(rules: score_rules.CompiledRules, user_roles, scores):
+    """Label index (see score_rules.LABELS) per score under each user's role rules."""
+    return rules.classify_scores(user_roles, scores)
+
+def _band_label(label: int):
+    return score_rules.label_name(score_rules.LABELS[label])
+
+def _band_counts(labels):
+    counts = np.bincount(labels, minlength=len(score_rules.LABELS))
+    return {_band_label(i): int(c) for i, c in enumerate(counts)}
+
+def _histogram(scores):
+    counts, _ = np.histogram(scores, bins=HISTOGRAM_EDGES)
+    return [
+        {"from": float(lo), "to": float(hi), "count": int(c)}
+        for lo, hi, c in zip(HISTOGRAM_EDGES[:-1], HISTOGRAM_EDGES[1:], counts)
+    ]
+
+def _summary(scores):
+    if len(scores) == 0:
+        return {"mean": 0.0, "median": 0.0, "min": 0.0, "max": 0.0}
+    return {
+        "mean": round(float(scores.mean()), 2),
+        "median": round(float(np.median(scores)), 2),
+        "min": float(scores.min()),
+        "max": float(scores.max()),
+    }
+
+def run_simulation(arrays: PeriodArrays, rules: score_rules.CompiledRules, kpi_changes=(), overrides=(),
+                   max_changed_users: int = 500):
+    """
+    Applies proposed KPI target/weightage changes and extra overrides to a
+    copy of the snapshot and compares the outcome with the current state.
+    Recommendations use each role's score bands (automation.rule_cache);
+    only this period is simulated, so multi-period rules do not apply.
+    kpi_changes: iterable of (kpi_id, target_value or None, weightage or None)
+    overrides: iterable of (user_id, kpi_id, custom_target_value)
+    """
+    kpi_targets = arrays.kpi_targets.copy()
+    kpi_weights = arrays.kpi_weights.copy()
+    override_targets = arrays.override_targets.copy()
+
+    for kpi_id, target_value, weightage in kpi_changes:
+        col = arrays.kpi_index([kpi_id])[0]
+        if target_value is not None:
+            kpi_targets[col] = target_value
+        if weightage is not None:
+            kpi_weights[col] = weightage
+
+    overrides = list(overrides)
+    if overrides:
+        data = np.array(overrides, dtype=np.float64)
+        rows = arrays.user_index(data[:, 0].astype(np.int64))
+        cols = arrays.kpi_index(data[:, 1].astype(np.int64))
+        override_targets[rows, cols] = data[:, 2]
+
+    baseline = compute_scores(arrays)
+    proposed = compute_scores(arrays, kpi_targets, kpi_weights, override_targets)
+    baseline_bands = classify_scores(rules, arrays.user_roles, baseline)
+    proposed_bands = classify_scores(rules, arrays.user_roles, proposed)
+
+    changed = np.flatnonzero(baseline_bands != proposed_bands)
+    return {
+        "total_users": int(len(arrays.user_ids)),
+        "baseline": {
+            "summary": _summary(baseline),
+            "histogram": _histogram(baseline),
+            "recommendations": _band_counts(baseline_bands),
+        },
+        "proposed": {
+            "summary": _summary(proposed),
+            "histogram": _histogram(proposed),
+            "recommendations": _band_counts(proposed_bands),
+        },
+        "changed_users_count": int(len(changed)),
+        "changed_users": [{
+            "user_id": int(arrays.user_ids[i]),
+            "baseline_score": float(baseline[i]),
+            "proposed_score": float(proposed[i]),
+            "baseline_recommendation": _band_label(baseline_bands[i]),
+            "proposed_recommendation": _band_label(proposed_bands[i]),
+        } for i in changed[:max_changed_users]],
+    }
@@ -377,31 +377,62 @@ def decision_setup_page():
     
     # View existing recommendations
     st.subheader("Current Recommendations")
-    resp = requests.get(f"{API_BASE}/admin/recommendations", headers=api_headers())
-    if resp.status_code == 200:
-        recommendations = resp.json()
-        if recommendations:
-            import pandas as pd
-            # Get user names
-            users_resp = requests.get(f"{API_BASE}/users/", headers=api_headers())
-            users_dict = {}
-            if users_resp.status_code == 200:
-                users_dict = {u.get('id'): u.get('full_name', 'Unknown') for u in users_resp.json()}
-            
-            df_data = []
-            for rec in recommendations:
-                user_id = rec.get("user_id")
-                df_data.append({
-                    "User": users_dict.get(user_id, f"User {user_id}"),
-                    "Score": rec.get("score_achieved"),
-                    "Recommendation": rec.get("recommendation"),
-                    "Period": rec.get("period"),
-                    "Created": rec.get("created_at", "")[:10] if rec.get("created_at") else ""
-                })
-            df = pd.DataFrame(df_data)
-            st.dataframe(df, use_container_width=True)
-        else:
-            st.info("No recommendations generated yet")
+    with st.form("recommendation_filters"):
+        f1, f2, f3 = st.columns(3)
+        with f1:
+            period = st.text_input("Period (YYYY-MM, blank = all)")
+        with f2:
+            rec_type = st.selectbox("Recommendation", ["All", "BONUS", "PROMOTION", "WARNING", "FINAL_WARNING", "TERMINATION"])
+        with f3:
+            filter_user_id = st.number_input("User ID (0 = any)", min_value=0, step=1)
+        apply_filters = st.form_submit_button("Search")
+
+    filters = {"limit": 100}
+    if period.strip():
+        filters["period"] = period.strip()
+    if rec_type != "All":
+        filters["recommendation"] = rec_type
+    if filter_user_id:
+        filters["user_id"] = int(filter_user_id)
+
+    def fetch_recommendations(params, cursor=None):
+        resp = requests.get(
+            f"{API_BASE}/admin/recommendations",
+            headers=api_headers(),
+            params={**params, "cursor": cursor} if cursor else params
+        )
+        if resp.status_code != 200:
+            st.error(api_error(resp))
+            return [], None
+        data = resp.json()
+        return data["items"], data["next_cursor"]
+
+    # Rows accumulate across "Load more" clicks until the filters change
+    if apply_filters or st.session_state.get("rec_filters") != filters:
+        st.session_state.rec_filters = filters
+        st.session_state.rec_rows, st.session_state.rec_cursor = fetch_recommendations(filters)
+
+    if st.session_state.rec_rows:
+        st.dataframe(
+            [{
+                "User": rec["user_name"] or f"User {rec['user_id']}",
+                "Score": rec["score_achieved"],
+                "Recommendation": rec["recommendation"],
+                "Period": rec["period"],
+                "Created": (rec["created_at"] or "")[:10]
+            } for rec in st.session_state.rec_rows],
+            use_container_width=True,
+            hide_index=True
+        )
+        st.caption(f"Showing {len(st.session_state.rec_rows)} recommendations")
+    else:
+        st.info("No recommendations match these filters")
+
+    if st.session_state.rec_cursor and st.button("Load more"):
+        rows, cursor = fetch_recommendations(filters, st.session_state.rec_cursor)
+        st.session_state.rec_rows += rows
+        st.session_state.rec_cursor = cursor
+        st.rerun()
     
     st.divider()
     st.subheader("Run Evaluation")
@@ -434,6 +465,7 @@ def decision_setup_page():
                             st.success(result["message"])
                         else:
                             st.success(f"Recommendation generated: {result.get('recommendation')}")
+                        st.session_state.pop("rec_filters", None) # Refetch the listing
                         st.rerun()
                     else:
                         st.error(api_error(resp))